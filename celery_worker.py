@@ -1,5 +1,12 @@
-from main import celery, create_app
+import os
+
+# The web app (or `flask --app semsapp init-db`) creates the schema, not every worker
+os.environ.setdefault('SEMS_SCHEMA_AUTO_CREATE', '0')
+
+from main import create_app
 
 # Create a Flask app instance for the Celery worker
 app = create_app()
-app.app_context().push()  # Push an application context
\ No newline at end of file
+app.app_context().push()  # Push an application context
+
+from main import celery  # Built and configured from the app on first access
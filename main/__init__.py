@@ -1,19 +1,57 @@
+import os
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from secretconfig import SECRET_KEY
 from flask_socketio import SocketIO
 from flask_session import Session  # Import Flask-Session
-from celery import Celery
+from main.emitter import RoomEmitter
+from main.journal import ReadingJournal
+from main.ingest_queue import IngestQueue
+from main.sequence import SequenceTracker
+from main.ingest_workers import IngestWorkerPool
+from main.passwords import PasswordHasher
+from main.anomaly import AnomalyDetector
+from main.scheduler import SolarScheduler
 
 # Initialize extensions at module level
 socketio = SocketIO()
+emitter = RoomEmitter(socketio)  # Coalesces dashboard updates into rate-limited frames per room
+journal = ReadingJournal(socketio)  # Optional durable ingest journal, off unless JOURNAL_DIR is set
+ingest_queue = IngestQueue(socketio)  # Bounded queue in front of the ingest writes
+sequence_marks = SequenceTracker()  # Per-device high-water marks for duplicate readings
+ingest_workers = IngestWorkerPool()  # Optional ingest processes, each owning a set of devices
+password_hasher = PasswordHasher()  # Process pool for password hashing, off the request threads
+anomaly_detector = AnomalyDetector()  # Online battery/solar anomaly detection for maintenance alerts
+solar_scheduler = SolarScheduler(socketio)  # On-windows for deferrable appliances from each device's solar profile
 db = SQLAlchemy()  # Single SQLAlchemy instance for multiple databases
-celery = Celery()  # Initialize Celery at module level
+_celery = None  # Built on first access of main.celery, see __getattr__
+_celery_app = None  # App the Celery instance is configured from
+
+def __getattr__(name):
+    """
+    Build `main.celery` on first use. Setting Celery up takes longer than the rest of
+    create_app, and only celery_worker.py and task callers need it.
+    """
+    global _celery
+    if name == 'celery':
+        if _celery is None:
+            from celery import Celery
+            _celery = Celery()
+            if _celery_app is not None:
+                make_celery(_celery_app)
+        return _celery
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def make_celery(app):
     """
     Configure Celery with the app's configuration
     """
+    global _celery_app
+    _celery_app = app
+    if _celery is None:
+        return None  # Configured when main.celery is first used
+
+    celery = _celery
     celery.conf.update(app.config)
     
     class ContextTask(celery.Task):
@@ -24,12 +62,53 @@ def make_celery(app):
     celery.Task = ContextTask
     return celery
 
+def make_client_manager(url, channel='flask-socketio', write_only=False):
+    """
+    Build the Socket.IO client manager that fans emits out through a message queue,
+    so every worker process delivers events to the clients connected to it.
+
+    Supported URLs:
+        redis://host:port/db     - Redis pub/sub (production)
+        memory://                - in-process Kombu queue (tests, single process)
+        filesystem:///some/dir   - Kombu filesystem transport shared by local processes
+        anything else            - passed to Kombu as-is (amqp://, ...)
+    """
+    import socketio as python_socketio
+
+    if url.startswith(('redis://', 'rediss://')):
+        return python_socketio.RedisManager(url, channel=channel, write_only=write_only)
+
+    if url.startswith('filesystem://'):
+        # Kombu expects the folder in transport options, not in the URL
+        folder = url[len('filesystem://'):] or os.path.join(os.getcwd(), 'socketio_queue')
+        os.makedirs(folder, exist_ok=True)
+        return python_socketio.KombuManager(
+            'filesystem://',
+            channel=channel,
+            write_only=write_only,
+            connection_options={'transport_options': {
+                'data_folder_in': folder,
+                'data_folder_out': folder,
+            }}
+        )
+
+    return python_socketio.KombuManager(url, channel=channel, write_only=write_only)
+
 def create_app():
+    from main.shards import realtime_binds, init_shards
+    from main.session_store import make_session_interface
+    from main.user_cache import init_user_cache
+    from main.assets import init_assets
+
     app = Flask(__name__, template_folder='templates')
 
-    # Configure multiple database bindings
+    # Configure multiple database bindings - the realtime store is split into
+    # REALTIME_SHARDS files by device (see main/shards.py); one per ingest worker by default
+    app.config['REALTIME_SHARDS'] = int(
+        os.environ.get('SEMS_REALTIME_SHARDS') or max(1, int(os.environ.get('SEMS_INGEST_WORKERS') or 0))
+    )
     app.config['SQLALCHEMY_BINDS'] = {
-        'realtime': 'sqlite:///realtime_data.db',
+        **realtime_binds(app.config['REALTIME_SHARDS']),
         'auth': 'sqlite:///auth.db',
         'logs': 'sqlite:///logs.db'
     }
@@ -38,6 +117,107 @@ def create_app():
     app.secret_key = SECRET_KEY
     app.config['SESSION_TYPE'] = 'filesystem'  # Store sessions on the server
     app.config['SESSION_PERMANENT'] = True  # Ensure sessions persist
+    # Session storage: memory, sqlite or filesystem (see main/session_store.py)
+    app.config['SESSION_BACKEND'] = os.environ.get('SEMS_SESSION_BACKEND', 'filesystem')
+    app.config['SESSION_CACHE_SIZE'] = int(os.environ.get('SEMS_SESSION_CACHE_SIZE', 10000))
+    app.config['SESSION_SQLITE_PATH'] = os.environ.get(
+        'SEMS_SESSION_SQLITE_PATH', os.path.join(app.root_path, 'sessions.db')
+    )
+    app.config['SESSION_WRITE_BEHIND_INTERVAL'] = float(os.environ.get('SEMS_SESSION_WRITE_BEHIND_INTERVAL', 1.0))
+    app.config['SESSION_REFRESH_EACH_REQUEST'] = False  # Don't rewrite unchanged sessions on every poll
+
+    # Logged-in users are cached for Flask-Login instead of loaded from auth.db per request
+    app.config['USER_CACHE_SIZE'] = int(os.environ.get('SEMS_USER_CACHE_SIZE', 1000))
+    app.config['USER_CACHE_TTL'] = int(os.environ.get('SEMS_USER_CACHE_TTL', 300))
+    # Lifetime of the signed token a dashboard connects its socket with (checked at connect only)
+    app.config['SOCKET_TOKEN_TTL'] = int(os.environ.get('SEMS_SOCKET_TOKEN_TTL', 600))
+
+    # Password hashing pool - logins beyond QUEUE_SIZE waiting hashes get a 503
+    app.config['PASSWORD_WORKERS'] = int(os.environ.get('SEMS_PASSWORD_WORKERS', 2))
+    app.config['PASSWORD_QUEUE_SIZE'] = int(os.environ.get('SEMS_PASSWORD_QUEUE_SIZE', 16))
+    app.config['PASSWORD_QUEUE_TIMEOUT'] = float(os.environ.get('SEMS_PASSWORD_QUEUE_TIMEOUT', 2))
+    app.config['PASSWORD_TIMEOUT'] = float(os.environ.get('SEMS_PASSWORD_TIMEOUT', 10))
+
+    # Socket.IO message queue - leave unset for a single process, set it to run several workers
+    app.config['SOCKETIO_MESSAGE_QUEUE'] = os.environ.get('SEMS_SOCKETIO_MESSAGE_QUEUE')
+    app.config['SOCKETIO_CHANNEL'] = os.environ.get('SEMS_SOCKETIO_CHANNEL', 'sems-socketio')
+    app.config['SOCKETIO_COALESCE_WINDOW'] = float(os.environ.get('SEMS_SOCKETIO_COALESCE_WINDOW', 0.25))
+    app.config['SOCKETIO_MIN_FRAME_INTERVAL'] = float(os.environ.get('SEMS_SOCKETIO_MIN_FRAME_INTERVAL', 1.0))
+    app.config['SOCKETIO_WRITE_ONLY'] = os.environ.get('SEMS_SOCKETIO_WRITE_ONLY') == '1'  # Emit-only processes
+    # None picks eventlet when installed; the ASGI app forces 'threading', as nothing there runs greenthreads
+    app.config['SOCKETIO_ASYNC_MODE'] = os.environ.get('SEMS_SOCKETIO_ASYNC_MODE') or None
+
+    # Streaming ingest - devices listed here are read from the simulator's stream
+    # instead of each dashboard tab polling /sems_in/save_simulated_data
+    app.config['STREAM_DEVICE_IDS'] = [d for d in os.environ.get('SEMS_STREAM_DEVICE_IDS', '').split(',') if d]
+    app.config['STREAM_INTERVAL'] = float(os.environ.get('SEMS_STREAM_INTERVAL', 3))
+
+    # Ingest journal - with a directory set, readings are appended to an on-disk journal
+    # and bulk loaded into RealTimeData by a background loader
+    app.config['JOURNAL_DIR'] = os.environ.get('SEMS_JOURNAL_DIR')
+    app.config['JOURNAL_FSYNC_INTERVAL'] = float(os.environ.get('SEMS_JOURNAL_FSYNC_INTERVAL', 0.05))
+    app.config['JOURNAL_LOAD_INTERVAL'] = float(os.environ.get('SEMS_JOURNAL_LOAD_INTERVAL', 1.0))
+    app.config['JOURNAL_BATCH_SIZE'] = int(os.environ.get('SEMS_JOURNAL_BATCH_SIZE', 1000))
+    app.config['JOURNAL_SEGMENT_RECORDS'] = int(os.environ.get('SEMS_JOURNAL_SEGMENT_RECORDS', 10000))
+
+    # Ingest queue - off by default (0): readings are stored in the request, which answers 200
+    # with the data. With DEPTH > 0 one background worker stores them and the request answers
+    # 202; when more than DEPTH are waiting the policy (drop_oldest, coalesce or reject) sheds.
+    app.config['INGEST_QUEUE_DEPTH'] = int(os.environ.get('SEMS_INGEST_QUEUE_DEPTH', 0))
+    app.config['INGEST_QUEUE_POLICY'] = os.environ.get('SEMS_INGEST_QUEUE_POLICY', 'drop_oldest')
+    app.config['INGEST_RETRY_AFTER'] = int(os.environ.get('SEMS_INGEST_RETRY_AFTER', 3))
+
+    # Duplicate suppression - sequence high-water marks survive restarts through this file
+    app.config['SEQUENCE_CHECKPOINT_FILE'] = os.environ.get(
+        'SEMS_SEQUENCE_CHECKPOINT_FILE', os.path.join(app.root_path, 'sequence_marks.json')
+    )
+    app.config['SEQUENCE_CHECKPOINT_INTERVAL'] = float(os.environ.get('SEMS_SEQUENCE_CHECKPOINT_INTERVAL', 5))
+
+    # Ingest worker processes - readings are stored by INGEST_WORKERS processes, each device
+    # always by the same one (see main/ingest_workers.py). 0 stores them in this process.
+    app.config['INGEST_WORKERS'] = int(os.environ.get('SEMS_INGEST_WORKERS', 0))
+
+    # Maintenance alerts - streaming anomaly detection on battery drain and solar output
+    # (see main/anomaly.py); THRESHOLD is in standard deviations, COOLDOWN in seconds,
+    # DRAIN_LIMIT in battery units per hour (7200 is 6 per 3 s reading, above the simulator's
+    # normal steps) and SOLAR_DROP a fraction of the expected output
+    app.config['ANOMALY_DETECTION'] = os.environ.get('SEMS_ANOMALY_DETECTION', '1') == '1'
+    app.config['ANOMALY_ALPHA'] = float(os.environ.get('SEMS_ANOMALY_ALPHA', 0.1))
+    app.config['ANOMALY_THRESHOLD'] = float(os.environ.get('SEMS_ANOMALY_THRESHOLD', 4.0))
+    app.config['ANOMALY_WARMUP'] = int(os.environ.get('SEMS_ANOMALY_WARMUP', 20))
+    app.config['ANOMALY_COOLDOWN'] = float(os.environ.get('SEMS_ANOMALY_COOLDOWN', 300))
+    app.config['ANOMALY_DRAIN_PER_KW'] = float(os.environ.get('SEMS_ANOMALY_DRAIN_PER_KW', 50))
+    app.config['ANOMALY_DRAIN_LIMIT'] = float(os.environ.get('SEMS_ANOMALY_DRAIN_LIMIT', 7200))
+    app.config['ANOMALY_SOLAR_DROP'] = float(os.environ.get('SEMS_ANOMALY_SOLAR_DROP', 0.3))
+    app.config['ANOMALY_SOLAR_DROP_MIN'] = float(os.environ.get('SEMS_ANOMALY_SOLAR_DROP_MIN', 50))
+    app.config['ANOMALY_BATTERY_FULL'] = float(os.environ.get('SEMS_ANOMALY_BATTERY_FULL', 1000))
+    app.config['ANOMALY_MIN_ELAPSED'] = float(os.environ.get('SEMS_ANOMALY_MIN_ELAPSED', 1.0))
+
+    # Smart scheduling - sound system and TV windows moved to each device's sunniest counters
+    # (see main/scheduler.py); SLOTS is the controller's counter_max, INTERVAL seconds between passes
+    app.config['SCHEDULER_ENABLED'] = os.environ.get('SEMS_SCHEDULER_ENABLED', '1') == '1'
+    app.config['SCHEDULER_SLOTS'] = int(os.environ.get('SEMS_SCHEDULER_SLOTS', 70))
+    app.config['SCHEDULER_ALPHA'] = float(os.environ.get('SEMS_SCHEDULER_ALPHA', 0.3))
+    app.config['SCHEDULER_INTERVAL'] = float(os.environ.get('SEMS_SCHEDULER_INTERVAL', 60))
+
+    # Appliance state-change events are kept this many days (see main/events.py); 0 keeps them all
+    app.config['EVENT_RETENTION_DAYS'] = float(os.environ.get('SEMS_EVENT_RETENTION_DAYS', 90))
+
+    # ETags on the dashboard read endpoints, from per-device write counters (see main/versions.py).
+    # The counters only see this process's writes, so they are off whenever other processes can
+    # write the same data: ingest workers, or several instances sharing a message queue.
+    app.config['READ_ETAGS'] = (
+        os.environ.get('SEMS_READ_ETAGS', '1') == '1'
+        and app.config['INGEST_WORKERS'] == 0
+        and not app.config['SOCKETIO_MESSAGE_QUEUE']
+    )
+
+    # Schema creation - on by default; set SEMS_SCHEMA_AUTO_CREATE=0 to skip the DDL at every
+    # process start and create the tables once per deploy with `flask --app semsapp init-db`
+    app.config['SCHEMA_AUTO_CREATE'] = os.environ.get('SEMS_SCHEMA_AUTO_CREATE', '1') == '1'
+
+    # Built static assets (flask --app semsapp build-assets); templates fall back to /static without them
+    app.config['ASSET_DIST_DIR'] = os.environ.get('SEMS_ASSET_DIST_DIR', os.path.join(app.root_path, 'static_dist'))
 
     # Celery configuration
     app.config.update(
@@ -48,28 +228,43 @@ def create_app():
     
     # Initialize extensions with the app
     Session(app)  # Initialize session management
+    app.session_interface = make_session_interface(app, socketio)
     db.init_app(app)  # Initialize SQLAlchemy
-    socketio.init_app(app)  # Initialize SocketIO
+    init_user_cache(app)
+    password_hasher.init_app(app)
+    init_assets(app)
+    init_shards(app)
+    if app.config['SOCKETIO_MESSAGE_QUEUE']:
+        # Emits go through the queue so they reach clients connected to any worker
+        socketio.init_app(app, async_mode=app.config['SOCKETIO_ASYNC_MODE'], client_manager=make_client_manager(
+            app.config['SOCKETIO_MESSAGE_QUEUE'],
+            channel=app.config['SOCKETIO_CHANNEL'],
+            write_only=app.config['SOCKETIO_WRITE_ONLY']
+        ))
+    else:
+        socketio.init_app(app, async_mode=app.config['SOCKETIO_ASYNC_MODE'])  # Initialize SocketIO
+    emitter.init_app(app, socketio)
+    journal.init_app(app, socketio)
+    ingest_queue.init_app(app, socketio)
+    sequence_marks.init_app(app)
+    ingest_workers.init_app(app)
+    anomaly_detector.init_app(app)
+    solar_scheduler.init_app(app, socketio)
     
-    # Configure Celery with the app
+    # Configure Celery with the app (deferred until main.celery is used)
     make_celery(app)
 
     # Register blueprint for data routes
-    from main.sockets import sems
+    from main.sockets import sems, register_listeners
     app.register_blueprint(sems, url_prefix="/sems_in")
+    register_listeners()
+
+    # Flask CLI commands (flask --app semsapp provision-users, init-db, build-assets ...)
+    from main.cli import register_commands, create_schema
+    register_commands(app)
 
-    # Create tables for each bind
-    with app.app_context():
-        from main.models import User, RealTimeData, Logs, TotalConsumption, AggregateData
-
-        engine_realtime = db.get_engine(app, bind='realtime')
-        engine_auth = db.get_engine(app, bind='auth')
-        engine_logs = db.get_engine(app, bind='logs')
-        
-        User.metadata.create_all(engine_auth)
-        RealTimeData.metadata.create_all(engine_realtime)
-        TotalConsumption.metadata.create_all(engine_realtime)
-        AggregateData.metadata.create_all(engine_realtime)
-        Logs.metadata.create_all(engine_logs)
+    # Engines are opened on first use; with SCHEMA_AUTO_CREATE off none is opened here
+    if app.config['SCHEMA_AUTO_CREATE']:
+        create_schema(app)
     
     return app
\ No newline at end of file
@@ -0,0 +1,183 @@
+"""
+Fingerprinted, precompressed static assets.
+
+`flask --app semsapp build-assets` copies main/static into ASSET_DIST_DIR with a content
+hash in every file name (css/semstyles.3b1f0c9a2d4e.css), minifies JS and CSS, writes
+.gz and .br next to text assets and smaller variants of large images, and records it
+all in manifest.json. Templates link assets through asset_url(), which points at the
+hashed file when a build exists and at plain /static otherwise, so development needs
+no build step. Hashed files never change, so they are served with immutable caching.
+
+Optional packages: rjsmin and rcssmin (minifying), brotli (.br files) and Pillow
+(image variants). Each step is skipped when its package is missing.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+from flask import Blueprint, current_app, request, send_from_directory, url_for
+
+MINIFIABLE = ('.js', '.mjs', '.css')
+COMPRESSIBLE = ('.js', '.mjs', '.css', '.svg', '.json', '.txt')
+RESIZABLE = ('.jpg', '.jpeg', '.png', '.webp', '.avif')
+IMAGE_WIDTHS = (480, 960, 1600)  # Variants are only made for widths below the original's
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))  # Preferred first
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+mimetypes.add_type('text/javascript', '.mjs')  # Not known to every Python version
+
+assets = Blueprint('assets', __name__)
+
+
+def _minify(path, data):
+    """Minified text of a JS or CSS file, unchanged when the minifier isn't installed."""
+    try:
+        if path.endswith('.css'):
+            import rcssmin
+            return rcssmin.cssmin(data.decode('utf-8')).encode('utf-8')
+        import rjsmin
+        return rjsmin.jsmin(data.decode('utf-8')).encode('utf-8')
+    except ImportError:
+        return data
+
+
+def _hashed_name(path, data):
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+
+
+def _write(dist_dir, name, data):
+    target = os.path.join(dist_dir, name)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, 'wb') as f:
+        f.write(data)
+
+
+def _compress(dist_dir, name, data):
+    """Write .gz (and .br with brotli installed) beside a text asset; returns the encodings written."""
+    encodings = []
+    _write(dist_dir, name + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+    encodings.append('gzip')
+    try:
+        import brotli
+    except ImportError:
+        return encodings
+    _write(dist_dir, name + '.br', brotli.compress(data, quality=11))
+    encodings.append('br')
+    return encodings
+
+
+def _image_variants(dist_dir, path, hashed):
+    """Resized copies of an image, {width: file}; empty without Pillow or for unreadable formats."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return {}
+
+    variants = {}
+    try:
+        with Image.open(os.path.join(dist_dir, hashed)) as image:
+            for width in IMAGE_WIDTHS:
+                if width >= image.width:
+                    break
+                height = round(image.height * width / image.width)
+                stem, ext = os.path.splitext(hashed)
+                name = f"{stem}.w{width}{ext}"
+                target = os.path.join(dist_dir, name)
+                image.resize((width, height), Image.LANCZOS).save(target, optimize=True)
+                if os.path.getsize(target) >= os.path.getsize(os.path.join(dist_dir, hashed)):
+                    os.remove(target)  # Re-encoding made it no smaller, the original will do
+                    continue
+                variants[str(width)] = name
+    except (OSError, ValueError, KeyError) as e:
+        print(f"⚠️ No variants for {path}: {e}")
+    return variants
+
+
+def build_assets(static_dir, dist_dir):
+    """Build dist_dir from static_dir and write its manifest. Returns the manifest."""
+    shutil.rmtree(dist_dir, ignore_errors=True)
+    os.makedirs(dist_dir)
+
+    manifest = {}
+    for folder, _, files in os.walk(static_dir):
+        for file in sorted(files):
+            source = os.path.join(folder, file)
+            path = os.path.relpath(source, static_dir).replace(os.sep, '/')
+            ext = os.path.splitext(file)[1].lower()
+
+            with open(source, 'rb') as f:
+                data = f.read()
+            if ext in MINIFIABLE:
+                data = _minify(path, data)
+
+            hashed = _hashed_name(path, data)
+            _write(dist_dir, hashed, data)
+            entry = {"file": hashed, "size": len(data)}
+            if ext in COMPRESSIBLE:
+                entry["encodings"] = _compress(dist_dir, hashed, data)
+            if ext in RESIZABLE:
+                entry["variants"] = _image_variants(dist_dir, path, hashed)
+            manifest[path] = entry
+
+    with open(os.path.join(dist_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(app):
+    """Read the build's manifest into app.extensions; no build means plain /static URLs."""
+    path = os.path.join(app.config['ASSET_DIST_DIR'], 'manifest.json')
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        manifest = {}
+    app.extensions['asset_manifest'] = manifest
+    return manifest
+
+
+def asset_url(filename, width=None):
+    """
+    URL of a static file: its fingerprinted build when there is one, /static otherwise.
+    With `width`, the smallest image variant at least that wide (or the original).
+    """
+    entry = current_app.extensions.get('asset_manifest', {}).get(filename)
+    if entry is None:
+        return url_for('static', filename=filename)
+
+    name = entry["file"]
+    if width is not None:
+        wide_enough = [int(w) for w in entry.get("variants", {}) if int(w) >= width]
+        if wide_enough:
+            name = entry["variants"][str(min(wide_enough))]
+    return url_for('assets.serve', filename=name)
+
+
+@assets.route('/assets/<path:filename>')
+def serve(filename):
+    """Serve a built asset, precompressed when the client accepts it, cached for good."""
+    dist_dir = current_app.config['ASSET_DIST_DIR']
+    accepted = request.headers.get('Accept-Encoding', '')
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    for encoding, suffix in ENCODINGS:
+        if encoding in accepted and os.path.isfile(os.path.join(dist_dir, filename + suffix)):
+            response = send_from_directory(dist_dir, filename + suffix, mimetype=mimetype, max_age=31536000)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(dist_dir, filename, mimetype=mimetype, max_age=31536000)
+
+    response.headers['Cache-Control'] = IMMUTABLE
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_assets(app):
+    app.register_blueprint(assets)
+    app.add_template_global(asset_url)
+    load_manifest(app)
@@ -0,0 +1,154 @@
+import atexit
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Thread-safe in-process cache with a size bound and per-entry expiry.
+
+    Follows the cachelib get/set/delete interface, so it can stand in for the caches
+    Flask-Session uses. timeout=0 means the entry never expires.
+    """
+
+    def __init__(self, maxsize=10000, default_timeout=300):
+        self.maxsize = maxsize
+        self.default_timeout = default_timeout
+        self.items = OrderedDict()  # key -> (expires at, monotonic, or None; value), least recent first
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key):
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                self.stats["misses"] += 1
+                return None
+            expires, value = item
+            if expires is not None and expires < time.monotonic():
+                del self.items[key]
+                self.stats["misses"] += 1
+                return None
+            self.items.move_to_end(key)
+            self.stats["hits"] += 1
+            return value
+
+    def set(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = self.default_timeout
+        expires = time.monotonic() + timeout if timeout else None
+
+        with self.lock:
+            self.items[key] = (expires, value)
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+                self.stats["evictions"] += 1
+        return True
+
+    def delete(self, key):
+        with self.lock:
+            return self.items.pop(key, None) is not None
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+        return True
+
+
+class WriteBehindCache:
+    """
+    LRUCache in front of a SQLite table, written in the background.
+
+    Reads are served from memory and fall back to SQLite for entries evicted or written
+    before a restart. Writes and deletes only touch memory and are flushed to SQLite every
+    `interval` seconds in one transaction; a crash loses at most that interval of writes.
+    """
+
+    def __init__(self, path, socketio, maxsize=10000, default_timeout=300, interval=1.0):
+        self.path = path
+        self.socketio = socketio  # runs the flusher as a background task
+        self.memory = LRUCache(maxsize, default_timeout)
+        self.default_timeout = default_timeout
+        self.interval = interval
+        self.pending = {}  # key -> (expires at, epoch seconds or None; pickled value), None to delete
+        self.lock = threading.Lock()
+        self.flusher_running = False
+
+        with sqlite3.connect(self.path) as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)"
+            )
+        atexit.register(self.flush)
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+
+        with self.lock:
+            unflushed = key in self.pending
+            entry = self.pending.get(key)
+        if unflushed:
+            # Deleted, or evicted from memory before its write was flushed
+            row = (entry[1], entry[0]) if entry is not None else None
+        else:
+            with sqlite3.connect(self.path) as connection:
+                row = connection.execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return None
+
+        value = pickle.loads(row[0])
+        self.memory.set(key, value, row[1] - time.time() if row[1] is not None else 0)
+        return value
+
+    def set(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = self.default_timeout
+        self.memory.set(key, value, timeout)
+        self._queue(key, (time.time() + timeout if timeout else None, pickle.dumps(value)))
+        return True
+
+    def delete(self, key):
+        self.memory.delete(key)
+        self._queue(key, None)
+        return True
+
+    def _queue(self, key, entry):
+        with self.lock:
+            self.pending[key] = entry
+            start_flusher = not self.flusher_running
+            self.flusher_running = True
+        if start_flusher:
+            self.socketio.start_background_task(self._flush_loop)
+
+    def _flush_loop(self):
+        """Flush every interval until nothing is left to write."""
+        while True:
+            self.socketio.sleep(self.interval)
+            self.flush()
+            with self.lock:
+                if not self.pending:
+                    self.flusher_running = False
+                    return
+
+    def flush(self):
+        """Write pending entries to SQLite in one transaction and drop expired rows."""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return
+
+        with sqlite3.connect(self.path) as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+                [(key, entry[1], entry[0]) for key, entry in pending.items() if entry is not None]
+            )
+            connection.executemany(
+                "DELETE FROM cache WHERE key = ?",
+                [(key,) for key, entry in pending.items() if entry is None]
+            )
+            connection.execute("DELETE FROM cache WHERE expires < ?", (time.time(),))
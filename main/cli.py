@@ -0,0 +1,175 @@
+import csv
+import json
+import os
+import secrets
+import subprocess
+import sys
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from . import db, password_hasher
+from .models import User, RealTimeData, DeviceEvent, TotalConsumption, AggregateData
+from .shards import shard_binds
+from .assets import build_assets, load_manifest
+from .events import prune_events
+
+
+def register_commands(app):
+    app.cli.add_command(init_db)
+    app.cli.add_command(provision_users)
+    app.cli.add_command(startup_benchmark)
+    app.cli.add_command(build_assets_command)
+    app.cli.add_command(prune_events_command)
+
+
+def create_schema(app):
+    """Create missing tables on every bind: auth, logs and each realtime shard."""
+    with app.app_context():
+        engine_auth = db.get_engine(app, bind='auth')
+        engine_logs = db.get_engine(app, bind='logs')
+
+        User.metadata.create_all(engine_auth)
+        for bind in shard_binds(app):
+            engine_realtime = db.get_engine(app, bind=bind)
+            RealTimeData.metadata.create_all(engine_realtime)
+            TotalConsumption.metadata.create_all(engine_realtime)
+            AggregateData.metadata.create_all(engine_realtime)
+        DeviceEvent.metadata.create_all(engine_logs)
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db():
+    """Create the database schema; run once per deploy when SEMS_SCHEMA_AUTO_CREATE=0."""
+    create_schema(current_app)
+    click.echo("✅ Schema created")
+
+
+@click.command('provision-users')
+@click.argument('csv_path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=500, show_default=True, help='Users inserted per transaction.')
+@click.option('--output', type=click.Path(dir_okay=False),
+              help='Write username,password for generated passwords to this CSV.')
+@with_appcontext
+def provision_users(csv_path, batch_size, output):
+    """
+    Register users in bulk from a CSV with device_id,email,username[,password] columns.
+
+    Passwords are hashed in parallel in the password pool and users are inserted in
+    batches. Rows without a password get a random one (see --output). Usernames and
+    emails that already exist are skipped.
+    """
+    with open(csv_path, newline='') as f:
+        rows = list(csv.DictReader(f))
+
+    missing = {'device_id', 'email', 'username'} - set(rows[0] if rows else {})
+    if missing:
+        raise click.ClickException(f"Missing CSV columns: {', '.join(sorted(missing))}")
+
+    existing_usernames = {username for (username,) in db.session.query(User.username)}
+    existing_emails = {email for (email,) in db.session.query(User.email)}
+
+    users, generated, skipped = [], [], 0
+    for row in rows:
+        if not all(row.get(field) for field in ('device_id', 'email', 'username')):
+            skipped += 1
+            continue
+        if row['username'] in existing_usernames or row['email'] in existing_emails:
+            skipped += 1
+            continue
+        existing_usernames.add(row['username'])
+        existing_emails.add(row['email'])
+
+        password = row.get('password')
+        if not password:
+            password = secrets.token_urlsafe(12)
+            generated.append((row['username'], password))
+        users.append((row, password))
+
+    if generated and not output:
+        raise click.ClickException(f"{len(generated)} rows have no password; pass --output to record the generated ones")
+
+    click.echo(f"Hashing {len(users)} passwords on {password_hasher.workers} processes...")
+    hashes = password_hasher.hash_many([password for _, password in users])
+
+    table = User.__table__
+    for start in range(0, len(users), batch_size):
+        batch = [
+            {"device_id": row['device_id'], "email": row['email'], "username": row['username'], "password": pwhash}
+            for (row, _), pwhash in zip(users[start:start + batch_size], hashes[start:start + batch_size])
+        ]
+        db.session.execute(table.insert(), batch)
+        db.session.commit()
+        click.echo(f"Inserted {start + len(batch)}/{len(users)}")
+
+    if generated:
+        with open(output, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['username', 'password'])
+            writer.writerows(generated)
+        click.echo(f"Generated passwords written to {output}")
+
+    click.echo(f"✅ Provisioned {len(users)} users, skipped {skipped}")
+
+
+# Run in a fresh interpreter: time to import the app and to serve its first request
+STARTUP_PROBE = """
+import json, time
+start = time.perf_counter()
+import semsapp
+imported = time.perf_counter()
+semsapp.app.test_client().get('/login')
+print(json.dumps({"import": imported - start, "first_request": time.perf_counter() - imported}))
+"""
+
+
+@click.command('startup-benchmark')
+@click.option('--runs', default=5, show_default=True, help='Fresh processes started per mode.')
+def startup_benchmark(runs):
+    """Time process startup (import + first request), with and without schema creation at startup."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for auto_create in ('1', '0'):
+        environment = dict(os.environ, SEMS_SCHEMA_AUTO_CREATE=auto_create)
+        timings = []
+        for _ in range(runs):
+            result = subprocess.run(
+                [sys.executable, '-c', STARTUP_PROBE], cwd=root, env=environment,
+                capture_output=True, text=True, check=True
+            )
+            timings.append(json.loads(result.stdout.strip().splitlines()[-1]))
+        imported = sorted(t["import"] for t in timings)[runs // 2]
+        first_request = sorted(t["first_request"] for t in timings)[runs // 2]
+        click.echo(f"SCHEMA_AUTO_CREATE={auto_create}: import {imported * 1000:.0f} ms, "
+                   f"first request {first_request * 1000:.0f} ms (median of {runs})")
+
+
+@click.command('build-assets')
+@with_appcontext
+def build_assets_command():
+    """Fingerprint, minify and precompress main/static into ASSET_DIST_DIR (see main/assets.py)."""
+    dist_dir = current_app.config['ASSET_DIST_DIR']
+    manifest = build_assets(current_app.static_folder, dist_dir)
+    load_manifest(current_app)
+
+    source_size = sum(os.path.getsize(os.path.join(current_app.static_folder, path)) for path in manifest)
+    built_size = sum(entry["size"] for entry in manifest.values())
+    click.echo(f"✅ Built {len(manifest)} assets into {dist_dir} ({source_size} -> {built_size} bytes before compression)")
+
+
+@click.command('prune-events')
+@click.option('--days', type=float, default=None, help='Keep this many days (default EVENT_RETENTION_DAYS).')
+@click.option('--drop-legacy-logs', is_flag=True, help='Also drop the free-text logs table that DeviceEvent replaced.')
+@with_appcontext
+def prune_events_command(days, drop_legacy_logs):
+    """Delete old appliance events for every device, and optionally the legacy logs table."""
+    deleted = prune_events(days=days)
+    db.session.commit()
+    click.echo(f"✅ Deleted {deleted} events")
+
+    if drop_legacy_logs:
+        engine_logs = db.get_engine(current_app, bind='logs')
+        with engine_logs.begin() as connection:
+            connection.exec_driver_sql('DROP TABLE IF EXISTS logs')
+        click.echo("✅ Dropped the legacy logs table")
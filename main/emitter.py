@@ -0,0 +1,83 @@
+import threading
+import time
+
+
+class RoomEmitter:
+    """
+    Per-room outbound queue for Socket.IO updates.
+
+    Events queued for a room within the coalescing window are sent together as a single
+    frame, a newer payload for the same event replaces the one still waiting (the dashboard
+    only ever needs the latest snapshot), and each room gets at most one frame per
+    min_interval. A slow client therefore never has more than one frame of backlog.
+    """
+
+    def __init__(self, socketio=None, window=0.25, min_interval=1.0, frame_event='dashboard_update'):
+        self.socketio = socketio
+        self.window = window  # seconds between flushes
+        self.min_interval = min_interval  # minimum seconds between frames for one room
+        self.frame_event = frame_event
+
+        self.pending = {}  # room -> {event_name: payload}
+        self.last_sent = {}  # room -> time.monotonic() of the last frame
+        self.lock = threading.Lock()
+        self.flusher_running = False
+
+        self.stats = {"queued": 0, "superseded": 0, "frames": 0}
+
+    def init_app(self, app, socketio=None):
+        if socketio is not None:
+            self.socketio = socketio
+        self.window = app.config.get('SOCKETIO_COALESCE_WINDOW', self.window)
+        self.min_interval = app.config.get('SOCKETIO_MIN_FRAME_INTERVAL', self.min_interval)
+
+    def queue(self, room, event, payload):
+        """
+        Queue an event for a room. room=None broadcasts to every connected client.
+        """
+        with self.lock:
+            events = self.pending.setdefault(room, {})
+            if event in events:
+                self.stats["superseded"] += 1  # Older snapshot is dropped unsent
+            events[event] = payload
+            self.stats["queued"] += 1
+
+            start_flusher = not self.flusher_running
+            self.flusher_running = True
+
+        if start_flusher:
+            self.socketio.start_background_task(self._flush_loop)
+
+    def _flush_loop(self):
+        """Flush due rooms every window until nothing is left to send."""
+        while True:
+            self.socketio.sleep(self.window)
+            self.flush()
+            with self.lock:
+                if not self.pending:
+                    self.flusher_running = False
+                    return
+
+    def flush(self):
+        """Send one frame to every room whose rate limit allows it."""
+        now = time.monotonic()
+        due = []
+
+        with self.lock:
+            for room in list(self.pending):
+                if now - self.last_sent.get(room, float('-inf')) >= self.min_interval:
+                    due.append((room, self.pending.pop(room)))
+                    self.last_sent[room] = now
+
+            # Forget rooms that are idle and past their rate limit
+            for room in [r for r, sent in self.last_sent.items()
+                         if r not in self.pending and now - sent >= self.min_interval]:
+                del self.last_sent[room]
+
+            self.stats["frames"] += len(due)
+
+        for room, events in due:
+            if room is None:
+                self.socketio.emit(self.frame_event, {"events": events})
+            else:
+                self.socketio.emit(self.frame_event, {"events": events}, room=room)
@@ -0,0 +1,142 @@
+"""
+Appliance state-change events.
+
+Each change is one DeviceEvent row of small ints: the appliance's index in
+WIRE_APPLIANCES and the new state's index in EVENT_STATES. The dashboard's log view is
+rendered from the rows, and usage questions ("how often did the TV toggle this week",
+"how long was it on") are answered with indexed queries instead of parsing text.
+
+Events older than EVENT_RETENTION_DAYS are deleted as a device writes new ones, at most
+once per PRUNE_INTERVAL per device, through the (device_ID, timestamp) index.
+"""
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func
+
+from . import db
+from .models import DeviceEvent
+from .wire import WIRE_APPLIANCES
+
+EVENT_STATES = ('OFF', 'ON')
+APPLIANCE_CODES = {appliance: code for code, appliance in enumerate(WIRE_APPLIANCES)}
+STATE_CODES = {state: code for code, state in enumerate(EVENT_STATES)}
+
+LOG_ENTRIES = 15  # Log entries (readings with changes) shown on the dashboard
+PRUNE_INTERVAL = 3600  # Seconds between retention deletes for one device
+
+last_pruned = {}  # device_ID -> monotonic time of its last retention delete
+
+
+def record_state_changes(device_id, changes, timestamp=None):
+    """Insert one event per (appliance, new state) change of a reading and commit."""
+    timestamp = timestamp or datetime.utcnow()
+    rows = [
+        {"device_ID": device_id, "timestamp": timestamp, "appliance": APPLIANCE_CODES[appliance], "state": STATE_CODES[state]}
+        for appliance, state in changes
+        if appliance in APPLIANCE_CODES and state in STATE_CODES
+    ]
+    if rows:
+        db.session.execute(DeviceEvent.__table__.insert(), rows)
+        now = time.monotonic()
+        if now - last_pruned.get(device_id, float('-inf')) >= PRUNE_INTERVAL:
+            prune_events(device_id)
+            last_pruned[device_id] = now
+        db.session.commit()
+    return len(rows)
+
+
+def prune_events(device_id=None, days=None):
+    """
+    Delete events older than `days` (default EVENT_RETENTION_DAYS; 0 keeps everything),
+    for one device or all of them. Doesn't commit. Returns the rows deleted.
+    """
+    days = current_app.config['EVENT_RETENTION_DAYS'] if days is None else days
+    if not days:
+        return 0
+    delete = DeviceEvent.__table__.delete().where(DeviceEvent.timestamp < datetime.utcnow() - timedelta(days=days))
+    if device_id is not None:
+        delete = delete.where(DeviceEvent.device_ID == device_id)
+    return db.session.execute(delete).rowcount
+
+
+def recent_logs(device_id, limit=LOG_ENTRIES):
+    """
+    The latest `limit` log entries of a device, newest first, in the log_update format:
+    the changes of one reading joined as "tv turned ON" lines.
+    """
+    # A reading changes at most every appliance once, so this many rows hold `limit` entries
+    events = db.session.query(DeviceEvent.timestamp, DeviceEvent.appliance, DeviceEvent.state) \
+        .filter(DeviceEvent.device_ID == device_id) \
+        .order_by(DeviceEvent.timestamp.desc(), DeviceEvent.id) \
+        .limit(limit * len(WIRE_APPLIANCES)).all()
+
+    entries = []
+    for timestamp, appliance, state in events:
+        line = f"{WIRE_APPLIANCES[appliance]} turned {EVENT_STATES[state]}"
+        if entries and entries[-1][0] == timestamp:
+            entries[-1][1].append(line)
+        elif len(entries) < limit:
+            entries.append((timestamp, [line]))
+        else:
+            break
+    return [
+        {"timestamp": timestamp.strftime("%Y-%m-%d %H:%M:%S"), "changes": "\n".join(lines)}
+        for timestamp, lines in entries
+    ]
+
+
+def toggle_counts(device_id, since, until):
+    """State changes per appliance between since and until, {appliance: count}."""
+    counts = db.session.query(DeviceEvent.appliance, func.count(DeviceEvent.id)) \
+        .filter(
+            DeviceEvent.device_ID == device_id,
+            DeviceEvent.timestamp >= since,
+            DeviceEvent.timestamp < until
+        ).group_by(DeviceEvent.appliance).all()
+    return {WIRE_APPLIANCES[appliance]: count for appliance, count in counts}
+
+
+def on_time(device_id, since, until):
+    """Seconds each appliance was ON between since and until, {appliance: seconds}."""
+    on_code = STATE_CODES['ON']
+    seconds = {}
+    for code, appliance in enumerate(WIRE_APPLIANCES):
+        # The appliance's state when the window opens is that of its last earlier event
+        before = db.session.query(DeviceEvent.state).filter(
+            DeviceEvent.device_ID == device_id,
+            DeviceEvent.appliance == code,
+            DeviceEvent.timestamp < since
+        ).order_by(DeviceEvent.timestamp.desc()).first()
+        on_since = since if before and before.state == on_code else None
+
+        changes = db.session.query(DeviceEvent.timestamp, DeviceEvent.state).filter(
+            DeviceEvent.device_ID == device_id,
+            DeviceEvent.appliance == code,
+            DeviceEvent.timestamp >= since,
+            DeviceEvent.timestamp < until
+        ).order_by(DeviceEvent.timestamp).all()
+
+        total = 0.0
+        for timestamp, state in changes:
+            if state == on_code and on_since is None:
+                on_since = timestamp
+            elif state != on_code and on_since is not None:
+                total += (timestamp - on_since).total_seconds()
+                on_since = None
+        if on_since is not None:
+            total += (until - on_since).total_seconds()  # Still ON at the end of the window
+        seconds[appliance] = round(total, 1)
+    return seconds
+
+
+def appliance_usage(device_id, since, until=None):
+    """Toggle count and ON time per appliance between since and until (default now)."""
+    until = until or datetime.utcnow()
+    counts = toggle_counts(device_id, since, until)
+    seconds = on_time(device_id, since, until)
+    return {
+        appliance: {"toggles": counts.get(appliance, 0), "on_seconds": seconds[appliance]}
+        for appliance in WIRE_APPLIANCES
+    }
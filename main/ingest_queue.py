@@ -0,0 +1,138 @@
+import threading
+from collections import OrderedDict, deque
+from itertools import count
+
+POLICIES = ('drop_oldest', 'coalesce', 'reject')
+
+
+class IngestQueue:
+    """
+    Bounded queue between the ingest endpoints and the database.
+
+    Readings are stored by a single background worker, so a burst of requests turns into
+    a queue of at most `depth` readings instead of a pile of threads waiting on SQLite
+    locks. When the queue is full the policy decides what gives:
+
+        drop_oldest  the device's oldest queued reading (or the oldest overall) is dropped
+        coalesce     a device keeps one queued reading, a newer one replaces it; a reading
+                     for a device with nothing queued is rejected
+        reject       the new reading is rejected and the client told to retry later
+
+    depth=0 disables the queue and readings are stored in the request as before.
+    """
+
+    def __init__(self, socketio=None, depth=0, policy='drop_oldest', retry_after=3):
+        self.socketio = socketio
+        self.app = None
+        self.depth = depth  # maximum queued readings, 0 disables the queue
+        self.policy = policy
+        self.retry_after = retry_after  # seconds suggested to rejected clients
+        self.handle = None  # function(data) -> (body, status) that stores one reading
+
+        self.readings = OrderedDict()  # ticket -> (device_id, data), oldest first
+        self.by_device = {}  # device_id -> deque of that device's tickets, oldest first
+        self.tickets = count()
+        self.lock = threading.Lock()
+        self.worker_running = False
+
+        self.stats = {"enqueued": 0, "processed": 0, "failed": 0, "dropped": 0,
+                      "coalesced": 0, "rejected": 0, "max_depth_seen": 0}
+
+    @property
+    def enabled(self):
+        return self.depth > 0
+
+    def init_app(self, app, socketio=None):
+        if socketio is not None:
+            self.socketio = socketio
+        self.app = app
+        self.depth = app.config.get('INGEST_QUEUE_DEPTH', self.depth)
+        self.policy = app.config.get('INGEST_QUEUE_POLICY', self.policy)
+        self.retry_after = app.config.get('INGEST_RETRY_AFTER', self.retry_after)
+        if self.policy not in POLICIES:
+            raise ValueError(f"INGEST_QUEUE_POLICY must be one of {', '.join(POLICIES)}, not {self.policy}")
+
+    def handler(self, handle):
+        """Register the function that stores a reading; usable as a decorator."""
+        self.handle = handle
+        return handle
+
+    def put(self, data):
+        """
+        Queue a reading. Returns False when it was rejected because the queue is full.
+        """
+        device_id = data['device_ID']
+
+        with self.lock:
+            pending = self.by_device.get(device_id)
+
+            if self.policy == 'coalesce' and pending:
+                # Newest reading takes the queued one's place in line
+                self.readings[pending[-1]] = (device_id, data)
+                self.stats["coalesced"] += 1
+                return True
+
+            if len(self.readings) >= self.depth:
+                if self.policy != 'drop_oldest':
+                    self.stats["rejected"] += 1
+                    return False
+                ticket = pending[0] if pending else next(iter(self.readings))
+                self._remove(ticket)
+                self.stats["dropped"] += 1
+
+            ticket = next(self.tickets)
+            self.readings[ticket] = (device_id, data)
+            self.by_device.setdefault(device_id, deque()).append(ticket)
+            self.stats["enqueued"] += 1
+            self.stats["max_depth_seen"] = max(self.stats["max_depth_seen"], len(self.readings))
+
+            start_worker = not self.worker_running
+            self.worker_running = True
+
+        if start_worker:
+            self.socketio.start_background_task(self._work)
+        return True
+
+    def _remove(self, ticket):
+        """Remove a queued reading. The caller must hold the lock."""
+        device_id, data = self.readings.pop(ticket)
+        tickets = self.by_device[device_id]
+        tickets.remove(ticket)
+        if not tickets:
+            del self.by_device[device_id]
+        return data
+
+    def _work(self):
+        """Store queued readings one at a time until the queue is empty."""
+        while True:
+            with self.lock:
+                if not self.readings:
+                    self.worker_running = False
+                    return
+                data = self._remove(next(iter(self.readings)))
+
+            try:
+                with self.app.app_context():
+                    body, status = self.handle(data)
+                failed = status >= 400
+                if failed:
+                    print(f"❌ Queued reading rejected ({status}): {body.get('error')}")
+            except Exception as e:
+                failed = True
+                print(f"❌ Queued reading failed: {e}")
+
+            with self.lock:
+                self.stats["failed" if failed else "processed"] += 1
+
+            self.socketio.sleep(0)  # Let request handlers run between readings
+
+    def metrics(self):
+        with self.lock:
+            return dict(
+                self.stats,
+                enabled=self.enabled,
+                policy=self.policy,
+                capacity=self.depth,
+                depth=len(self.readings),
+                devices=len(self.by_device)
+            )
@@ -0,0 +1,157 @@
+"""
+Multi-process ingest: readings are routed to a fixed worker process per device.
+
+The web process validates a reading and hands it to worker crc32(device_ID) % shards %
+workers, the same hash that picks the device's realtime shard. A worker therefore sees
+every reading of its devices (their device_thread timers, journal, caches stay in one
+process) and is the only writer of its shards, so workers never wait on each other's
+SQLite locks. Workers emit through the Socket.IO message queue, which must be configured.
+
+The shard count must be a multiple of the worker count so every worker owns shards;
+it defaults to the worker count.
+Workers are forked once at startup, before any background task starts, and build their
+own app (engines, sessions, journal) from WORKER_ENVIRONMENT.
+"""
+import multiprocessing
+import os
+import queue
+import threading
+
+# Environment for worker processes: no nested workers, no in-process queue (the worker's
+# own queue already bounds the backlog), write-only Socket.IO (workers have no clients)
+# and real threads, since the main loop blocks on a multiprocessing queue that would
+# starve eventlet or gevent greenthreads
+WORKER_ENVIRONMENT = {
+    'SEMS_INGEST_WORKERS': '0',
+    'SEMS_INGEST_QUEUE_DEPTH': '0',
+    'SEMS_SOCKETIO_WRITE_ONLY': '1',
+    'SEMS_SOCKETIO_ASYNC_MODE': 'threading',
+    'SEMS_SCHEMA_AUTO_CREATE': '0',  # The parent already created it
+}
+
+
+def worker_main(index, readings, environment):
+    """Entry point of a worker process: build the app and store readings as they arrive."""
+    os.environ.update(environment)
+
+    from main import create_app, journal
+    from main.sockets import ingest_reading
+
+    app = create_app()  # Re-initializes the shared extensions for this process
+    journal.start_loader()
+    print(f"✅ Ingest worker {index} started (pid {os.getpid()})")
+
+    while True:
+        data = readings.get()
+        if data is None:
+            return
+        try:
+            with app.app_context():
+                body, status = ingest_reading(data)
+            if status >= 400:
+                print(f"❌ Worker {index} rejected reading ({status}): {body.get('error')}")
+        except Exception as e:
+            print(f"❌ Worker {index} failed to store reading: {e}")
+
+
+class IngestWorkerPool:
+    """
+    Fixed pool of ingest worker processes, each with a bounded queue of readings.
+    workers=0 disables the pool.
+    """
+
+    def __init__(self, workers=0, depth=100):
+        self.app = None
+        self.workers = workers
+        self.depth = depth  # readings queued per worker before new ones are rejected
+        self.context = multiprocessing.get_context('fork')
+        self.processes = []
+        self.queues = []
+        self.lock = threading.Lock()
+        self.stats = {"dispatched": 0, "rejected": 0}
+
+    @property
+    def enabled(self):
+        return self.workers > 0
+
+    def init_app(self, app):
+        self.app = app
+        self.workers = app.config.get('INGEST_WORKERS', self.workers)
+        self.depth = app.config.get('INGEST_QUEUE_DEPTH', self.depth) or self.depth
+        if self.enabled and not app.config.get('SOCKETIO_MESSAGE_QUEUE'):
+            raise ValueError("INGEST_WORKERS needs SOCKETIO_MESSAGE_QUEUE so workers can reach the dashboards")
+        if self.enabled and app.config['REALTIME_SHARDS'] % self.workers:
+            raise ValueError(
+                f"REALTIME_SHARDS ({app.config['REALTIME_SHARDS']}) must be a multiple of "
+                f"INGEST_WORKERS ({self.workers}), or some workers would own no devices"
+            )
+
+    def worker_for(self, device_id):
+        """Index of the worker owning a device: the owner of the device's shard."""
+        from main.shards import shard_index
+        return shard_index(device_id, self.app.config['REALTIME_SHARDS']) % self.workers
+
+    def start(self):
+        """Fork the worker processes. Call before starting any thread or background task."""
+        if not self.enabled:
+            return
+        self.queues = [self.context.Queue(self.depth) for _ in range(self.workers)]
+        self.processes = [self._start_worker(index) for index in range(self.workers)]
+
+    def _start_worker(self, index):
+        # Workers run with SEMS_INGEST_WORKERS=0, so pass the shard count on explicitly
+        environment = dict(WORKER_ENVIRONMENT, SEMS_REALTIME_SHARDS=str(self.app.config['REALTIME_SHARDS']))
+        if self.app.config.get('JOURNAL_DIR'):
+            # Each process needs its own journal directory
+            environment['SEMS_JOURNAL_DIR'] = os.path.join(self.app.config['JOURNAL_DIR'], f"worker_{index}")
+        if self.app.config.get('SEQUENCE_CHECKPOINT_FILE'):
+            environment['SEMS_SEQUENCE_CHECKPOINT_FILE'] = f"{self.app.config['SEQUENCE_CHECKPOINT_FILE']}.worker_{index}"
+
+        process = self.context.Process(
+            target=worker_main,
+            args=(index, self.queues[index], environment),
+            name=f"sems-ingest-{index}",
+            daemon=True
+        )
+        process.start()
+        return process
+
+    def put(self, data):
+        """Route a reading to its device's worker. Returns False when that worker's queue is full."""
+        index = self.worker_for(data['device_ID'])
+
+        # A dead worker is not forked again from a running server, its devices are
+        # rejected until restart (the worker list in metrics() shows it)
+        if not self.processes[index].is_alive():
+            accepted = False
+        else:
+            try:
+                self.queues[index].put_nowait(data)
+                accepted = True
+            except queue.Full:
+                accepted = False
+
+        with self.lock:
+            self.stats["dispatched" if accepted else "rejected"] += 1
+        return accepted
+
+    def stop(self):
+        for readings in self.queues:
+            readings.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+
+    def metrics(self):
+        def depth(readings):
+            try:
+                return readings.qsize()
+            except NotImplementedError:  # macOS
+                return None
+
+        return dict(
+            self.stats,
+            workers=[
+                {"pid": process.pid, "alive": process.is_alive(), "depth": depth(readings)}
+                for process, readings in zip(self.processes, self.queues)
+            ]
+        )
@@ -0,0 +1,308 @@
+"""
+Append-only journal of ingested readings, bulk loaded into RealTimeData.
+
+With a journal directory configured, ingest appends each reading to the current segment
+file and returns; a background loader inserts journaled readings into the realtime
+database in batches with a single executemany per batch. Readings survive a busy database
+or a crash: at startup every segment not yet loaded is replayed.
+
+Segments are named segment_<n>.log and hold fixed 61-byte little-endian records:
+
+    device_ID      16 bytes  UTF-8, NUL padded
+    timestamp      int64     microseconds since the epoch (UTC)
+    battery_level  int32
+    solar_output   int32
+    states         uint8     bit i set when WIRE_APPLIANCES[i] is ON
+    consumptions   6 x float32, kWh, in WIRE_APPLIANCES order
+    crc            uint32    CRC-32 of the fields above
+
+checkpoint.json records the segment and byte offset the loader has reached. Each process
+needs its own journal directory.
+"""
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from .wire import WIRE_APPLIANCES
+
+RECORD_STRUCT = struct.Struct('<16sqiiB' + 'f' * len(WIRE_APPLIANCES))
+CRC_STRUCT = struct.Struct('<I')
+RECORD_SIZE = RECORD_STRUCT.size + CRC_STRUCT.size
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def encode_record(record):
+    """Encode a RealTimeData record as one journal record."""
+    states = 0
+    for bit, appliance in enumerate(WIRE_APPLIANCES):
+        if getattr(record, f"{appliance}_state") == "ON":
+            states |= 1 << bit
+
+    body = RECORD_STRUCT.pack(
+        record.device_ID.encode(),
+        (record.timestamp - EPOCH) // timedelta(microseconds=1),
+        int(record.battery_level),
+        int(record.solar_output),
+        states,
+        *(getattr(record, f"{appliance}_consumption") or 0.0 for appliance in WIRE_APPLIANCES)
+    )
+    return body + CRC_STRUCT.pack(zlib.crc32(body))
+
+
+def decode_record(data):
+    """Decode one journal record into RealTimeData column values, None if it is corrupt."""
+    body, (crc,) = data[:RECORD_STRUCT.size], CRC_STRUCT.unpack(data[RECORD_STRUCT.size:])
+    if zlib.crc32(body) != crc:
+        return None
+
+    device_id, timestamp, battery_level, solar_output, states, *consumptions = RECORD_STRUCT.unpack(body)
+    row = {
+        "device_ID": device_id.rstrip(b"\0").decode(),
+        "timestamp": EPOCH + timedelta(microseconds=timestamp),
+        "battery_level": battery_level,
+        "solar_output": solar_output,
+    }
+    for bit, appliance in enumerate(WIRE_APPLIANCES):
+        row[f"{appliance}_state"] = "ON" if states & (1 << bit) else "OFF"
+        row[f"{appliance}_consumption"] = round(consumptions[bit], 6)  # float32 back to the stored precision
+    return row
+
+
+class ReadingJournal:
+    """
+    Segmented on-disk journal for realtime readings plus the loader that drains it.
+
+    Appends are flushed to the OS immediately and fsynced at most every fsync_interval
+    seconds, so a burst of readings shares one fsync; each loader pass syncs whatever is
+    left. A process crash loses nothing, an OS crash at most the unsynced tail.
+    """
+
+    def __init__(self, socketio=None, directory=None, segment_records=10000, fsync_interval=0.05,
+                 load_interval=1.0, batch_size=1000):
+        self.socketio = socketio  # runs the loader as a background task
+        self.app = None
+        self.directory = directory
+        self.segment_records = segment_records  # records per segment before rolling over
+        self.fsync_interval = fsync_interval  # seconds between fsyncs of the active segment
+        self.load_interval = load_interval  # seconds between loader passes
+        self.batch_size = batch_size  # records per executemany
+
+        self.lock = threading.Lock()
+        self.file = None
+        self.segment = None  # number of the segment being appended to
+        self.first_segment = None  # first segment written by this process
+        self.interrupted = False  # a failed load may have committed part of its batch
+        self.segment_count = 0
+        self.written = 0  # bytes appended to the active segment
+        self.synced = 0  # bytes of the active segment known to be on disk
+        self.last_sync = 0.0
+
+        self.latest = {}  # device_ID -> latest journaled record, loaded or not
+        self.load_listeners = []
+        self.stats = {"appended": 0, "fsyncs": 0, "loaded": 0, "skipped": 0}
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def init_app(self, app, socketio=None):
+        if socketio is not None:
+            self.socketio = socketio
+        self.app = app
+        self.directory = app.config.get('JOURNAL_DIR', self.directory)
+        self.segment_records = app.config.get('JOURNAL_SEGMENT_RECORDS', self.segment_records)
+        self.fsync_interval = app.config.get('JOURNAL_FSYNC_INTERVAL', self.fsync_interval)
+        self.load_interval = app.config.get('JOURNAL_LOAD_INTERVAL', self.load_interval)
+        self.batch_size = app.config.get('JOURNAL_BATCH_SIZE', self.batch_size)
+
+        if self.enabled:
+            os.makedirs(self.directory, exist_ok=True)
+            # Always start a fresh segment, a crash may have left a torn record in the last one
+            self.first_segment = max([s + 1 for s in self.segments()] + [self.read_checkpoint()[0] + 1])
+            self._open_segment(self.first_segment)
+
+    def on_load(self, listener):
+        """Register listener(device_ids), called in the app context after each batch is loaded."""
+        self.load_listeners.append(listener)
+        return listener
+
+    def segment_path(self, segment):
+        return os.path.join(self.directory, f"segment_{segment:010d}.log")
+
+    def segments(self):
+        """Numbers of the segment files on disk, oldest first."""
+        return sorted(
+            int(name[len("segment_"):-len(".log")])
+            for name in os.listdir(self.directory)
+            if name.startswith("segment_") and name.endswith(".log")
+        )
+
+    def _open_segment(self, segment):
+        if self.file:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+        self.segment = segment
+        self.file = open(self.segment_path(segment), "ab")
+        self.segment_count = 0
+        self.written = self.synced = 0
+
+    def append(self, record):
+        """Append a RealTimeData record to the journal."""
+        data = encode_record(record)
+
+        with self.lock:
+            if self.segment_count >= self.segment_records:
+                self._open_segment(self.segment + 1)
+
+            self.file.write(data)
+            self.file.flush()
+            self.segment_count += 1
+            self.written += len(data)
+            self.latest[record.device_ID] = record
+            self.stats["appended"] += 1
+
+            if time.monotonic() - self.last_sync >= self.fsync_interval:
+                self._sync()
+
+    def _sync(self):
+        if self.synced != self.written:
+            os.fsync(self.file.fileno())
+            self.synced = self.written
+            self.stats["fsyncs"] += 1
+        self.last_sync = time.monotonic()
+
+    def sync(self):
+        """Force appended records to disk."""
+        with self.lock:
+            self._sync()
+
+    def read_checkpoint(self):
+        try:
+            with open(os.path.join(self.directory, "checkpoint.json")) as f:
+                checkpoint = json.load(f)
+            return checkpoint["segment"], checkpoint["offset"]
+        except (OSError, ValueError, KeyError):
+            return 0, 0
+
+    def write_checkpoint(self, segment, offset):
+        path = os.path.join(self.directory, "checkpoint.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump({"segment": segment, "offset": offset}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{path}.tmp", path)
+
+    def read_pending(self):
+        """
+        Read up to batch_size unloaded records. Returns (rows, segment, offset, replayed):
+        the decoded rows, the position just after them and whether any of them come from
+        a segment written before this process started.
+        """
+        with self.lock:
+            self._sync()
+            active, active_size = self.segment, self.synced
+
+        segment, offset = self.read_checkpoint()
+        rows = []
+        replayed = False
+
+        for current in [s for s in self.segments() if s >= segment]:
+            if current != segment:
+                segment, offset = current, 0
+            end = active_size if current == active else os.path.getsize(self.segment_path(current))
+
+            with open(self.segment_path(current), "rb") as f:
+                f.seek(offset)
+                while offset + RECORD_SIZE <= end and len(rows) < self.batch_size:
+                    row = decode_record(f.read(RECORD_SIZE))
+                    offset += RECORD_SIZE
+                    if row is None:
+                        self.stats["skipped"] += 1
+                        print(f"❌ Skipping corrupt journal record in segment {current}")
+                        continue
+                    rows.append(row)
+                    replayed = replayed or current < self.first_segment
+
+            # A torn record at the end of an old segment is left behind with the segment
+            if len(rows) >= self.batch_size or current == active:
+                break
+
+        return rows, segment, offset, replayed
+
+    def load_pending(self):
+        """Bulk insert one batch of journaled readings. Needs an app context. Returns the number of rows read."""
+        from .models import RealTimeData
+        from .shards import shard_bind, shard_engine
+
+        rows, segment, offset, replayed = self.read_pending()
+        count = len(rows)
+
+        # One executemany per realtime shard. If a shard fails after others committed,
+        # the retry of the batch checks for rows that are already in like a replay does.
+        by_shard = {}
+        for row in rows:
+            by_shard.setdefault(shard_bind(row["device_ID"]), []).append(row)
+
+        check_loaded = replayed or self.interrupted
+        self.interrupted = True
+        loaded = 0
+        for shard_rows in by_shard.values():
+            with shard_engine(shard_rows[0]["device_ID"]).begin() as connection:
+                if check_loaded:
+                    shard_rows = self._without_loaded(connection, RealTimeData, shard_rows)
+                if shard_rows:
+                    connection.execute(RealTimeData.__table__.insert(), shard_rows)
+                    loaded += len(shard_rows)
+
+        self.write_checkpoint(segment, offset)
+        self.interrupted = False
+        self.stats["loaded"] += loaded
+
+        # Segments before the checkpoint are fully loaded
+        for old in self.segments():
+            if old < segment:
+                os.remove(self.segment_path(old))
+
+        if rows:
+            device_ids = sorted({row["device_ID"] for row in rows})
+            for listener in self.load_listeners:
+                listener(device_ids)
+        return count
+
+    def _without_loaded(self, connection, RealTimeData, rows):
+        """
+        Drop replayed rows that are already in the database: a crash between a batch's
+        commit and its checkpoint leaves them in the journal as well.
+        """
+        table = RealTimeData.__table__
+        loaded = set(connection.execute(
+            select(table.c.device_ID, table.c.timestamp)
+            .where(table.c.device_ID.in_({row["device_ID"] for row in rows}))
+            .where(table.c.timestamp.between(min(row["timestamp"] for row in rows),
+                                             max(row["timestamp"] for row in rows)))
+        ))
+        return [row for row in rows if (row["device_ID"], row["timestamp"]) not in loaded]
+
+    def start_loader(self):
+        """Start the background loader; it first replays whatever earlier runs left behind."""
+        if self.enabled:
+            self.socketio.start_background_task(self._load_loop)
+
+    def _load_loop(self):
+        """Drain the journal every load_interval."""
+        while True:
+            try:
+                with self.app.app_context():
+                    while self.load_pending() >= self.batch_size:
+                        pass
+            except Exception as e:
+                print(f"❌ Journal load failed, retrying: {e}")
+            self.socketio.sleep(self.load_interval)
@@ -39,13 +39,19 @@ class User(db.Model, UserMixin):
     def check_password(self, password):
         return check_password_hash(self.password, password)
 
-#here we have the database for saving user logs
-class Logs(db.Model):
-    __bind_key__ = 'logs'  # Using the same bind as RealTimeData
+# Appliance state changes, one compact row each (codes in main/events.py). Replaces the
+# free-text Logs table: rows can be indexed, counted and summed per appliance.
+class DeviceEvent(db.Model):
+    __bind_key__ = 'logs'
+    __table_args__ = (
+        db.Index('ix_device_event_device_time', 'device_ID', 'timestamp'),  # Latest logs
+        db.Index('ix_device_event_device_appliance_time', 'device_ID', 'appliance', 'timestamp'),  # Usage
+    )
     id = db.Column(db.Integer, primary_key=True)
-    device_ID = db.Column(db.String, nullable=False, index=True)
+    device_ID = db.Column(db.String, nullable=False)
     timestamp = db.Column(db.DateTime, nullable=False)
-    changes = db.Column(db.Text, nullable=False)  # Stores the changes as text
+    appliance = db.Column(db.SmallInteger, nullable=False)  # Index into WIRE_APPLIANCES
+    state = db.Column(db.SmallInteger, nullable=False)  # Index into EVENT_STATES
 
 #recording devices consumption according to how they uses energy
 
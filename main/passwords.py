@@ -0,0 +1,86 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class PasswordPoolBusy(Exception):
+    """Raised when a hash can't be queued or finished in time; answer 503."""
+
+
+class PasswordHasher:
+    """
+    Runs password hashing and verification in a small process pool.
+
+    PBKDF2 costs tens of milliseconds of CPU per call. In the request thread a burst of
+    logins would occupy every worker; here at most `workers` hashes run at once, at most
+    `queue_size` wait, and a request that can't get a slot within `queue_timeout` seconds
+    is turned away instead of piling up.
+    """
+
+    def __init__(self, workers=2, queue_size=16, queue_timeout=2.0, timeout=10.0):
+        self.workers = workers
+        self.queue_size = queue_size  # hashes running or waiting
+        self.queue_timeout = queue_timeout  # seconds to wait for a free slot
+        self.timeout = timeout  # seconds to wait for a queued hash
+        self.slots = threading.BoundedSemaphore(queue_size)
+        self.pool = None
+        self.lock = threading.Lock()
+        self.stats = {"hashed": 0, "verified": 0, "busy": 0}
+
+    def init_app(self, app):
+        self.workers = app.config.get('PASSWORD_WORKERS', self.workers)
+        self.queue_size = app.config.get('PASSWORD_QUEUE_SIZE', self.queue_size)
+        self.queue_timeout = app.config.get('PASSWORD_QUEUE_TIMEOUT', self.queue_timeout)
+        self.timeout = app.config.get('PASSWORD_TIMEOUT', self.timeout)
+        self.slots = threading.BoundedSemaphore(self.queue_size)
+
+    def start(self):
+        """
+        Fork the pool's processes now. The server entry point calls it before serving;
+        importing the app doesn't, so processes that never hash don't pay for the forks,
+        and elsewhere they are forked on first use.
+        """
+        list(self._pool().map(int, range(self.workers)))
+
+    def _pool(self):
+        with self.lock:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('fork'))
+            return self.pool
+
+    def _run(self, function, *args):
+        if not self.slots.acquire(timeout=self.queue_timeout):
+            self.stats["busy"] += 1
+            raise PasswordPoolBusy("Password hashing queue is full")
+
+        try:
+            return self._pool().submit(function, *args).result(timeout=self.timeout)
+        except TimeoutError:
+            self.stats["busy"] += 1
+            raise PasswordPoolBusy("Password hashing timed out")
+        except BrokenProcessPool:
+            # A worker died, start over with a fresh pool on the next call
+            with self.lock:
+                self.pool = None
+            raise PasswordPoolBusy("Password hashing pool restarted")
+        finally:
+            self.slots.release()
+
+    def hash(self, password):
+        """werkzeug generate_password_hash, in the pool."""
+        pwhash = self._run(generate_password_hash, password)
+        self.stats["hashed"] += 1
+        return pwhash
+
+    def verify(self, pwhash, password):
+        """werkzeug check_password_hash, in the pool."""
+        valid = self._run(check_password_hash, pwhash, password)
+        self.stats["verified"] += 1
+        return valid
+
+    def hash_many(self, passwords, chunksize=16):
+        """Hash a list of passwords using every process, for bulk provisioning."""
+        return list(self._pool().map(generate_password_hash, passwords, chunksize=chunksize))
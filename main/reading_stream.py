@@ -0,0 +1,50 @@
+import json
+from . import socketio
+from .sockets import SIMULATOR_API_URL, submit_reading
+
+STREAM_RETRY_SECONDS = 5  # Wait before reconnecting after the stream drops
+
+
+def iter_stream_readings(response):
+    """Yield the JSON readings of a Server-Sent Events response, one per "data:" line."""
+    for line in response.iter_lines(decode_unicode=True):
+        if line and line.startswith("data:"):
+            yield json.loads(line[len("data:"):])
+
+
+def consume_reading_stream(app, device_ids, interval):
+    """
+    Subscribe to the simulator's reading stream for device_ids and ingest every reading,
+    reconnecting whenever the connection drops. Runs for the life of the process.
+    """
+    import requests  # Imported on first use, it is slow to import
+    params = {"device_ids": ",".join(device_ids), "interval": interval}
+
+    while True:
+        try:
+            with requests.get(
+                f"{SIMULATOR_API_URL}/stream_simulated_data",
+                params=params,
+                stream=True,
+                timeout=(5, max(30, interval * 10))  # A silent stream counts as dropped
+            ) as response:
+                response.raise_for_status()
+                print(f"✅ Subscribed to reading stream for {', '.join(device_ids)}")
+
+                for reading in iter_stream_readings(response):
+                    with app.app_context():
+                        body, status = submit_reading(reading)
+                    if status >= 400:
+                        print(f"❌ Streamed reading rejected ({status}): {body.get('error')}")
+
+        except (requests.RequestException, ValueError) as e:
+            print(f"❌ Reading stream lost: {e}")
+
+        socketio.sleep(STREAM_RETRY_SECONDS)
+
+
+def start_reading_stream(app):
+    """Start the stream consumer when SEMS_STREAM_DEVICE_IDS lists devices to ingest."""
+    device_ids = app.config.get('STREAM_DEVICE_IDS')
+    if device_ids:
+        socketio.start_background_task(consume_reading_stream, app, device_ids, app.config['STREAM_INTERVAL'])
@@ -0,0 +1,100 @@
+import atexit
+import json
+import os
+import threading
+import time
+
+
+class SequenceTracker:
+    """
+    Per-device high-water marks of controller sequence numbers, used to drop readings
+    that were already ingested (several dashboard tabs fetching the same controller
+    reading, a resent stream event).
+
+    A mark is (boot_id, sequence). A reading is new when its controller booted since the
+    mark was taken or its sequence is above the mark. Readings without a sequence are
+    always accepted, and release() takes back the mark of a reading that failed to store.
+    Marks are kept in memory and written to a JSON checkpoint every
+    checkpoint_interval seconds and at exit, so a restart doesn't re-accept old readings.
+    """
+
+    def __init__(self, path=None, checkpoint_interval=5.0):
+        self.path = path
+        self.checkpoint_interval = checkpoint_interval
+        self.marks = {}  # device_ID -> [boot_id, sequence]
+        self.previous = {}  # device_ID -> mark replaced by the last accepted reading, for release()
+        self.lock = threading.Lock()
+        self.last_checkpoint = time.monotonic()
+        self.dirty = False
+        self.stats = {"accepted": 0, "duplicates": 0}
+
+    def init_app(self, app):
+        self.path = app.config.get('SEQUENCE_CHECKPOINT_FILE', self.path)
+        self.checkpoint_interval = app.config.get('SEQUENCE_CHECKPOINT_INTERVAL', self.checkpoint_interval)
+
+        if self.path:
+            try:
+                with open(self.path) as f:
+                    self.marks = json.load(f)
+            except (OSError, ValueError):
+                self.marks = {}
+            atexit.register(self.checkpoint)
+
+    def accept(self, data):
+        """Record a reading's sequence number. Returns False when it is a duplicate."""
+        sequence = data.get('sequence')
+        if sequence is None:
+            return True
+
+        boot_id = data.get('boot_id')
+        device_id = data['device_ID']
+
+        with self.lock:
+            mark = self.marks.get(device_id)
+            if mark and mark[0] == boot_id and sequence <= mark[1]:
+                self.stats["duplicates"] += 1
+                return False
+
+            self.previous[device_id] = mark
+            self.marks[device_id] = [boot_id, sequence]
+            self.stats["accepted"] += 1
+            self.dirty = True
+            checkpoint_due = time.monotonic() - self.last_checkpoint >= self.checkpoint_interval
+
+        if checkpoint_due:
+            self.checkpoint()
+        return True
+
+    def release(self, data):
+        """
+        Undo accept() for a reading that could not be stored or queued, so its retry isn't
+        skipped as a duplicate. Does nothing once a newer reading moved the mark on.
+        """
+        sequence = data.get('sequence')
+        if sequence is None:
+            return
+
+        device_id = data['device_ID']
+        with self.lock:
+            if self.marks.get(device_id) != [data.get('boot_id'), sequence]:
+                return
+            previous = self.previous.pop(device_id, None)
+            if previous is None:
+                del self.marks[device_id]
+            else:
+                self.marks[device_id] = previous
+            self.stats["accepted"] -= 1
+            self.dirty = True
+
+    def checkpoint(self):
+        """Write the marks to the checkpoint file if they changed since the last write."""
+        with self.lock:
+            self.last_checkpoint = time.monotonic()
+            if not self.path or not self.dirty:
+                return
+
+            # Written to a temporary file first so a crash never leaves a half-written checkpoint
+            with open(f"{self.path}.tmp", "w") as f:
+                json.dump(self.marks, f)
+            os.replace(f"{self.path}.tmp", self.path)
+            self.dirty = False
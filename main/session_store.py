@@ -0,0 +1,143 @@
+"""
+Server-side session backends.
+
+SESSION_BACKEND selects where session data lives:
+
+    filesystem  Flask-Session's one-file-per-session store (default) - survives restarts
+                and is shared by every process on the machine
+    memory      in-process LRU with expiry - no I/O per request; sessions are lost on
+                restart and not shared between processes, so run one process per user
+                behind a sticky load balancer (see README)
+    sqlite      the same LRU, backed by a SQLite file written in the background - sessions
+                survive restarts
+
+Unlike Flask-Session's interfaces, sessions that were not modified are not written back,
+so the dashboard's polling only reads the session. Socket.IO events don't touch the store
+at all: sockets authenticate with a signed token (see main/socket_auth.py), and the
+request context Flask-SocketIO pushes for each event gets an empty session.
+"""
+import os
+
+from flask_session.sessions import FileSystemSessionInterface
+
+from .cache import LRUCache, WriteBehindCache
+
+SESSION_BACKENDS = ('memory', 'sqlite', 'filesystem')
+SOCKET_PATH = '/socket.io'
+
+
+class SocketlessSessionMixin:
+    """Skip the session store for Socket.IO event contexts."""
+
+    def open_session(self, app, request):
+        if request.path.startswith(SOCKET_PATH):
+            return self.session_class(permanent=self.permanent)
+        return super().open_session(app, request)
+
+
+class FileSystemSessions(SocketlessSessionMixin, FileSystemSessionInterface):
+    """Flask-Session's file store, minus Socket.IO events."""
+
+    def __init__(self, interface):
+        self.__dict__.update(interface.__dict__)  # Same file cache Session(app) configured
+
+
+class CachedSessionInterface(SocketlessSessionMixin, FileSystemSessionInterface):
+    """Flask-Session server-side sessions kept in any cachelib-style cache."""
+
+    def __init__(self, cache, key_prefix, use_signer=False, permanent=True):
+        self.cache = cache
+        self.key_prefix = key_prefix
+        self.use_signer = use_signer
+        self.permanent = permanent
+        self.has_same_site_capability = hasattr(self, "get_cookie_samesite")
+
+    def save_session(self, app, session, response):
+        # Unchanged session: nothing to store, and the cookie only needs re-sending
+        # when SESSION_REFRESH_EACH_REQUEST asks for it
+        if session and not session.modified and not self.should_set_cookie(app, session):
+            return
+        super().save_session(app, session, response)
+
+
+def make_session_interface(app, socketio):
+    """Build the session interface for app.config['SESSION_BACKEND'], after Session(app)."""
+    backend = app.config['SESSION_BACKEND']
+    if backend not in SESSION_BACKENDS:
+        raise ValueError(f"SESSION_BACKEND must be one of {', '.join(SESSION_BACKENDS)}, not {backend}")
+    if backend == 'filesystem':
+        return FileSystemSessions(app.session_interface)
+
+    lifetime = int(app.permanent_session_lifetime.total_seconds())
+    if backend == 'memory':
+        cache = LRUCache(app.config['SESSION_CACHE_SIZE'], lifetime)
+    else:
+        cache = WriteBehindCache(
+            app.config['SESSION_SQLITE_PATH'],
+            socketio,
+            maxsize=app.config['SESSION_CACHE_SIZE'],
+            default_timeout=lifetime,
+            interval=app.config['SESSION_WRITE_BEHIND_INTERVAL']
+        )
+
+    return CachedSessionInterface(
+        cache,
+        app.config.get('SESSION_KEY_PREFIX', 'session:'),
+        app.config.get('SESSION_USE_SIGNER', False),
+        app.config.get('SESSION_PERMANENT', True)
+    )
+
+
+if __name__ == '__main__':
+    # Per-request session overhead (open + save of a logged-in session) for each backend
+    import tempfile
+    import timeit
+
+    from flask import Flask, session
+    from flask_session import Session
+
+    class InlineTasks:
+        """Stands in for socketio: the benchmark flushes the write-behind cache itself."""
+
+        def start_background_task(self, target, *args):
+            pass
+
+    def make_app(backend, folder):
+        app = Flask(__name__)
+        app.secret_key = 'benchmark'
+        app.config.update(
+            SESSION_TYPE='filesystem',
+            SESSION_FILE_DIR=os.path.join(folder, 'flask_session'),
+            SESSION_PERMANENT=True,
+            SESSION_REFRESH_EACH_REQUEST=False,
+            SESSION_BACKEND=backend,
+            SESSION_CACHE_SIZE=10000,
+            SESSION_SQLITE_PATH=os.path.join(folder, 'sessions.db'),
+            SESSION_WRITE_BEHIND_INTERVAL=1.0,
+        )
+        Session(app)
+        app.session_interface = make_session_interface(app, InlineTasks())
+
+        @app.route('/login')
+        def login():
+            session['user_id'] = 1
+            session['device_id'] = '78u001y'
+            return 'ok'
+
+        @app.route('/poll')
+        def poll():
+            return session.get('device_id')
+
+        return app
+
+    runs = 2000
+    for backend in SESSION_BACKENDS:
+        with tempfile.TemporaryDirectory() as folder:
+            app = make_app(backend, folder)
+            client = app.test_client()
+            client.get('/login')
+            timeit.timeit(lambda: client.get('/poll'), number=200)  # Warm up
+            seconds = timeit.timeit(lambda: client.get('/poll'), number=runs)
+            print(f"{backend:>10}: {seconds / runs * 1e6:7.1f} us/request")
+            if backend == 'sqlite':
+                app.session_interface.cache.flush()  # Before the folder is removed
@@ -0,0 +1,78 @@
+"""
+Device-hash sharding of the realtime store.
+
+With REALTIME_SHARDS = N > 1 the 'realtime' bind is split into binds realtime_0 ...
+realtime_<N-1>, one SQLite file each, and all of a device's RealTimeData, TotalConsumption
+and AggregateData rows live in the shard picked by crc32(device_ID) % N. Shards have
+their own writer lock, so devices on different shards are written in parallel.
+
+Queries on those models must go through shard_session(device_id) instead of Model.query
+or db.session. With N = 1 the single 'realtime' bind is used, as before sharding.
+"""
+import zlib
+
+from flask import current_app
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from . import db
+
+
+def realtime_binds(count):
+    """SQLALCHEMY_BINDS entries for a realtime store of `count` shards."""
+    if count == 1:
+        return {'realtime': 'sqlite:///realtime_data.db'}
+    return {f'realtime_{shard}': f'sqlite:///realtime_data_{shard}.db' for shard in range(count)}
+
+
+def shard_binds(app=None):
+    """Bind keys of every realtime shard."""
+    app = app or current_app
+    return list(realtime_binds(app.config['REALTIME_SHARDS']))
+
+
+def shard_index(device_id, count):
+    """Shard number of a device among `count` shards. Stable across restarts and processes."""
+    return zlib.crc32(device_id.encode()) % count
+
+
+def shard_bind(device_id):
+    """Bind key of the shard holding a device's data."""
+    count = current_app.config['REALTIME_SHARDS']
+    if count == 1:
+        return 'realtime'
+    return f'realtime_{shard_index(device_id, count)}'
+
+
+def shard_engine(device_id):
+    return db.get_engine(current_app, bind=shard_bind(device_id))
+
+
+def session_for_bind(bind):
+    """Scoped session of one shard, created on first use and removed at app context teardown."""
+    sessions = current_app.extensions.setdefault('realtime_shards', {})
+    session = sessions.get(bind)
+    if session is None:
+        session = sessions.setdefault(bind, scoped_session(sessionmaker(
+            bind=db.get_engine(current_app, bind=bind)
+        )))
+    return session
+
+
+def shard_session(device_id):
+    """Session for querying and saving a device's realtime models."""
+    return session_for_bind(shard_bind(device_id))
+
+
+def remove_shard_sessions(exception=None):
+    for session in current_app.extensions.get('realtime_shards', {}).values():
+        session.remove()
+
+
+def rollback_shard_sessions():
+    for session in current_app.extensions.get('realtime_shards', {}).values():
+        session.rollback()
+
+
+def init_shards(app):
+    """Release shard sessions at the end of every request and app context."""
+    app.teardown_appcontext(remove_shard_sessions)
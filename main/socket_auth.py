@@ -0,0 +1,31 @@
+from flask import current_app, request
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+socket_identities = {}  # Socket.IO sid -> identity from its connect token
+
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='sems-socket')
+
+
+def issue_socket_token(user):
+    """
+    Signed, short-lived token for the dashboard's Socket.IO connection. Carries what
+    socket handlers need, so they never read the session or auth.db.
+    """
+    return _serializer().dumps({"user_id": user.id, "device_id": user.device_id, "username": user.username})
+
+
+def verify_socket_token(token):
+    """Identity dict from a token, or None if it is missing, forged or expired."""
+    if not token:
+        return None
+    try:
+        return _serializer().loads(token, max_age=current_app.config['SOCKET_TOKEN_TTL'])
+    except BadSignature:  # Also covers SignatureExpired
+        return None
+
+
+def socket_identity():
+    """Identity of the socket handling the current event, None if it never authenticated."""
+    return socket_identities.get(request.sid)
@@ -1,12 +1,16 @@
-from flask import Blueprint, jsonify, request, session
-from .models import RealTimeData, User, Logs, TotalConsumption, AggregateData
-from . import db
-import requests
-from datetime import datetime, timezone, time
+from flask import Blueprint, current_app, jsonify, request, session
+from .models import RealTimeData, TotalConsumption, AggregateData
+from . import db, journal, ingest_queue, sequence_marks, ingest_workers, anomaly_detector, solar_scheduler
+from .wire import pack_snapshot
+from .events import record_state_changes, recent_logs, appliance_usage
+from .shards import shard_session, rollback_shard_sessions
+from .versions import bump_version, bump_on_commit, register_version_listeners, versioned_response
+from datetime import datetime, timedelta, timezone, time
 
 
 sems = Blueprint('main', __name__)
 
+# Appliance order here must match WIRE_APPLIANCES in main/wire.py
 AVERAGE_POWER_RATINGS = {
     'kitchen_light': 0.005,  # kW (5W)
     'dining_light': 0.005,  # kW
@@ -16,19 +20,23 @@ AVERAGE_POWER_RATINGS = {
     'tv': 0.04              # kW (40W)
 }
 
-# Global thread dictionary to track active devices and their start times
+solar_scheduler.power_ratings = AVERAGE_POWER_RATINGS  # Higher-power appliances pick their window first
+
+# Global thread dictionary to track active appliances and their start times, per device:
+# device_ID -> {appliance: start time}
 device_thread = {}
 
 
-def calculate_all_consumptions():
+def calculate_all_consumptions(device_id):
    
     consumptions = {}
+    appliance_thread = device_thread.get(device_id, {})
 
     # Current time for calculation
     now = datetime.utcnow()
 
     # Iterate through devices in the thread
-    for device_name, start_time in device_thread.items():
+    for device_name, start_time in appliance_thread.items():
         # Calculate time difference in hours
         duration_seconds = (now - start_time).total_seconds()
         duration_hours = duration_seconds / 3600  # Convert seconds to hours
@@ -43,7 +51,7 @@ def calculate_all_consumptions():
     # Add zeros for devices not in the thread
     all_devices = list(AVERAGE_POWER_RATINGS.keys())  # Ensure all devices are accounted for
     for device_name in all_devices:
-        if device_name not in device_thread:
+        if device_name not in appliance_thread:
             consumptions[device_name] = 0.0
 
     return consumptions
@@ -63,18 +71,41 @@ def save_simulated_data():
         # Step 2: Validate the data
         error = validate_data(data)
         if error:
-            return error
+            return jsonify(error[0]), error[1]
 
-        # Extract core fields
-        device_id = data['device_ID']
-        
         # Step 3: Check device ID consistency with session
-        error = check_session_device_id(device_id)
+        error = check_session_device_id(data['device_ID'])
+        if error:
+            return error
+
+        # Steps 4-9: Store the reading, or queue it for the ingest worker
+        body, status = submit_reading(data)
+        response = jsonify(body)
+        if status == 503:
+            response.headers['Retry-After'] = str(ingest_queue.retry_after)
+        return response, status
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+@ingest_queue.handler
+def ingest_reading(data):
+    """
+    Store one controller reading: log state changes, track consumption, save the realtime
+    record and update aggregates. Needs an app context but no request or session, so it
+    also runs on the ingest queue's worker. Returns a (body, status) pair.
+    """
+    try:
+        error = validate_data(data)
         if error:
             return error
 
-        # Step 4: Process device states and log changes
-        new_data, log_changes = process_device_states(device_id, data)
+        # Extract core fields
+        device_id = data['device_ID']
+
+        # Step 4: Process device states and find the changes
+        new_data, state_changes = process_device_states(device_id, data)
         
         # Step 5: Update device threads and calculate consumption
         update_device_threads(device_id, data["devices"])
@@ -82,9 +113,22 @@ def save_simulated_data():
         # Step 6: Save realtime data (high priority) - follows the same logic as original
         new_realtime_data = save_realtime_data(device_id, data)
         
-        # Step 7: Save logs if there are changes
-        if log_changes:
-            save_logs(device_id, log_changes)
+        # Step 7: Record the state changes as events
+        if state_changes:
+            save_state_changes(device_id, state_changes)
+
+        # Step 7b: Check battery drain and solar output for maintenance alerts
+        load_kw = sum(AVERAGE_POWER_RATINGS.get(name, 0) for name, state in data["devices"].items() if state == "ON")
+        try:
+            taken_at = data.get('taken_at')
+            anomaly_detector.update(device_id, float(data['battery_level']), float(data['solar_output']), load_kw,
+                                    now=None if taken_at is None else float(taken_at))
+        except (TypeError, ValueError) as e:
+            print(f"❌ Anomaly check skipped for {device_id}: {e}")
+
+        # Step 7c: Add the solar output to the device's profile for smart scheduling
+        if isinstance(data.get('solar_output'), (int, float)):
+            solar_scheduler.observe(device_id, data.get('counter'), data['solar_output'])
         
         # Step 8: Process incoming data (same as original)
         process_incoming_data11(device_id)
@@ -92,14 +136,66 @@ def save_simulated_data():
         # Step 9: Prepare response data
         saved_data = prepare_response_data(new_realtime_data)
         
-        return jsonify({"message": "Data processed and saved successfully", "data": saved_data}), 200
+        return {"message": "Data processed and saved successfully", "data": saved_data}, 200
 
     except Exception as e:
         db.session.rollback()
-        return jsonify({"error": str(e)}), 500
+        rollback_shard_sessions()
+        return {"error": str(e)}, 500
+
+def submit_reading(data):
+    """
+    Hand a reading to its device's ingest worker process or to the ingest queue, or store
+    it right away when both are disabled. Readings whose sequence number was already seen
+    are skipped; one that is not stored or queued keeps no mark, so its retry gets in.
+    Returns a (body, status) pair; 503 means the queue is full.
+    """
+    error = validate_data(data)
+    if error:
+        return error
+
+    if not sequence_marks.accept(data):
+        return {
+            "message": "Duplicate reading skipped",
+            "sequence": data.get("sequence"),
+            "duplicates_skipped": sequence_marks.stats["duplicates"]
+        }, 200
+
+    body, status = store_reading(data)
+    if not 200 <= status < 300:
+        # Not stored or queued: forget its sequence number so the controller's retry gets in
+        sequence_marks.release(data)
+    return body, status
+
+
+def store_reading(data):
+    """Dispatch a new reading to the worker processes or the queue, or ingest it right away."""
+    if ingest_workers.enabled:
+        if not ingest_workers.put(data):
+            return {"error": "Ingest worker queue is full, retry later"}, 503
+        return {"message": "Reading dispatched for processing"}, 202
+
+    if not ingest_queue.enabled:
+        return ingest_reading(data)
+
+    if not ingest_queue.put(data):
+        return {"error": "Ingest queue is full, retry later"}, 503
+    return {"message": "Reading queued for processing"}, 202
+
+
+@sems.route('/ingest/metrics', methods=['GET'])
+def ingest_metrics():
+    """Ingest queue depth and counters of processed, dropped, coalesced, rejected and duplicate readings."""
+    metrics = ingest_queue.metrics()
+    metrics["duplicates"] = sequence_marks.stats["duplicates"]
+    if ingest_workers.enabled:
+        metrics["ingest_workers"] = ingest_workers.metrics()
+    return jsonify(metrics), 200
+
 
 def fetch_simulated_data():
     """Fetch simulated data from the API."""
+    import requests  # Imported on first use, it is slow to import
     response = requests.get('http://127.0.0.1:5002/get_simulated_data')
     if response.status_code != 200:
         return None, jsonify({"error": f"Failed to fetch data: {response.status_code}"}), 400
@@ -110,7 +206,7 @@ def validate_data(data):
     required_fields = ['solar_output', 'battery_level', 'device_ID']
     missing_fields = [field for field in required_fields if field not in data]
     if missing_fields:
-        return jsonify({"error": f"Missing required fields: {', '.join(missing_fields)}"}), 400
+        return {"error": f"Missing required fields: {', '.join(missing_fields)}"}, 400
     return None
 
 def check_session_device_id(device_id):
@@ -125,31 +221,33 @@ def process_device_states(device_id, data):
     devices = data.get('devices', {})
     new_data = {f"{device}_state": details for device, details in devices.items()}
     
-    # Query the latest record for the device
-    earlier_record = RealTimeData.query.filter_by(device_ID=device_id).order_by(RealTimeData.timestamp.desc()).first()
+    # Query the latest record for the device - the journal has it first when it is not loaded yet
+    earlier_record = journal.latest.get(device_id) or shard_session(device_id).query(RealTimeData) \
+        .filter_by(device_ID=device_id).order_by(RealTimeData.timestamp.desc()).first()
     
-    log_changes = []
+    state_changes = []
     if earlier_record:
         # Process changes if an earlier record exists
         for key, new_value in new_data.items():
             old_value = getattr(earlier_record, key, None)
             device_name = key.replace('_state', '')
             if old_value != new_value:
-                log_changes.append(f"{device_name} turned {new_value}")
+                state_changes.append((device_name, new_value))
     
-    return new_data, log_changes
+    return new_data, state_changes
 
 def update_device_threads(device_id, devices):
     """Update device threads and calculate consumption for devices turning off."""
+    appliance_thread = device_thread.setdefault(device_id, {})
     for device_name, state in devices.items():
         if state == "ON":
             # Device is ON
-            if device_name not in device_thread:
+            if device_name not in appliance_thread:
                 # Add to thread with the current timestamp
-                device_thread[device_name] = datetime.utcnow()
-        elif state == "OFF" and device_name in device_thread:
+                appliance_thread[device_name] = datetime.utcnow()
+        elif state == "OFF" and device_name in appliance_thread:
             # Device is OFF and is in the thread
-            start_time = device_thread.pop(device_name)  # Remove from thread and get start time
+            start_time = appliance_thread.pop(device_name)  # Remove from thread and get start time
             
             # Calculate final consumption
             duration_seconds = (datetime.utcnow() - start_time).total_seconds()
@@ -170,29 +268,14 @@ def save_consumption_record(device_id, device_name, energy_consumed, start_time)
         end_time=datetime.utcnow(),
         timestamp=datetime.utcnow()
     )
-    db.session.add(new_consumption_record)
-    db.session.commit()
-
-def save_logs(device_id, log_changes):
-    """Save log changes to the database and cleanup old logs."""
-    # Add the new log entry
-    log_entry = Logs(
-        device_ID=device_id,
-        timestamp=datetime.utcnow(),
-        changes="\n".join(log_changes)
-    )
-    db.session.add(log_entry)
-    db.session.commit()
-
-    # Cleanup step: keep only the latest 15 logs for the device
-    logs_to_delete = Logs.query.filter_by(device_ID=device_id) \
-        .order_by(Logs.timestamp.desc()) \
-        .offset(15).all()
+    session = shard_session(device_id)
+    session.add(new_consumption_record)
+    session.commit()
 
-    # Delete the older logs
-    for log in logs_to_delete:
-        db.session.delete(log)
-    db.session.commit()
+def save_state_changes(device_id, state_changes):
+    """Store a reading's (appliance, new state) changes as events and send the device's logs."""
+    if record_state_changes(device_id, state_changes):
+        publish_logs(device_id)
 
 def save_realtime_data(device_id, data):
     """Save data to the RealTimeData table."""
@@ -200,7 +283,7 @@ def save_realtime_data(device_id, data):
     battery_level = data.get('battery_level')
     
     # Calculate consumption
-    consumptions = calculate_all_consumptions()
+    consumptions = calculate_all_consumptions(device_id)
     
     # Prepare a new record for RealTimeData
     new_realtime_data = RealTimeData(
@@ -216,9 +299,18 @@ def save_realtime_data(device_id, data):
         }
     )
     
-    # Save the new real-time data record
-    db.session.add(new_realtime_data)
-    db.session.commit()
+    if journal.enabled:
+        # The loader bulk inserts it later without the ORM, so the insert listeners
+        # won't see it - queue the dashboard snapshot now
+        journal.append(new_realtime_data)
+        bump_version(device_id, 'realtime')  # journal.latest already serves it
+        emit_data_to_room(new_realtime_data)
+        return new_realtime_data
+    
+    # Save the new real-time data record in the device's shard
+    session = shard_session(device_id)
+    session.add(new_realtime_data)
+    session.commit()
     
     return new_realtime_data
 
@@ -241,8 +333,9 @@ def prepare_response_data(new_realtime_data):
 
 
 
-from sqlalchemy.event import listen
-from . import socketio  # Import your existing socketio instance
+from sqlalchemy.event import contains, listen
+from sqlalchemy.orm import Session, object_session
+from . import socketio, emitter  # Import your existing socketio instance
 
 
 @sems.route('/fetch_database_data', methods=['GET'])
@@ -254,267 +347,541 @@ def fetch_latest_data():
         if not device_id:
             return jsonify({"error": "device_ID is required"}), 400
 
-        # Query the latest record for the specified device ID
-        latest_record = RealTimeData.query.filter_by(device_ID=device_id).order_by(RealTimeData.timestamp.desc()).first()
-
-        if latest_record:
-            data = {
-                "timestamp": latest_record.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-                "battery_level": latest_record.battery_level,
-                "solar_output": latest_record.solar_output,
-                "devices": {
-                    "kitchen_light": {
-                        "state": latest_record.kitchen_light_state,
-                        "consumption": latest_record.kitchen_light_consumption
-                    },
-                    "dining_light": {
-                        "state": latest_record.dining_light_state,
-                        "consumption": latest_record.dining_light_consumption
-                    },
-                    "bed_light": {
-                        "state": latest_record.bed_light_state,
-                        "consumption": latest_record.bed_light_consumption
-                    },
-                    "security_light": {
-                        "state": latest_record.security_light_state,
-                        "consumption": latest_record.security_light_consumption
-                    },
-                    "sound_system": {
-                        "state": latest_record.sound_system_state,
-                        "consumption": latest_record.sound_system_consumption
-                    },
-                    "tv": {
-                        "state": latest_record.tv_state,
-                        "consumption": latest_record.tv_consumption
-                    }
-                }
-            }
-            return jsonify(data), 200
-        else:
-            return jsonify({"error": "No data found for the specified device_ID"}), 404
+        def build():
+            # Query the latest record for the specified device ID, the journal's if it is not loaded yet
+            latest_record = journal.latest.get(device_id) or shard_session(device_id).query(RealTimeData) \
+                .filter_by(device_ID=device_id).order_by(RealTimeData.timestamp.desc()).first()
+
+            if latest_record:
+                return serialize_snapshot(latest_record), 200
+            return {"error": "No data found for the specified device_ID"}, 404
+
+        # Polling clients that already have the latest reading get a 304
+        return versioned_response(device_id, ('realtime',), build)
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500  # ✅ Fixed error message key
 
-def emit_data_to_room(data, user_id):
+
+@sems.route('/history', methods=['GET'])
+def fetch_history():
+    """Today's battery and solar readings (since 6 AM), averaged down to ?points= (0 for all)."""
+    device_id = session.get('device_id')
+    if not device_id:
+        return jsonify({"error": "device_ID is required"}), 400
+    points = request.args.get('points', DAY_CHART_POINTS, type=int)
+    today_six_am = get_today_six_am()
+
+    def build():
+        history = day_chart_points(device_id, today_six_am)
+        return {"data": downsample(history, points) if points > 0 else history}, 200
+
+    # The day is part of the tag, the same counters mean a different chart after 6 AM
+    return versioned_response(device_id, ('realtime',), build, extra=today_six_am.strftime('-%Y%m%d'))
+
+
+@sems.route('/logs', methods=['GET'])
+def fetch_logs():
+    """The device's latest 15 logs, newest first."""
+    device_id = session.get('device_id')
+    if not device_id:
+        return jsonify({"error": "device_ID is required"}), 400
+    return versioned_response(device_id, ('logs',), lambda: ({"logs": recent_logs(device_id)}, 200))
+
+
+MAX_USAGE_DAYS = 3650  # Longest usage window when EVENT_RETENTION_DAYS is 0 (events kept forever)
+
+
+@sems.route('/appliance_usage', methods=['GET'])
+def fetch_appliance_usage():
+    """
+    Toggle count and ON time per appliance over the last ?days= (default 7), at most the
+    event retention period, or MAX_USAGE_DAYS when events are kept forever.
+    """
+    device_id = session.get('device_id')
+    if not device_id:
+        return jsonify({"error": "device_ID is required"}), 400
+    days = request.args.get('days', 7, type=float)
+    max_days = current_app.config['EVENT_RETENTION_DAYS'] or MAX_USAGE_DAYS
+    if not 0 < days <= max_days:  # Also rejects nan and inf
+        return jsonify({"error": f"days must be above 0 and at most {max_days:g}"}), 400
+
+    until = datetime.utcnow()
+    since = until - timedelta(days=days)
+    return jsonify({
+        "since": since.strftime("%Y-%m-%d %H:%M:%S"),
+        "until": until.strftime("%Y-%m-%d %H:%M:%S"),
+        "appliances": appliance_usage(device_id, since, until)
+    }), 200
+
+
+@sems.route('/appliance_schedule', methods=['GET'])
+def fetch_appliance_schedule():
+    """The device's scheduled windows for deferrable appliances, null until enough solar history."""
+    device_id = session.get('device_id')
+    if not device_id:
+        return jsonify({"error": "device_ID is required"}), 400
+    return jsonify({"device_ID": device_id, "windows": solar_scheduler.schedule_for(device_id)}), 200
+
+
+@sems.route('/aggregates', methods=['GET'])
+def fetch_aggregates():
+    """Per-appliance energy of the device's latest aggregate, highest first."""
+    device_id = session.get('device_id')
+    if not device_id:
+        return jsonify({"error": "device_ID is required"}), 400
+
+    def build():
+        aggregated = latest_aggregated_data(device_id)
+        if aggregated is None:
+            last_aggregate = shard_session(device_id).query(AggregateData).filter_by(device_id=device_id) \
+                .order_by(AggregateData.timestamp.desc()).first()
+            if last_aggregate is None or not last_aggregate.devices_total_consumption:
+                return {"error": "No aggregates found for the specified device_ID"}, 404
+            sorted_devices = sorted(last_aggregate.devices_total_consumption.items(), key=lambda x: x[1], reverse=True)
+            aggregated = {"devices": [{"device_name": name, "energy_consumed": energy} for name, energy in sorted_devices]}
+        return aggregated, 200
+
+    return versioned_response(device_id, ('aggregates',), build)
+
+def user_room(user_id):
+    """Room for events addressed to one user, such as shutdown progress."""
+    return f"user_{user_id}"
+
+
+def device_rooms(device_id):
+    """
+    Rooms for a device's clients, one per wire encoding chosen at connect.
+    JSON clients use the plain device room, packed clients the _packed one.
+    Routing by device means readings can be pushed without a request session.
+    """
+    return {
+        "json": f"device_{device_id}",
+        "packed": f"device_{device_id}_packed"
+    }
+
+
+def queue_user_update(user_id, event, payload):
+    """Queue an event for a user's room."""
+    emitter.queue(user_room(user_id), event, payload)
+
+
+def queue_device_update(device_id, event, payload, packed_payload=None):
+    """
+    Queue an event for every encoding room of a device. Events without a packed
+    form are sent to packed clients unchanged.
+    """
+    rooms = device_rooms(device_id)
+    emitter.queue(rooms["json"], event, payload)
+    emitter.queue(rooms["packed"], event, payload if packed_payload is None else packed_payload)
+
+
+# Last payloads sent per device, embedded in /home so the dashboard renders without waiting
+# for its first fetch and socket events (see initial_dashboard_state). Entries built from a
+# flush are stored by cache_on_commit, so a rolled back reading is never embedded.
+latest_snapshots = {}  # device_ID -> snapshot dict
+latest_logs = {}  # device_ID -> latest 15 logs
+latest_day_charts = {}  # device_ID -> (6 AM of the chart's day, downsampled points)
+
+DAY_CHART_POINTS = 300  # Points in the embedded day chart, readings are averaged down to it
+
+
+def cache_on_commit(target, cache, key, value):
+    """Set cache[key] once target's session commits, or right away when it is in none."""
+    session = object_session(target) if target is not None else None
+    if session is None:
+        cache[key] = value
+    else:
+        session.info.setdefault('dashboard_caches', []).append((cache, key, value))
+
+
+def serialize_snapshot(record):
+    """Build the dashboard JSON snapshot for a RealTimeData record."""
+    return {
+        "timestamp": record.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+        "battery_level": record.battery_level,
+        "solar_output": record.solar_output,
+        "devices": {
+            device: {
+                "state": getattr(record, f"{device}_state"),
+                "consumption": getattr(record, f"{device}_consumption")
+            }
+            for device in AVERAGE_POWER_RATINGS.keys()
+        }
+    }
+
+
+def emit_data_to_room(record):
     """
-    Emits data via WebSocket to a specific user's room.
+    Queues a snapshot for the rooms of the record's device; it goes out with the room's next coalesced frame.
+    JSON clients get the snapshot dict, packed clients the binary record from main.wire.
     
     Args:
-        data: The data payload to emit
-        user_id: The user ID to target
+        record: The RealTimeData record to send
     """
-    user_room = f"user_{user_id}"
-    socketio.emit('database_update', data, room=user_room)
-    print(f"✅ WebSocket Event Emitted to room: {user_room}")
+    snapshot = serialize_snapshot(record)
+    cache_on_commit(record, latest_snapshots, record.device_ID, snapshot)
+    queue_device_update(record.device_ID, 'database_update', snapshot, pack_snapshot(record))
+    print(f"✅ WebSocket Event queued for device: {record.device_ID}")
 
 
 def on_data_update(mapper, connection, target):
     print("🔥 on_data_update triggered!") # Debugging log
-    user_id = session.get('user_id') # Retrieve user_id from session
-    
-    if not user_id:
-        print("❌ No user_id found in session.")
-        return # If no user is logged in, do nothing
-        
     latest_record = target # The new data entry
     print(f"🆕 New Data Received: {latest_record.device_ID}") # Debugging
     
-    user = User.query.get(user_id) # Fetch user details
-    if not user:
-        print("❌ User not found in database.")
-        return # If the user does not exist, stop
-        
-    if latest_record.device_ID != user.device_id:
-        print("❌ Device ID mismatch. Ignoring update.")
-        return # Ignore updates that don't match the user's device
-        
-    print("✅ Emitting WebSocket event...") # Debugging
-    
-    data = {
-        "timestamp": latest_record.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-        "battery_level": latest_record.battery_level,
-        "solar_output": latest_record.solar_output,
-        "devices": {
-            "kitchen_light": {
-                "state": latest_record.kitchen_light_state,
-                "consumption": latest_record.kitchen_light_consumption
-            },
-            "dining_light": {
-                "state": latest_record.dining_light_state,
-                "consumption": latest_record.dining_light_consumption
-            },
-            "bed_light": {
-                "state": latest_record.bed_light_state,
-                "consumption": latest_record.bed_light_consumption
-            },
-            "security_light": {
-                "state": latest_record.security_light_state,
-                "consumption": latest_record.security_light_consumption
-            },
-            "sound_system": {
-                "state": latest_record.sound_system_state,
-                "consumption": latest_record.sound_system_consumption
-            },
-            "tv": {
-                "state": latest_record.tv_state,
-                "consumption": latest_record.tv_consumption
-            }
-        }
-    }
-    
-    # Call the emit function with the user_id using background task
-    socketio.start_background_task(emit_data_to_room, data, user_id)
-
+    # Only clients of this device are in its rooms, so no user lookup is needed
+    emit_data_to_room(latest_record)
+    bump_on_commit(target, latest_record.device_ID, 'realtime')
 
-listen(RealTimeData, 'after_insert', on_data_update)
-listen(RealTimeData, 'after_update', on_data_update)
     
-def emit_logs_to_room(logs_data, user_id=None):
+def emit_logs_to_room(logs_data, device_id):
     """
-    Emits log data via WebSocket to a specific user's room or all users.
+    Emits log data via WebSocket to the rooms of a device.
     
     Args:
         logs_data: The log entries to emit
-        user_id: The user ID to target (optional)
+        device_id: The device the logs belong to
     """
-    if user_id:
-        user_room = f"user_{user_id}"
-        socketio.emit('log_update', {"logs": logs_data}, room=user_room)
-        print(f"✅ Log update emitted to room: {user_room}")
-    else:
-        socketio.emit('log_update', {"logs": logs_data})
-        print("✅ Log update broadcasted to all connected clients")
+    queue_device_update(device_id, 'log_update', {"logs": logs_data})
+    print(f"✅ Log update queued for device: {device_id}")
 
 
-def on_log_insert(mapper, connection, target):
-    """Query the latest logs when a new log is inserted."""
-    device_id = target.device_ID  # Get the device ID from the new log entry
+def publish_logs(device_id):
+    """Render the latest logs from the committed events, cache them and queue them for the device."""
+    logs_list = recent_logs(device_id)
+    latest_logs[device_id] = logs_list
+    bump_version(device_id, 'logs')
     
-    if 'device_id' in session and session['device_id'] == device_id:
-        # Get the user_id from session
-        user_id = session.get('user_id')
-        
-        # Query the latest 15 logs for the device
-        logs = Logs.query.filter_by(device_ID=device_id).order_by(Logs.timestamp.desc()).limit(15).all()
-        logs_list = [
-            {
-                "timestamp": log.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-                "changes": log.changes
-            }
-            for log in logs
-        ]
-        
-        # Call the emission function using background task
-        socketio.start_background_task(emit_logs_to_room, logs_list, user_id)
-listen(Logs, 'after_insert', on_log_insert)
+    # Queue the logs for the device's next frame
+    emit_logs_to_room(logs_list, device_id)
 
 
 
+# Last ranking sent per device, so unchanged aggregates are not re-sent
+last_aggregate_ranking = {}
+
+
 def on_aggregate_insert(mapper, connection, target):
     """Prepare new aggregated consumption data when a new record is inserted."""
     try:
         device_id = target.device_id  # Get device ID from the new aggregate entry
 
-        # Retrieve the latest aggregate entry for the device
-        latest_aggregate = AggregateData.query.filter_by(device_id=device_id).order_by(AggregateData.timestamp.desc()).first()
-        
-        if not latest_aggregate or not latest_aggregate.devices_total_consumption:
+        # The inserted row already is the latest aggregate, no need to query it back
+        if not target.devices_total_consumption:
             return  # No valid data to emit
 
         # Sort devices by energy consumed (highest first)
-        sorted_devices = sorted(latest_aggregate.devices_total_consumption.items(), key=lambda x: x[1], reverse=True)
+        sorted_devices = sorted(target.devices_total_consumption.items(), key=lambda x: x[1], reverse=True)
 
         # Convert to JSON format for frontend
         sorted_consumption = [{"device_name": name, "energy_consumed": energy} for name, energy in sorted_devices]
 
-        # ✅ Store data in a global queue (or call a separate function to emit later)
-        socketio.start_background_task(emit_aggregated_data, sorted_consumption)
-        print('some data were sent here///////////////////////////////////////////////////')
+        # Only send when the ranking, as the dashboard shows it (4 decimals), has changed
+        ranking = [(name, round(energy, 4)) for name, energy in sorted_devices]
+        previous = last_aggregate_ranking.get(device_id)
+        if previous and previous[0] == ranking:
+            return
+        bump_on_commit(target, device_id, 'aggregates')
+
+        # Cache and send the ranking once the insert commits; a rolled back insert must not
+        # suppress the next identical ranking
+        session = object_session(target)
+        if session is None:
+            publish_ranking(device_id, ranking, sorted_consumption)
+        else:
+            session.info.setdefault('aggregate_rankings', {})[device_id] = (ranking, sorted_consumption)
 
     except Exception as e:
         print(f"❌ Error in on_aggregate_insert: {e}")
 
-# Attach event listener for aggregation data insertions
-listen(AggregateData, 'after_insert', on_aggregate_insert)
 
+def publish_ranking(device_id, ranking, sorted_consumption):
+    """Remember a committed ranking and queue it for the device's next frame, unless it was already sent."""
+    previous = last_aggregate_ranking.get(device_id)
+    if previous and previous[0] == ranking:
+        return
+    last_aggregate_ranking[device_id] = (ranking, sorted_consumption)
+    emit_aggregated_data(device_id, sorted_consumption)
+
+
+def on_session_commit(session):
+    for cache, key, value in session.info.pop('dashboard_caches', ()):
+        cache[key] = value
+    for device_id, (ranking, sorted_consumption) in session.info.pop('aggregate_rankings', {}).items():
+        publish_ranking(device_id, ranking, sorted_consumption)
 
-def emit_aggregated_data(sorted_consumption):
-    """Emit aggregated consumption data in a valid WebSocket context."""
-    socketio.emit('aggregated_consumption_update', {"devices": sorted_consumption})
-    print('some aggregated were sent forwar👴')
 
+def on_session_rollback(session):
+    session.info.pop('dashboard_caches', None)
+    session.info.pop('aggregate_rankings', None)
 
 
+def emit_aggregated_data(device_id, sorted_consumption):
+    """Queue aggregated consumption data for the clients of the owning device only."""
+    queue_device_update(device_id, 'aggregated_consumption_update', {"devices": sorted_consumption})
+    print(f'Aggregated consumption queued for device: {device_id}')
 
 
-def emit_battery_solar_update(data_batch, user_id):
+def latest_aggregated_data(device_id):
+    """Last ranking sent for a device, used to bring newly connected clients up to date."""
+    cached = last_aggregate_ranking.get(device_id)
+    return {"devices": cached[1]} if cached else None
+
+
+
+
+def emit_battery_solar_update(data_batch, device_id):
     """
-    Emit battery and solar data for a specific device in a batch to a user's room.
+    Emit battery and solar data for a specific device in a batch to the device's rooms.
     
     Args:
         data_batch: List of data points to emit
-        user_id: The user ID to target
+        device_id: The device the data belongs to
     """
-    user_room = f"user_{user_id}"
-    socketio.emit('battery_solar_update', {
+    queue_device_update(device_id, 'battery_solar_update', {
         "data": data_batch  # Sending the entire batch as a list
-    }, room=user_room)
-    print(f'Emitted {len(data_batch)} data points to room: {user_room}')
+    })
+    print(f'Queued {len(data_batch)} data points for device: {device_id}')
     print('I emitted some data for the solar and battery graph')
 
 
-def on_realtime_insert(mapper, connection, target):
-    """Listener for new inserts into RealTimeData table."""
-    user_id = session.get('user_id')  # Get user_id from session
-    session_device_id = session.get('device_id')  # Get device_id from session
-    
-    if not session_device_id or session_device_id != target.device_ID:
-        return  # Skip if session device doesn't match target
-    
+def day_chart_points(device_id, since):
+    """Battery and solar readings of a device since `since`, oldest first."""
+    entries = shard_session(device_id).query(RealTimeData).filter(
+        RealTimeData.device_ID == device_id,
+        RealTimeData.timestamp >= since
+    ).order_by(RealTimeData.timestamp).all()
+    return [
+        {
+            "timestamp": entry.timestamp.isoformat(),
+            "battery_level": entry.battery_level,
+            "solar_output": entry.solar_output
+        }
+        for entry in entries
+    ]
+
+
+def downsample(points, limit=DAY_CHART_POINTS):
+    """Average runs of consecutive points down to at most `limit`, each stamped with its run's last timestamp."""
+    if len(points) <= limit:
+        return points
+    size = -(-len(points) // limit)  # Points per run, rounded up
+    averaged = []
+    for start in range(0, len(points), size):
+        run = points[start:start + size]
+        averaged.append({
+            "timestamp": run[-1]["timestamp"],
+            "battery_level": sum(point["battery_level"] for point in run) / len(run),
+            "solar_output": sum(point["solar_output"] for point in run) / len(run)
+        })
+    return averaged
+
+
+def emit_day_chart(device_id, target=None):
+    """
+    Queue today's battery and solar readings (since 6 AM) for the device's rooms. The
+    downsampled chart is cached once `target`, the inserted reading, is committed.
+    """
     try:
         # Get the timestamp for today's 6 AM
         today_six_am = get_today_six_am()
-        # Fetch all real-time entries for this device after 6 AM
-        entries = db.session.query(RealTimeData).filter(
-            RealTimeData.device_ID == target.device_ID,
-            RealTimeData.timestamp >= today_six_am
-        ).order_by(RealTimeData.timestamp).all()
+        # All real-time entries for this device after 6 AM, in JSON format (batch emit)
+        data_batch = day_chart_points(device_id, today_six_am)
         
-        if entries:
-            # Convert data to JSON format (batch emit)
-            data_batch = [
-                {
-                    "timestamp": entry.timestamp.isoformat(),
-                    "battery_level": entry.battery_level,
-                    "solar_output": entry.solar_output
-                }
-                for entry in entries
-            ]
-            
-            # Emit all data in a single batch using background task
-            # Pass user_id to the emit function for room targeting
-            socketio.start_background_task(
-                emit_battery_solar_update,
+        if data_batch:
+            cache_on_commit(target, latest_day_charts, device_id, (today_six_am, downsample(data_batch)))
+
+            # Queue all data in a single batch for the device's rooms
+            emit_battery_solar_update(
                 data_batch,  # Sending as a list
-                user_id      # Passing user_id for room targeting
+                device_id
             )
     except Exception as e:
-        print(f"Error in on_realtime_insert: {e}")
+        print(f"Error in emit_day_chart: {e}")
+
+
+def on_realtime_insert(mapper, connection, target):
+    """Listener for new inserts into RealTimeData table."""
+    emit_day_chart(target.device_ID, target)
+
+
+# Model listeners that push updates to the dashboards, attached by create_app
+MODEL_LISTENERS = [
+    (RealTimeData, 'after_insert', on_data_update),
+    (RealTimeData, 'after_update', on_data_update),
+    (AggregateData, 'after_insert', on_aggregate_insert),
+    (RealTimeData, 'after_insert', on_realtime_insert),
+    (Session, 'after_commit', on_session_commit),
+    (Session, 'after_rollback', on_session_rollback),
+]
+
+
+def register_listeners():
+    """Attach MODEL_LISTENERS once per process, so importing this module has no side effects."""
+    for model, event, listener in MODEL_LISTENERS:
+        if not contains(model, event, listener):
+            listen(model, event, listener)
+    register_version_listeners()
+
+
+def initial_dashboard_state(device_id):
+    """
+    What the dashboard shows first - latest snapshot, downsampled day chart, latest logs and
+    aggregates - for embedding in /home. Served from the caches above, which are kept
+    whenever updates are sent; the database is only read for devices without updates
+    since this process started (or whose updates are stored by ingest workers).
+    """
+    snapshot = latest_snapshots.get(device_id)
+    if snapshot is None:
+        record = journal.latest.get(device_id) or shard_session(device_id).query(RealTimeData) \
+            .filter_by(device_ID=device_id).order_by(RealTimeData.timestamp.desc()).first()
+        snapshot = serialize_snapshot(record) if record else None
+
+    today_six_am = get_today_six_am()
+    cached_chart = latest_day_charts.get(device_id)
+    if cached_chart and cached_chart[0] == today_six_am:
+        day_chart = cached_chart[1]
+    else:
+        day_chart = downsample(day_chart_points(device_id, today_six_am))
+
+    logs = latest_logs.get(device_id)
+    if logs is None:
+        logs = recent_logs(device_id)
+
+    aggregated = latest_aggregated_data(device_id)
+    return {
+        "snapshot": snapshot,
+        "day_chart": day_chart or None,
+        "logs": logs,
+        "aggregates": aggregated
+    }
+
+
+@anomaly_detector.on_alert
+def on_maintenance_alert(device_id, alert):
+    """Send maintenance alerts to the device owner's dashboards."""
+    queue_device_update(device_id, 'maintenance_alert', alert)
 
 
-# Attach listener to RealTimeData table
-listen(RealTimeData, 'after_insert', on_realtime_insert)
+@solar_scheduler.on_schedule
+def push_schedules(schedules):
+    """
+    Send changed appliance windows to the controllers in one request. A failed request
+    makes the scheduler retry; devices the controller rejects are reported, not retried,
+    until their schedule changes again.
+    """
+    import requests
+    response = requests.put(f"{SIMULATOR_API_URL}/device_schedules", json={"schedules": schedules}, timeout=10)
+    response.raise_for_status()
+    result = response.json()
+    if result.get("unknown"):
+        print(f"⚠️ Controller doesn't know devices {', '.join(result['unknown'])}, their schedules were not applied")
+    for device_id, error in result.get("invalid", {}).items():
+        print(f"❌ Controller rejected the schedule for {device_id}: {error}")
+
+
+@journal.on_load
+def on_journal_load(device_ids):
+    """Journaled readings bypass the insert listeners; refresh the day chart once per loaded batch."""
+    for device_id in device_ids:
+        bump_version(device_id, 'realtime')
+        emit_day_chart(device_id)
     
     
     
 SIMULATOR_API_URL = "http://localhost:5002"  # The URL of the micro-control simulator
 
+
+# Request validation and response mapping shared with the async endpoints in semsasgi.py
+
+def validate_control_request(data):
+    """Return an (error, status) pair if a control request is missing fields, else None."""
+    required_fields = ["device_ID", "device_name", "control_action"]
+    for field in required_fields:
+        if field not in data:
+            return {"error": f"Missing required field: {field}"}, 400
+    return None
+
+def prepare_batch_control_request(data, session_device_id=None):
+    """
+    Fill in the session device_ID where a batch command or scene has none, and validate
+    every command. Returns an (error, status) pair if the batch is invalid, else None.
+    """
+    if not data.get("commands") and not data.get("scene"):
+        return {"error": "No commands or scene provided"}, 400
+
+    if data.get("scene") and "device_ID" not in data and session_device_id:
+        data["device_ID"] = session_device_id
+
+    for index, command in enumerate(data.get("commands", [])):
+        if "device_ID" not in command and session_device_id:
+            command["device_ID"] = session_device_id
+        error = validate_control_request(command)
+        if error:
+            return {"error": f"{error[0]['error']} in command {index}"}, error[1]
+    return None
+
+def validate_shutdown_request(data):
+    """Return an (error, status) pair if an emergency shutdown request is invalid, else None."""
+    required_fields = ["action", "timestamp"]
+    for field in required_fields:
+        if field not in data:
+            return {"error": f"Missing required field: {field}"}, 400
+
+    if data["action"] != "shutdown":
+        return {"error": "Invalid action type. Expected 'shutdown'"}, 400
+    return None
+
+def shutdown_acknowledgement(job_id=None):
+    """Response sent once the control system has accepted a shutdown request."""
+    return {
+        "status": "acknowledged",
+        "message": "Emergency shutdown request received and processing",
+        "timestamp": datetime.now().isoformat(),
+        "job_id": job_id
+    }
+
+def shutdown_progress(job):
+    """Build the emergency_shutdown_progress payload from a simulator shutdown job summary."""
+    if job["status"] == "completed":
+        message = f"Emergency shutdown completed: {job['acknowledged']}/{job['total']} devices acknowledged"
+    elif job["status"] == "failed":
+        message = f"Emergency shutdown failed on {job['failed']} of {job['total']} devices"
+    else:
+        message = f"Shutdown in progress: {job['acknowledged']}/{job['total']} devices acknowledged"
+
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "progress": job["progress"],
+        "acknowledged": job["acknowledged"],
+        "failed": job["failed"],
+        "total": job["total"],
+        "message": message
+    }
+
+def map_shutdown_status(simulator_status):
+    """Map the simulator status format to what the frontend expects."""
+    status_data = {
+        "status": "completed" if simulator_status["success"] else "failed",
+        "message": simulator_status["message"],
+        "timestamp": simulator_status["timestamp"]
+    }
+
+    # Add progress info if available
+    if "progress" in simulator_status:
+        status_data["progress"] = simulator_status["progress"]
+
+    return status_data
+
+
 @sems.route('/proxy_device_control', methods=['POST'])
 def proxy_device_control():
     """
     Proxy endpoint to forward device control requests to the simulator API
     """
+    import requests
     try:
         # Get data from the client request
         data = request.get_json()
@@ -527,10 +894,9 @@ def proxy_device_control():
             data["device_ID"] = session.get("device_id")
         
         # Required fields
-        required_fields = ["device_ID", "device_name", "control_action"]
-        for field in required_fields:
-            if field not in data:
-                return jsonify({"error": f"Missing required field: {field}"}), 400
+        error = validate_control_request(data)
+        if error:
+            return jsonify(error[0]), error[1]
         
         # Forward the request to the simulator API
         response = requests.post(
@@ -550,11 +916,44 @@ def proxy_device_control():
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
         
 
+@sems.route('/proxy_device_control/batch', methods=['POST'])
+def proxy_batch_device_control():
+    """
+    Proxy endpoint to forward many control commands, or a named scene, to the simulator
+    in a single request. The simulator coalesces commands per appliance and returns
+    one result per command.
+    """
+    import requests
+    try:
+        data = request.get_json()
+
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+
+        error = prepare_batch_control_request(data, session.get("device_id"))
+        if error:
+            return jsonify(error[0]), error[1]
+
+        response = requests.post(
+            f"{SIMULATOR_API_URL}/control_devices",
+            json=data,
+            headers={"Content-Type": "application/json"}
+        )
+
+        return response.json(), response.status_code
+
+    except requests.RequestException as e:
+        return jsonify({"error": f"Failed to connect to simulator API: {str(e)}"}), 500
+    except Exception as e:
+        return jsonify({"error": f"An error occurred: {str(e)}"}), 500
+
+
 @sems.route('/api/emergency-shutdown', methods=['POST'])
 def emergency_shutdown():
     """
     Endpoint to receive and forward emergency shutdown requests to the simulator API
     """
+    import requests
     try:
         # Get data from the client request
         data = request.get_json()
@@ -562,15 +961,10 @@ def emergency_shutdown():
         if not data:
             return jsonify({"error": "No data provided"}), 400
        
-        # Validate required fields
-        required_fields = ["action", "timestamp"]
-        for field in required_fields:
-            if field not in data:
-                return jsonify({"error": f"Missing required field: {field}"}), 400
-       
-        # Validate action type
-        if data["action"] != "shutdown":
-            return jsonify({"error": "Invalid action type. Expected 'shutdown'"}), 400
+        # Validate required fields and action type
+        error = validate_shutdown_request(data)
+        if error:
+            return jsonify(error[0]), error[1]
            
         # Forward the request to the simulator API
         response = requests.post(
@@ -579,13 +973,12 @@ def emergency_shutdown():
             headers={"Content-Type": "application/json"}
         )
        
-        # First response to acknowledge receipt
+        # First response to acknowledge receipt, progress is pushed over Socket.IO
         if response.status_code == 200:
-            return jsonify({
-                "status": "acknowledged",
-                "message": "Emergency shutdown request received and processing",
-                "timestamp": datetime.now().isoformat()
-            }), 200
+            job_id = response.json().get("job_id")
+            if job_id:
+                socketio.start_background_task(track_shutdown_job, job_id, session.get('user_id'))
+            return jsonify(shutdown_acknowledgement(job_id)), 200
         else:
             # Return error from simulator
             return response.json(), response.status_code
@@ -608,25 +1001,13 @@ def check_shutdown_status():
     """
     Endpoint to poll and forward status requests to the simulator API
     """
+    import requests
     try:
         # Forward the status request to the simulator API
         response = requests.get(f"{SIMULATOR_API_URL}/shutdown_status")
         
         if response.status_code == 200:
-            simulator_status = response.json()
-            
-            # Map simulator status format to what the frontend expects
-            status_data = {
-                "status": "completed" if simulator_status["success"] else "failed",
-                "message": simulator_status["message"],
-                "timestamp": simulator_status["timestamp"]
-            }
-            
-            # Add progress info if available
-            if "progress" in simulator_status:
-                status_data["progress"] = simulator_status["progress"]
-                
-            return jsonify(status_data), 200
+            return jsonify(map_shutdown_status(response.json())), 200
         else:
             return response.json(), response.status_code
             
@@ -641,6 +1022,40 @@ def check_shutdown_status():
             "message": f"An error occurred: {str(e)}"
         }), 500
 
+SHUTDOWN_TRACK_INTERVAL = 0.25  # seconds between job checks
+SHUTDOWN_TRACK_TIMEOUT = 30  # seconds before a job that is still running is reported as failed
+
+def track_shutdown_job(job_id, user_id):
+    """
+    Follow a shutdown job on the control system and push every change in progress to the
+    user's rooms as emergency_shutdown_progress, until it completes, fails or times out.
+    """
+    import requests
+    deadline = datetime.now().timestamp() + SHUTDOWN_TRACK_TIMEOUT
+    last_progress = None
+
+    while True:
+        try:
+            response = requests.get(f"{SIMULATOR_API_URL}/shutdown_status", params={"job_id": job_id}, timeout=5)
+            job = response.json().get("job") if response.status_code == 200 else None
+            if not job:
+                raise ValueError(f"Shutdown job {job_id} not found")
+            progress = shutdown_progress(job)
+        except Exception as e:
+            progress = {"job_id": job_id, "status": "failed", "message": f"Failed to track shutdown: {str(e)}"}
+
+        if datetime.now().timestamp() > deadline and progress["status"] == "running":
+            progress = dict(progress, status="failed", message="Timeout: not every device acknowledged the shutdown")
+
+        if progress != last_progress:
+            queue_user_update(user_id, 'emergency_shutdown_progress', progress)
+            last_progress = progress
+
+        if progress["status"] != "running":
+            return
+
+        socketio.sleep(SHUTDOWN_TRACK_INTERVAL)
+
 #/////////////////////////////////////////////Process incoming data as well as saving the Aggregate//////////////////
 def process_incoming_data11(device_id):
     try:
@@ -648,16 +1063,17 @@ def process_incoming_data11(device_id):
             return {"error": "Device ID is required"}, 400
 
         utc_now = datetime.utcnow().replace(tzinfo=timezone.utc)
+        session = shard_session(device_id)  # All of the device's realtime models live in its shard
 
         # ✅ 1️⃣ Get latest RealTimeData
-        latest_realtime = RealTimeData.query.filter_by(device_ID=device_id).order_by(RealTimeData.timestamp.desc()).first()
+        latest_realtime = session.query(RealTimeData).filter_by(device_ID=device_id).order_by(RealTimeData.timestamp.desc()).first()
         if not latest_realtime:
             return {"error": "No real-time data available"}, 404
 
         latest_realtime_time = latest_realtime.timestamp.replace(tzinfo=timezone.utc)
 
         # ✅ 2️⃣ Get the last aggregation timestamp
-        last_aggregate = AggregateData.query.filter_by(device_id=device_id).order_by(AggregateData.timestamp.desc()).first()
+        last_aggregate = session.query(AggregateData).filter_by(device_id=device_id).order_by(AggregateData.timestamp.desc()).first()
         last_agg_time = last_aggregate.timestamp.replace(tzinfo=timezone.utc) if last_aggregate else None
 
         # ✅ Load previous totals if they exist
@@ -680,8 +1096,8 @@ def process_incoming_data11(device_id):
                 devices_total_consumption=prev_devices_total_consumption
             )
 
-            db.session.add(new_entry)
-            db.session.commit()
+            session.add(new_entry)
+            session.commit()
             print(f"✅ Aggregation initialized for {device_id}")
 
             last_agg_time = utc_now  # Reset aggregation timestamp
@@ -692,7 +1108,7 @@ def process_incoming_data11(device_id):
             return {"message": "Not yet time to save aggregates"}, 200
 
         # ✅ 4️⃣ Fetch RealTimeData since last aggregation
-        realtime_entries = RealTimeData.query.filter(
+        realtime_entries = session.query(RealTimeData).filter(
             RealTimeData.device_ID == device_id,
             RealTimeData.timestamp > last_agg_time
         ).all()
@@ -701,7 +1117,7 @@ def process_incoming_data11(device_id):
         total_solar = sum(entry.solar_output for entry in realtime_entries) if realtime_entries else 0
 
         # ✅ 5️⃣ Fetch TotalConsumption data since last aggregation
-        total_entries = TotalConsumption.query.filter(
+        total_entries = session.query(TotalConsumption).filter(
             TotalConsumption.device_ID == device_id,
             TotalConsumption.timestamp > last_agg_time
         ).all()
@@ -728,14 +1144,14 @@ def process_incoming_data11(device_id):
             devices_total_consumption=devices_total_consumption
         )
 
-        db.session.add(new_entry)
-        db.session.commit()
+        session.add(new_entry)
+        session.commit()
 
         print(f"✅ Aggregation saved successfully for device {device_id}")
         return {"message": "Aggregation saved successfully"}, 201
 
     except Exception as e:
-        db.session.rollback()
+        shard_session(device_id).rollback()
         print(f"❌ Aggregation failed for {device_id}: {str(e)}")
         return {"error": str(e)}, 500
 
@@ -1,6 +1,66 @@
 // import * as Utils from './lights_render.js';
 
-const socket = io();
+// Ask for compact binary snapshots (see main/wire.py); the server falls back to JSON for 'json'
+const WIRE_ENCODING = 'packed';
+const socket = io({
+    query: { encoding: WIRE_ENCODING },
+    auth: (cb) => cb({ token: window.SEMS_SOCKET_TOKEN })
+});
+
+// The server refuses sockets whose token expired (e.g. a reconnect hours later): get a new one and retry.
+// Network errors leave the socket active and the client's own reconnection backoff handles them.
+socket.on('connect_error', () => {
+    if (socket.active) {
+        return;
+    }
+    fetch('/socket_token')
+        .then(response => response.ok ? response.json() : Promise.reject(response.status))
+        .then(({ token }) => {
+            window.SEMS_SOCKET_TOKEN = token;
+            socket.connect();
+        })
+        .catch(status => console.error('Socket token refresh failed:', status));
+});
+
+// Must match WIRE_APPLIANCES in main/wire.py
+const WIRE_APPLIANCES = ['kitchen_light', 'dining_light', 'bed_light', 'security_light', 'sound_system', 'tv'];
+const WIRE_VERSION = 1;
+
+// Decode a packed 38-byte snapshot into the same shape as the JSON database_update payload
+function decodePackedSnapshot(buffer) {
+    const bytes = buffer instanceof ArrayBuffer ? new Uint8Array(buffer) : buffer;
+    const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+
+    const version = view.getUint8(0);
+    if (version !== WIRE_VERSION) {
+        return { error: `Unsupported snapshot version ${version}` };
+    }
+
+    const timestamp = view.getInt32(1, true);
+    const states = view.getUint8(13);
+    const devices = {};
+    WIRE_APPLIANCES.forEach((appliance, bit) => {
+        devices[appliance] = {
+            state: (states & (1 << bit)) ? 'ON' : 'OFF',
+            consumption: view.getFloat32(14 + bit * 4, true)
+        };
+    });
+
+    return {
+        // Same "YYYY-MM-DD HH:MM:SS" UTC string the JSON payload carries
+        timestamp: new Date(timestamp * 1000).toISOString().slice(0, 19).replace('T', ' '),
+        battery_level: view.getInt32(5, true),
+        solar_output: view.getInt32(9, true),
+        devices: devices
+    };
+}
+
+// The server coalesces updates into one frame per room; replay each event through its normal handler
+socket.on('dashboard_update', (frame) => {
+    Object.entries(frame.events || {}).forEach(([event, payload]) => {
+        socket.listeners(event).forEach(handler => handler(payload));
+    });
+});
 
 document.addEventListener('DOMContentLoaded', function () {
     // Connect to the WebSocket server
@@ -38,6 +98,14 @@ document.addEventListener('DOMContentLoaded', function () {
     
     
 
+    // Predictive maintenance: unusual battery drain or a sudden drop in solar output
+    socket.on('maintenance_alert', function (alert) {
+        const text = alert.kind === 'battery_drain'
+            ? `Battery draining unusually fast (${alert.drain_per_hour}/h with ${alert.load_kw} kW on)`
+            : `Solar output dropped to ${alert.solar_output} (expected about ${alert.expected})`;
+        addMessage(`⚠️ Maintenance alert at ${alert.timestamp}: ${text}`);
+    });
+
     // Send message button handler
     sendButton.addEventListener('click', function () {
         sendMessage();
@@ -112,8 +180,15 @@ function initializeUI() {
     // Create the initial DOM structure
     createDOMStructure();
     
-    // Fetch initial data
-    fetchLatestData();
+    // Show the snapshot embedded in the page, or fetch one when there was none
+    const initialSnapshot = window.SEMS_INITIAL_STATE && window.SEMS_INITIAL_STATE.snapshot;
+    if (initialSnapshot) {
+        updateUIWithData(initialSnapshot);
+        document.getElementById("loading-state")?.classList.add("hidden");
+        document.getElementById("nav-content")?.classList.remove("hidden");
+    } else {
+        fetchLatestData();
+    }
     
     // Set up refresh button if needed
     const refreshButton = document.getElementById('refresh-button');
@@ -966,7 +1041,7 @@ function updateBatterySection(data) {
     batteryValue.textContent = `${data.battery_level}%`;
     
     const batteryIcon = document.createElement('img');
-    batteryIcon.src = 'main/static/images/OIP.jpg';
+    batteryIcon.src = window.SEMS_BATTERY_ICON || '/static/images/OIP.jpg';  // Fingerprinted URL from the page
     batteryIcon.alt = '🔋';
     batteryIcon.className = 'battery-icon';
     batteryIcon.onerror = function() {
@@ -1438,6 +1513,9 @@ function createSolarVisualization(solarOutput) {
 }
 
 socket.on('database_update', (data) => {
+    if (data instanceof ArrayBuffer || ArrayBuffer.isView(data)) {
+        data = decodePackedSnapshot(data);
+    }
     console.log('New data received via socket:', data);
     
     // Check that the data is valid and contains expected properties
@@ -1728,7 +1806,9 @@ socket.on('database_update', (data) => {
                 });
         }, 3000);
     }
-   callSaveSimulatedData();
+   if (window.SEMS_POLL_INGEST !== false) {
+       callSaveSimulatedData();
+   }
 
    function updateUsageContainer() {
     if (!aggregatedConsumptionData) {
@@ -2443,3 +2523,19 @@ function toggleDevice(deviceName) {
     })
     .catch(error => console.error('Error toggling device:', error));
 }
+
+// Replay the day chart, logs and aggregates embedded in the page through their socket handlers,
+// so the dashboard is complete without waiting for the first socket events
+document.addEventListener('DOMContentLoaded', () => {
+    const initial = window.SEMS_INITIAL_STATE || {};
+    const events = {
+        battery_solar_update: initial.day_chart && { data: initial.day_chart },
+        log_update: initial.logs && { logs: initial.logs },
+        aggregated_consumption_update: initial.aggregates
+    };
+    Object.entries(events).forEach(([event, payload]) => {
+        if (payload) {
+            socket.listeners(event).forEach(handler => handler(payload));
+        }
+    });
+});
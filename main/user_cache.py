@@ -0,0 +1,69 @@
+from flask_login import UserMixin
+from sqlalchemy.event import listen
+from sqlalchemy.orm import Session, object_session
+
+from . import db
+from .cache import LRUCache
+from .models import User
+
+
+class CachedUser(UserMixin):
+    """
+    Detached copy of the User fields requests need, so Flask-Login's user loader doesn't
+    query auth.db on every request. Holds no password hash.
+    """
+
+    def __init__(self, user):
+        self.id = user.id
+        self.device_id = user.device_id
+        self.email = user.email
+        self.username = user.username
+
+
+user_cache = LRUCache(maxsize=1000, default_timeout=300)
+
+
+def init_user_cache(app):
+    user_cache.maxsize = app.config.get('USER_CACHE_SIZE', user_cache.maxsize)
+    user_cache.default_timeout = app.config.get('USER_CACHE_TTL', user_cache.default_timeout)
+
+
+def load_cached_user(user_id):
+    """User for Flask-Login's user_loader, from the cache or auth.db."""
+    user_id = int(user_id)
+    user = user_cache.get(user_id)
+    if user is None:
+        record = db.session.get(User, user_id)
+        if record is None:
+            return None
+        user = CachedUser(record)
+        user_cache.set(user_id, user)
+    return user
+
+
+def on_user_change(mapper, connection, target):
+    """
+    Drop a changed or deleted user once the change commits, so a new password, email or
+    device takes effect at once. Dropping it at flush time would let a concurrent request
+    cache the old row again before the commit.
+    """
+    session = object_session(target)
+    if session is None:
+        user_cache.delete(target.id)
+        return
+    session.info.setdefault('changed_users', set()).add(target.id)
+
+
+def _after_commit(session):
+    for user_id in session.info.pop('changed_users', ()):
+        user_cache.delete(user_id)
+
+
+def _after_rollback(session):
+    session.info.pop('changed_users', None)
+
+
+listen(User, 'after_update', on_user_change)
+listen(User, 'after_delete', on_user_change)
+listen(Session, 'after_commit', _after_commit)
+listen(Session, 'after_rollback', _after_rollback)
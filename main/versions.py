@@ -0,0 +1,80 @@
+"""
+Per-device write counters for conditional GETs.
+
+Every committed write of a device's readings, logs or aggregates bumps a counter for
+that (device, kind). Read endpoints build their ETag from the counters they depend on,
+so an If-None-Match check is a dict lookup: a current client gets a 304 before anything
+is queried or serialized.
+
+Counters live in this process. They only see writes made here, so READ_ETAGS is turned
+off when readings can be stored elsewhere: by ingest worker processes, or by another
+instance when several share a Socket.IO message queue.
+"""
+import os
+
+from flask import current_app, jsonify, request
+from sqlalchemy.event import contains, listen
+from sqlalchemy.orm import Session, object_session
+
+EPOCH = os.urandom(4).hex()  # Counters restart with the process, so must the ETags
+write_versions = {}  # (device_id, kind) -> committed writes seen
+
+
+def bump_version(device_id, kind):
+    write_versions[(device_id, kind)] = write_versions.get((device_id, kind), 0) + 1
+
+
+def bump_on_commit(target, device_id, kind):
+    """
+    Bump once the flush that wrote `target` commits. Bumping in a flush listener would
+    let a concurrent read tag still-uncommitted data with the new version.
+    """
+    session = object_session(target)
+    if session is None:
+        bump_version(device_id, kind)
+        return
+    session.info.setdefault('write_versions', set()).add((device_id, kind))
+
+
+def _after_commit(session):
+    for device_id, kind in session.info.pop('write_versions', ()):
+        bump_version(device_id, kind)
+
+
+def _after_rollback(session):
+    session.info.pop('write_versions', None)
+
+
+def register_version_listeners():
+    """Attach the commit hooks to every SQLAlchemy session, once per process."""
+    for event, listener in (('after_commit', _after_commit), ('after_rollback', _after_rollback)):
+        if not contains(Session, event, listener):
+            listen(Session, event, listener)
+
+
+def versioned_response(device_id, kinds, build, extra=''):
+    """
+    JSON response for a device read endpoint with a version ETag.
+
+    `build` returns (body, status) and only runs when the client's copy is stale. `kinds`
+    are the write counters the body depends on; `extra` adds anything else it varies by.
+    """
+    if not current_app.config['READ_ETAGS']:
+        body, status = build()
+        return jsonify(body), status
+
+    counters = '.'.join(str(write_versions.get((device_id, kind), 0)) for kind in kinds)
+    etag = f"{EPOCH}-{device_id}-{counters}{extra}"
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        body, status = build()
+        response = jsonify(body)
+        response.status_code = status
+        if status != 200:
+            return response
+
+    response.set_etag(etag, weak=True)
+    # Per user (the device comes from the session): revalidate, never share
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
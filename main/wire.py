@@ -0,0 +1,107 @@
+"""
+Compact binary encoding of dashboard snapshots sent over Socket.IO.
+
+A packed snapshot is a fixed 38-byte little-endian record:
+
+    version        uint8    WIRE_VERSION
+    timestamp      int32    seconds since the epoch (UTC)
+    battery_level  int32
+    solar_output   int32
+    states         uint8    bit i set when WIRE_APPLIANCES[i] is ON
+    consumptions   6 x float32, kWh, in WIRE_APPLIANCES order
+
+The matching decoder is decodePackedSnapshot() in static/javascripts/semsdynamics.js.
+"""
+import struct
+from datetime import datetime, timezone
+
+WIRE_VERSION = 1
+
+# Fixed appliance order of the wire format - append new appliances, never reorder
+WIRE_APPLIANCES = (
+    'kitchen_light',
+    'dining_light',
+    'bed_light',
+    'security_light',
+    'sound_system',
+    'tv',
+)
+
+SNAPSHOT_STRUCT = struct.Struct('<BiiiB' + 'f' * len(WIRE_APPLIANCES))
+
+ENCODINGS = ('json', 'packed')
+
+
+def pack_snapshot(record):
+    """Pack a RealTimeData record into the binary snapshot format."""
+    states = 0
+    for bit, appliance in enumerate(WIRE_APPLIANCES):
+        if getattr(record, f"{appliance}_state") == "ON":
+            states |= 1 << bit
+
+    return SNAPSHOT_STRUCT.pack(
+        WIRE_VERSION,
+        int(record.timestamp.replace(tzinfo=timezone.utc).timestamp()),
+        int(record.battery_level),
+        int(record.solar_output),
+        states,
+        *(getattr(record, f"{appliance}_consumption") or 0.0 for appliance in WIRE_APPLIANCES)
+    )
+
+
+def unpack_snapshot(packed):
+    """Decode a packed snapshot back into the JSON payload shape (used for checks)."""
+    version, timestamp, battery_level, solar_output, states, *consumptions = SNAPSHOT_STRUCT.unpack(packed)
+    if version != WIRE_VERSION:
+        raise ValueError(f"Unsupported wire version: {version}")
+
+    return {
+        "timestamp": datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+        "battery_level": battery_level,
+        "solar_output": solar_output,
+        "devices": {
+            appliance: {
+                "state": "ON" if states & (1 << bit) else "OFF",
+                "consumption": consumptions[bit]
+            }
+            for bit, appliance in enumerate(WIRE_APPLIANCES)
+        }
+    }
+
+
+if __name__ == '__main__':
+    # Bytes per update and CPU per encode, packed vs the JSON the dashboard used to receive
+    import json
+    import timeit
+    from types import SimpleNamespace
+
+    record = SimpleNamespace(
+        timestamp=datetime.utcnow().replace(microsecond=0),
+        battery_level=734,
+        solar_output=912,
+        **{f"{appliance}_state": "ON" if i % 2 else "OFF" for i, appliance in enumerate(WIRE_APPLIANCES)},
+        **{f"{appliance}_consumption": 0.001234 * (i + 1) for i, appliance in enumerate(WIRE_APPLIANCES)}
+    )
+
+    def encode_json():
+        payload = {
+            "timestamp": record.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+            "battery_level": record.battery_level,
+            "solar_output": record.solar_output,
+            "devices": {
+                appliance: {
+                    "state": getattr(record, f"{appliance}_state"),
+                    "consumption": getattr(record, f"{appliance}_consumption")
+                }
+                for appliance in WIRE_APPLIANCES
+            }
+        }
+        return json.dumps(payload, separators=(',', ':')).encode()
+
+    def encode_packed():
+        return pack_snapshot(record)
+
+    runs = 100000
+    for name, encode in (("json", encode_json), ("packed", encode_packed)):
+        seconds = timeit.timeit(encode, number=runs)
+        print(f"{name:>6}: {len(encode()):4d} bytes/update, {seconds / runs * 1e6:6.2f} us/encode")
@@ -1,6 +1,12 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
+import json
+import os
 import random
+import sys
+import threading
 import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 app = Flask(__name__)
@@ -12,9 +18,23 @@ device_IDs = ["78u001y"] #, "78u001x" "65w789x"]
 emergency_status = {
     "shutdown_active": False,
     "shutdown_timestamp": None,
-    "shutdown_by": None
+    "shutdown_by": None,
+    "shutdown_job_id": None
 }
 
+# Per-device locks guard device_data: readers and writers of one device are serialized,
+# different devices proceed in parallel across the threaded server's workers.
+# Lock order is device lock before emergency_lock, never the other way round.
+device_locks = {}
+emergency_lock = threading.Lock()
+
+# Emergency shutdown jobs: commands go out to every controller in parallel and each
+# controller's acknowledgement is tracked on the job
+shutdown_executor = ThreadPoolExecutor(max_workers=32)
+shutdown_jobs = {}
+shutdown_jobs_lock = threading.Lock()
+MAX_SHUTDOWN_JOBS = 20  # Finished jobs kept for status queries
+
 # Initial device state dictionaries for each device
 device_data = {
     "78u001y": {
@@ -112,68 +132,203 @@ device_data = {
 }
 
 
+# One lock per device, created with the device's initial state
+device_locks.update({device_id: threading.Lock() for device_id in device_data})
+
+# Manual control as bit masks (see APPLIANCES below), kept in step with the dicts by apply_control
+for device in device_data.values():
+    device["manual_mask"] = 0  # Appliances under manual control
+    device["manual_on_mask"] = 0  # Of those, the ones manually ON
+
+
+# Automation rules: when each appliance runs on its own, as data instead of code.
+# Appliances are bits of an int mask in this order (same order as the main app's wire format).
+APPLIANCES = ("kitchen_light", "dining_light", "bed_light", "security_light", "sound_system", "tv")
+APPLIANCE_BITS = {appliance: 1 << bit for bit, appliance in enumerate(APPLIANCES)}
+
+# Device state dicts for every possible mask, so decoding a mask is a single lookup
+STATE_DICTS = [
+    {appliance: "ON" if mask & APPLIANCE_BITS[appliance] else "OFF" for appliance in APPLIANCES}
+    for mask in range(1 << len(APPLIANCES))
+]
+
+MAX_BATTERY_LEVEL = 1000
+
+# Rules used when no rules file exists. "windows" are inclusive [start, end] counter ranges
+# (start > end wraps past counter_max), "priority" is the appliance's tier and
+# "battery_reserve" the battery level below which a tier is switched off.
+DEFAULT_AUTOMATION_RULES = {
+    "counter_max": 70,
+    "appliances": {
+        "kitchen_light": {"windows": [[1, 18]], "priority": 2},
+        "dining_light": {"windows": [[13, 18]], "priority": 2},
+        "bed_light": {"windows": [[24, 43]], "priority": 2},
+        "security_light": {"windows": [[38, 45]], "priority": 1},
+        "sound_system": {"windows": [[50, 65]], "priority": 3},
+        "tv": {"windows": [[30, 69]], "priority": 3}
+    },
+    "battery_reserve": {"1": 0, "2": 0, "3": 0}
+}
+
+AUTOMATION_RULES_FILE = os.environ.get(
+    "SEMS_AUTOMATION_RULES", os.path.join(os.path.dirname(os.path.abspath(__file__)), "automation_rules.json")
+)
+RULES_CHECK_INTERVAL = 1.0  # Seconds between checks of the rules file for edits
+
+
+def compile_rules(rules):
+    """
+    Validate automation rules and compile them into lookup tables.
+
+    Returns a dict with "schedule" (counter -> mask of appliances scheduled ON) and
+    "shed" (battery level -> mask of appliances switched off to protect the battery).
+    Raises ValueError describing the first invalid entry.
+    """
+    counter_max = rules.get("counter_max", DEFAULT_AUTOMATION_RULES["counter_max"])
+    if not isinstance(counter_max, int) or counter_max < 1:
+        raise ValueError("counter_max must be a positive integer")
+
+    reserves = {}
+    for tier, level in rules.get("battery_reserve", {}).items():
+        if not str(tier).isdigit() or not isinstance(level, int) or not 0 <= level <= MAX_BATTERY_LEVEL:
+            raise ValueError(f"battery_reserve entries must map a tier to a level between 0 and {MAX_BATTERY_LEVEL}")
+        reserves[int(tier)] = level
+
+    schedule = [0] * (counter_max + 1)
+    shed = [0] * (MAX_BATTERY_LEVEL + 1)
+
+    for appliance, rule in rules.get("appliances", {}).items():
+        if appliance not in APPLIANCE_BITS:
+            raise ValueError(f"Unknown appliance: {appliance}")
+        bit = APPLIANCE_BITS[appliance]
+
+        for window in rule.get("windows", []):
+            if (not isinstance(window, list) or len(window) != 2
+                    or not all(isinstance(edge, int) and 1 <= edge <= counter_max for edge in window)):
+                raise ValueError(f"{appliance}: windows must be [start, end] counters between 1 and {counter_max}")
+            start, end = window
+            counters = range(start, end + 1) if start <= end else [*range(start, counter_max + 1), *range(1, end + 1)]
+            for counter in counters:
+                schedule[counter] |= bit
+
+        priority = rule.get("priority", 1)
+        if not isinstance(priority, int):
+            raise ValueError(f"{appliance}: priority must be an integer")
+        for level in range(reserves.get(priority, 0)):
+            shed[level] |= bit
+
+    return {"counter_max": counter_max, "schedule": schedule, "shed": shed}
+
+
+# Per-device schedules pushed by the main app's solar scheduler: {"windows", "mask", "schedule"}
+for device in device_data.values():
+    device["schedule_override"] = None
+
+
+def compile_device_schedule(windows):
+    """
+    Validate a pushed {appliance: windows} schedule and compile it like the rules: returns
+    the override with "mask" (appliances it covers) and "schedule" (counter -> mask ON).
+    """
+    if not isinstance(windows, dict) or not windows:
+        raise ValueError("schedule must map appliances to windows")
+    counter_max = current_automation()["tables"]["counter_max"]
+    tables = compile_rules({
+        "counter_max": counter_max,
+        "appliances": {appliance: {"windows": appliance_windows} for appliance, appliance_windows in windows.items()}
+    })
+    mask = 0
+    for appliance in windows:
+        mask |= APPLIANCE_BITS[appliance]
+    return {"windows": windows, "mask": mask, "schedule": tables["schedule"]}
+
+
+# Active rules and their compiled tables, swapped as one object when the rules change
+automation = {
+    "rules": DEFAULT_AUTOMATION_RULES,
+    "tables": compile_rules(DEFAULT_AUTOMATION_RULES),
+    "mtime": None,
+    "checked_at": 0.0
+}
+automation_lock = threading.Lock()
+
+
+def current_automation():
+    """
+    Return the active rules, reloading them first if the rules file changed on disk.
+    An invalid file is reported and the previous rules stay in effect.
+    """
+    global automation
+    current = automation
+    now = time.monotonic()
+    if now - current["checked_at"] < RULES_CHECK_INTERVAL:
+        return current
+
+    with automation_lock:
+        current = automation
+        if now - current["checked_at"] < RULES_CHECK_INTERVAL:
+            return current
+
+        try:
+            mtime = os.path.getmtime(AUTOMATION_RULES_FILE)
+        except OSError:
+            mtime = None
+
+        current = dict(current, checked_at=now)
+        if mtime is not None and mtime != current["mtime"]:
+            try:
+                with open(AUTOMATION_RULES_FILE) as f:
+                    rules = json.load(f)
+                current.update(rules=rules, tables=compile_rules(rules), mtime=mtime)
+                print(f"⚙️ Loaded automation rules from {AUTOMATION_RULES_FILE}")
+            except (OSError, ValueError, AttributeError, TypeError) as e:
+                current["mtime"] = mtime  # Don't retry the same broken file every second
+                print(f"❌ Ignoring invalid automation rules in {AUTOMATION_RULES_FILE}: {e}")
+
+        automation = current
+        return current
+
+
 def update_device_states(device_id):
     """
     Updates the device states based on the current counter value for a specific device.
-    For devices under manual control, the counter-based logic is bypassed.
+    The caller must hold device_locks[device_id].
+    The automation rules give the appliances scheduled ON at this counter, minus those shed
+    for a low battery; devices under manual control keep their manual state instead.
     If emergency shutdown is active, all devices are kept OFF regardless of manual settings.
     """
-    counter = device_data[device_id]["counter"]
-    device_states = device_data[device_id]["device_states"]
-    manual_control = device_data[device_id]["manual_control"]
-    manual_states = device_data[device_id]["manual_states"]
+    device = device_data[device_id]
     
     # If emergency shutdown is active, force all devices to OFF
     if emergency_status["shutdown_active"]:
-        for device_name in device_states:
-            device_states[device_name] = "OFF"
+        device["device_states"].update(STATE_DICTS[0])
         return
     
-    # Normal operation - update states based on counter only for devices not under manual control
-    if not manual_control["kitchen_light"]:
-        device_states["kitchen_light"] = "ON" if 1 <= counter <= 18 else "OFF"
-    else:
-        device_states["kitchen_light"] = manual_states["kitchen_light"]
-        
-    if not manual_control["dining_light"]:
-        device_states["dining_light"] = "ON" if 13 <= counter <= 18 else "OFF"
-    else:
-        device_states["dining_light"] = manual_states["dining_light"]
-        
-    if not manual_control["bed_light"]:
-        device_states["bed_light"] = "ON" if 24 <= counter <= 43 else "OFF"
-    else:
-        device_states["bed_light"] = manual_states["bed_light"]
-        
-    if not manual_control["security_light"]:
-        device_states["security_light"] = "ON" if 38 <= counter <= 45 else "OFF"
-    else:
-        device_states["security_light"] = manual_states["security_light"]
-        
-    if not manual_control["sound_system"]:
-        device_states["sound_system"] = "ON" if 50 <= counter <= 65 else "OFF"
-    else:
-        device_states["sound_system"] = manual_states["sound_system"]
-        
-    if not manual_control["tv"]:
-        device_states["tv"] = "ON" if 30 <= counter <= 69 else "OFF"
-    else:
-        device_states["tv"] = manual_states["tv"]
+    tables = current_automation()["tables"]
+    counter = min(device["counter"], tables["counter_max"])
+    scheduled = tables["schedule"][counter]
+    override = device["schedule_override"]
+    if override:
+        # Appliances with a pushed schedule follow its windows instead of the rules'
+        scheduled = (scheduled & ~override["mask"]) | override["schedule"][min(counter, len(override["schedule"]) - 1)]
+    automatic = scheduled & ~tables["shed"][device["battery_level"]]
+    state_mask = (automatic & ~device["manual_mask"]) | device["manual_on_mask"]
     
-    device_data[device_id]["device_states"] = device_states
+    device["device_states"].update(STATE_DICTS[state_mask])
 
 
 def update_device_data(device_id):
     """
     Updates the solar output and battery level for a specific device
     based on a set of probabilistic rules.
+    The caller must hold device_locks[device_id].
     """
     # Extract current device data
     device = device_data[device_id]
     
     # Increment the counter (simulate passage of time)
     device["counter"] += 1
-    if device["counter"] > 70:  # Reset counter after max range
+    if device["counter"] > current_automation()["tables"]["counter_max"]:  # Reset counter after max range
         device["counter"] = 1
 
     # Update device states based on the counter
@@ -231,6 +386,56 @@ def update_device_data(device_id):
     # Enforce battery boundaries
     device["battery_level"] = max(10, min(device["battery_level"], 1000))
 
+# Readings carry (boot_id, sequence): the sequence counts a device's readings and restarts
+# with every simulator start, which gets a new boot_id
+BOOT_ID = uuid.uuid4().hex
+# A controller produces at most one new reading per interval, like real hardware. Kept well
+# below the dashboard's 3 s poll so timer and network jitter never turn a tab's regular
+# poll into a duplicate; extra tabs polling in the same second still share a reading.
+READING_INTERVAL = 1
+
+for device in device_data.values():
+    device["sequence"] = 0
+    device["last_reading"] = None
+    device["last_reading_at"] = None
+
+
+def next_reading(device_id, max_age=None):
+    """
+    Return a device's reading, advancing its simulation by one step unless its last
+    reading is less than max_age seconds old - then that same reading is returned again,
+    sequence number included, so the main app can tell it is a duplicate.
+    max_age defaults to READING_INTERVAL.
+    """
+    if max_age is None:
+        max_age = READING_INTERVAL
+    
+    with device_locks[device_id]:
+        device = device_data[device_id]
+        now = time.monotonic()
+        if device["last_reading"] and now - device["last_reading_at"] < max_age:
+            return device["last_reading"]
+        
+        # Update the selected device's data
+        update_device_data(device_id)
+        device["sequence"] += 1
+        
+        # Prepare the payload to be returned, copying states so later writers can't change it
+        device["last_reading"] = {
+            "device_ID": device_id,
+            "boot_id": BOOT_ID,
+            "sequence": device["sequence"],
+            "taken_at": time.time(),  # Wall-clock time of the step, for rates in the main app
+            "battery_level": device["battery_level"],
+            "solar_output": device["solar_output"],
+            "counter": device["counter"],
+            "devices": dict(device["device_states"]),
+            "emergency_shutdown_active": emergency_status["shutdown_active"]
+        }
+        device["last_reading_at"] = now
+        return device["last_reading"]
+
+
 @app.route('/get_simulated_data', methods=['GET'])
 def get_simulated_data():
     """
@@ -240,19 +445,139 @@ def get_simulated_data():
     # Randomly select a device ID
     selected_device_id = random.choice(device_IDs)
     
-    # Update the selected device's data
-    update_device_data(selected_device_id)
+    return jsonify(next_reading(selected_device_id)), 200
+
+
+STREAM_INTERVAL = 3  # Default seconds between readings on the stream, the dashboard's polling rate
+
+
+@app.route('/stream_simulated_data', methods=['GET'])
+def stream_simulated_data():
+    """
+    Route streaming readings as Server-Sent Events over one long-lived connection.
+    ?device_ids=a,b subscribes to those devices (all devices when omitted) and
+    ?interval=<seconds> sets the tick; every tick sends one "data:" event per device.
+    """
+    requested = request.args.get("device_ids")
+    subscribed = [device_id for device_id in requested.split(",") if device_id] if requested else list(device_data)
     
-    # Prepare the payload to be returned
-    payload = {
-        "device_ID": selected_device_id,
-        "battery_level": device_data[selected_device_id]["battery_level"],
-        "solar_output": device_data[selected_device_id]["solar_output"],
-        "devices": device_data[selected_device_id]["device_states"],
-        "emergency_shutdown_active": emergency_status["shutdown_active"]
+    unknown = [device_id for device_id in subscribed if device_id not in device_data]
+    if unknown:
+        return jsonify({"error": f"Device ID {', '.join(unknown)} not found"}), 404
+    
+    try:
+        interval = float(request.args.get("interval", STREAM_INTERVAL))
+    except ValueError:
+        return jsonify({"error": "interval must be a number of seconds"}), 400
+    
+    def generate():
+        while True:
+            started = time.monotonic()
+            for device_id in subscribed:
+                # The stream sets the pace, every tick is a new reading
+                yield f"data: {json.dumps(next_reading(device_id, max_age=0))}\n\n"
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# Named scenes: appliance -> control action, applied to one device in a single batch
+SCENES = {
+    "all_lights_off": {
+        "kitchen_light": "OFF", "dining_light": "OFF", "bed_light": "OFF", "security_light": "OFF"
+    },
+    "all_lights_on": {
+        "kitchen_light": "ON", "dining_light": "ON", "bed_light": "ON", "security_light": "ON"
+    },
+    "all_off": {
+        "kitchen_light": "OFF", "dining_light": "OFF", "bed_light": "OFF", "security_light": "OFF",
+        "sound_system": "OFF", "tv": "OFF"
+    },
+    "all_auto": {
+        "kitchen_light": "AUTO", "dining_light": "AUTO", "bed_light": "AUTO", "security_light": "AUTO",
+        "sound_system": "AUTO", "tv": "AUTO"
+    },
+    "night": {
+        "kitchen_light": "OFF", "dining_light": "OFF", "bed_light": "OFF", "security_light": "ON",
+        "sound_system": "OFF", "tv": "OFF"
+    },
+    "movie": {
+        "kitchen_light": "OFF", "dining_light": "OFF", "bed_light": "OFF",
+        "sound_system": "ON", "tv": "ON"
     }
+}
+
+
+def apply_control(device_id, device_name, control_action):
+    """
+    Apply one manual control command. Returns the response body and HTTP status.
+    """
+    # Check if device ID exists
+    if device_id not in device_data:
+        return {"error": f"Device ID {device_id} not found"}, 404
     
-    return jsonify(payload), 200
+    # Check if device name exists
+    if device_name not in device_data[device_id]["device_states"]:
+        return {"error": f"Device name {device_name} not found"}, 404
+    
+    with device_locks[device_id]:
+        # If emergency shutdown is active, prevent manual control changes
+        if emergency_status["shutdown_active"] and control_action != "OVERRIDE_EMERGENCY":
+            return {
+                "status": "error",
+                "message": "Cannot change device state during emergency shutdown",
+                "device_ID": device_id,
+                "device_name": device_name,
+                "current_state": "OFF",
+                "control_mode": "Emergency Shutdown"
+            }, 403
+
+        # Special action to override emergency shutdown
+        if control_action == "OVERRIDE_EMERGENCY":
+            with emergency_lock:
+                emergency_status["shutdown_active"] = False
+                emergency_status["shutdown_timestamp"] = None
+            return {
+                "status": "success",
+                "message": "Emergency shutdown override successful",
+                "shutdown_active": False
+            }, 200
+
+        # Handle control actions
+        if control_action == "AUTO":
+            # Set device back to automatic control
+            device_data[device_id]["manual_control"][device_name] = False
+            device_data[device_id]["manual_mask"] &= ~APPLIANCE_BITS[device_name]
+            device_data[device_id]["manual_on_mask"] &= ~APPLIANCE_BITS[device_name]
+            message = f"Device {device_name} set to automatic control"
+        elif control_action in ["ON", "OFF"]:
+            # Set device to manual control with specified state
+            device_data[device_id]["manual_control"][device_name] = True
+            device_data[device_id]["manual_states"][device_name] = control_action
+            device_data[device_id]["manual_mask"] |= APPLIANCE_BITS[device_name]
+            if control_action == "ON":
+                device_data[device_id]["manual_on_mask"] |= APPLIANCE_BITS[device_name]
+            else:
+                device_data[device_id]["manual_on_mask"] &= ~APPLIANCE_BITS[device_name]
+            # Update the device state immediately
+            device_data[device_id]["device_states"][device_name] = control_action
+            message = f"Device {device_name} manually set to {control_action}"
+        else:
+            return {"error": f"Invalid control action: {control_action}. Must be 'AUTO', 'ON', 'OFF', or 'OVERRIDE_EMERGENCY'"}, 400
+
+        # Return the updated device state
+        return {
+            "status": "success",
+            "message": message,
+            "device_ID": device_id,
+            "device_name": device_name,
+            "current_state": device_data[device_id]["device_states"][device_name],
+            "control_mode": "Manual" if device_data[device_id]["manual_control"][device_name] else "Automatic"
+        }, 200
 
 
 @app.route('/control_device', methods=['POST'])
@@ -272,70 +597,245 @@ def control_device():
         if field not in data:
             return jsonify({"error": f"Missing required field: {field}"}), 400
     
-    device_id = data["device_ID"]
-    device_name = data["device_name"]
-    control_action = data["control_action"]
+    body, status = apply_control(data["device_ID"], data["device_name"], data["control_action"])
+    return jsonify(body), status
+
+
+@app.route('/control_devices', methods=['POST'])
+def control_devices():
+    """
+    Route to apply many control commands in one request.
+
+    Accepts {"commands": [{"device_ID", "device_name", "control_action"}, ...]} and/or
+    {"scene": "<name>", "device_ID": "<id>"}; scene commands come before explicit ones.
+    Commands for the same appliance are coalesced - only the last one is applied and the
+    earlier ones are reported as "coalesced". Returns one result per command, in order.
+    """
+    data = request.get_json()
     
-    # Check if device ID exists
-    if device_id not in device_data:
-        return jsonify({"error": f"Device ID {device_id} not found"}), 404
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
     
-    # Check if device name exists
-    if device_name not in device_data[device_id]["device_states"]:
-        return jsonify({"error": f"Device name {device_name} not found"}), 404
+    commands = []
     
-    # If emergency shutdown is active, prevent manual control changes
-    if emergency_status["shutdown_active"] and control_action != "OVERRIDE_EMERGENCY":
-        return jsonify({
-            "status": "error",
-            "message": "Cannot change device state during emergency shutdown",
-            "device_ID": device_id,
-            "device_name": device_name,
-            "current_state": "OFF",
-            "control_mode": "Emergency Shutdown"
-        }), 403
-    
-    # Special action to override emergency shutdown
-    if control_action == "OVERRIDE_EMERGENCY":
-        emergency_status["shutdown_active"] = False
-        emergency_status["shutdown_timestamp"] = None
-        return jsonify({
-            "status": "success",
-            "message": "Emergency shutdown override successful",
-            "shutdown_active": False
-        }), 200
-    
-    # Handle control actions
-    if control_action == "AUTO":
-        # Set device back to automatic control
-        device_data[device_id]["manual_control"][device_name] = False
-        message = f"Device {device_name} set to automatic control"
-    elif control_action in ["ON", "OFF"]:
-        # Set device to manual control with specified state
-        device_data[device_id]["manual_control"][device_name] = True
-        device_data[device_id]["manual_states"][device_name] = control_action
-        # Update the device state immediately
-        device_data[device_id]["device_states"][device_name] = control_action
-        message = f"Device {device_name} manually set to {control_action}"
-    else:
-        return jsonify({"error": f"Invalid control action: {control_action}. Must be 'AUTO', 'ON', 'OFF', or 'OVERRIDE_EMERGENCY'"}), 400
+    scene = data.get("scene")
+    if scene:
+        if scene not in SCENES:
+            return jsonify({"error": f"Scene {scene} not found. Available scenes: {', '.join(SCENES)}"}), 404
+        if "device_ID" not in data:
+            return jsonify({"error": "Missing required field: device_ID"}), 400
+        commands.extend(
+            {"device_ID": data["device_ID"], "device_name": device_name, "control_action": control_action}
+            for device_name, control_action in SCENES[scene].items()
+        )
+    
+    commands.extend(data.get("commands", []))
+    if not commands:
+        return jsonify({"error": "No commands or scene provided"}), 400
+    
+    # Required fields, checked for every command before anything is applied
+    required_fields = ["device_ID", "device_name", "control_action"]
+    for index, command in enumerate(commands):
+        for field in required_fields:
+            if field not in command:
+                return jsonify({"error": f"Missing required field: {field} in command {index}"}), 400
+    
+    # Coalesce: the last command for an appliance wins
+    last_index = {}
+    for index, command in enumerate(commands):
+        last_index[(command["device_ID"], command["device_name"])] = index
+    
+    # Apply the surviving commands in a single pass
+    results = []
+    for index, command in enumerate(commands):
+        if last_index[(command["device_ID"], command["device_name"])] != index:
+            body, status = {
+                "status": "coalesced",
+                "message": "Superseded by a later command for the same appliance",
+                "device_ID": command["device_ID"],
+                "device_name": command["device_name"]
+            }, 200
+        else:
+            body, status = apply_control(command["device_ID"], command["device_name"], command["control_action"])
+        results.append(dict(body, index=index, http_status=status))
+    
+    applied = sum(1 for result in results if result.get("status") == "success")
+    coalesced = sum(1 for result in results if result.get("status") == "coalesced")
     
-    # Return the updated device state
     return jsonify({
-        "status": "success",
-        "message": message,
-        "device_ID": device_id,
-        "device_name": device_name,
-        "current_state": device_data[device_id]["device_states"][device_name],
-        "control_mode": "Manual" if device_data[device_id]["manual_control"][device_name] else "Automatic"
+        "status": "success" if applied + coalesced == len(results) else "partial",
+        "applied": applied,
+        "coalesced": coalesced,
+        "failed": len(results) - applied - coalesced,
+        "results": results
+    }), 200
+
+
+@app.route('/scenes', methods=['GET'])
+def list_scenes():
+    """
+    Route listing the scenes accepted by /control_devices.
+    """
+    return jsonify(SCENES), 200
+
+
+@app.route('/automation_rules', methods=['GET'])
+def get_automation_rules():
+    """
+    Route returning the automation rules currently in effect.
+    """
+    current = current_automation()
+    return jsonify({
+        "rules": current["rules"],
+        "source": AUTOMATION_RULES_FILE if current["mtime"] is not None else "defaults"
+    }), 200
+
+
+@app.route('/automation_rules', methods=['PUT'])
+def put_automation_rules():
+    """
+    Route replacing the automation rules. The rules are validated and compiled before they
+    are saved to the rules file and take effect on the next reading of every device.
+    """
+    global automation
+    rules = request.get_json()
+    
+    if not rules:
+        return jsonify({"error": "No data provided"}), 400
+    
+    try:
+        tables = compile_rules(rules)
+    except (ValueError, AttributeError, TypeError) as e:
+        return jsonify({"error": f"Invalid automation rules: {e}"}), 400
+    
+    with automation_lock:
+        # Write to a temporary file first so a crash never leaves a half-written rules file
+        temp_file = f"{AUTOMATION_RULES_FILE}.tmp"
+        with open(temp_file, "w") as f:
+            json.dump(rules, f, indent=2)
+        os.replace(temp_file, AUTOMATION_RULES_FILE)
+        
+        automation = {
+            "rules": rules,
+            "tables": tables,
+            "mtime": os.path.getmtime(AUTOMATION_RULES_FILE),
+            "checked_at": time.monotonic()
+        }
+    
+    return jsonify({"status": "success", "message": "Automation rules updated", "rules": rules}), 200
+
+
+@app.route('/device_schedules', methods=['GET'])
+def get_device_schedules():
+    """
+    Route returning the pushed schedules, {device_ID: {appliance: windows}}.
+    """
+    return jsonify({
+        device_id: device["schedule_override"]["windows"]
+        for device_id, device in device_data.items() if device["schedule_override"]
+    }), 200
+
+
+@app.route('/device_schedules', methods=['PUT'])
+def put_device_schedules():
+    """
+    Route setting per-device schedules for some appliances, overriding the automation
+    rules' windows for those appliances on those devices. Accepts
+    {"schedules": {device_ID: {appliance: [[start, end], ...]}}}; a null schedule returns
+    the device to the rules. Each device is handled on its own: valid schedules of known
+    devices are applied, unknown devices and invalid schedules are reported back.
+    """
+    data = request.get_json()
+    
+    if not data or not isinstance(data.get("schedules"), dict):
+        return jsonify({"error": "No schedules provided"}), 400
+    
+    updated = []
+    unknown = []
+    invalid = {}
+    for device_id, windows in data["schedules"].items():
+        if device_id not in device_data:
+            unknown.append(device_id)
+            continue
+        try:
+            override = compile_device_schedule(windows) if windows is not None else None
+        except (ValueError, AttributeError, TypeError) as e:
+            invalid[device_id] = str(e)
+            continue
+        with device_locks[device_id]:
+            device_data[device_id]["schedule_override"] = override
+        updated.append(device_id)
+    
+    return jsonify({
+        "status": "success" if not unknown and not invalid else "partial",
+        "updated": len(updated),
+        "unknown": unknown,
+        "invalid": invalid
     }), 200
 
 
+def shutdown_device(job_id, device_id):
+    """
+    Send the shutdown command to one controller and record its acknowledgement on the job.
+    """
+    try:
+        with device_locks[device_id]:
+            for device_name in device_data[device_id]["device_states"]:
+                device_data[device_id]["device_states"][device_name] = "OFF"
+        result = "acknowledged"
+    except Exception:
+        result = "failed"
+
+    with shutdown_jobs_lock:
+        job = shutdown_jobs[job_id]
+        job["devices"][device_id] = result
+        job[result] += 1
+        if job["acknowledged"] + job["failed"] == job["total"]:
+            job["status"] = "completed" if not job["failed"] else "failed"
+            job["completed_at"] = datetime.now().isoformat()
+
+
+def start_shutdown_job(initiated_by, timestamp):
+    """Create a shutdown job and dispatch it to every controller concurrently."""
+    job_id = uuid.uuid4().hex
+    device_ids = list(device_data)
+
+    with shutdown_jobs_lock:
+        shutdown_jobs[job_id] = {
+            "job_id": job_id,
+            "status": "running",
+            "initiated_by": initiated_by,
+            "timestamp": timestamp,
+            "completed_at": None,
+            "total": len(device_ids),
+            "acknowledged": 0,
+            "failed": 0,
+            "devices": {device_id: "pending" for device_id in device_ids}
+        }
+        # Drop the oldest jobs beyond the retention limit
+        for old_job_id in list(shutdown_jobs)[:-MAX_SHUTDOWN_JOBS]:
+            del shutdown_jobs[old_job_id]
+
+    for device_id in device_ids:
+        shutdown_executor.submit(shutdown_device, job_id, device_id)
+
+    return job_id
+
+
+def shutdown_job_summary(job):
+    """Job progress without the per-device map, which can be large for big fleets."""
+    summary = {key: value for key, value in job.items() if key != "devices"}
+    summary["progress"] = int(100 * (job["acknowledged"] + job["failed"]) / job["total"]) if job["total"] else 100
+    return summary
+
+
 @app.route('/emergency_shutdown', methods=['POST'])
 def emergency_shutdown():
     """
     Route to handle emergency shutdown requests.
     This will force all devices to OFF state until manually overridden.
+    The command is dispatched to all controllers in parallel; the returned job_id
+    can be used with /shutdown_status or /shutdown_jobs/<job_id> to follow it.
     """
     data = request.get_json()
     
@@ -353,17 +853,15 @@ def emergency_shutdown():
         return jsonify({"error": "Invalid action type. Expected 'shutdown'"}), 400
     
     # Update emergency status
-    emergency_status["shutdown_active"] = True
-    emergency_status["shutdown_timestamp"] = data["timestamp"]
-    emergency_status["shutdown_by"] = data.get("user", "system")
+    with emergency_lock:
+        emergency_status["shutdown_active"] = True
+        emergency_status["shutdown_timestamp"] = data["timestamp"]
+        emergency_status["shutdown_by"] = data.get("user", "system")
     
-    # Set all devices to OFF for all device IDs
-    for device_id in device_data:
-        for device_name in device_data[device_id]["device_states"]:
-            device_data[device_id]["device_states"][device_name] = "OFF"
-    
-    # Simulate processing time
-    time.sleep(1)
+    # Set all devices to OFF for all device IDs, in parallel
+    job_id = start_shutdown_job(data.get("user", "system"), data["timestamp"])
+    with emergency_lock:
+        emergency_status["shutdown_job_id"] = job_id
     
     # Return success message
     return jsonify({
@@ -371,45 +869,175 @@ def emergency_shutdown():
         "message": "Emergency shutdown initiated successfully",
         "shutdown_active": True,
         "timestamp": datetime.now().isoformat(),
-        "affected_devices": len(device_IDs)
+        "job_id": job_id,
+        "affected_devices": len(device_data)
     }), 200
 
 
+@app.route('/shutdown_jobs/<job_id>', methods=['GET'])
+def shutdown_job(job_id):
+    """
+    Route returning a shutdown job with the acknowledgement state of every device.
+    """
+    with shutdown_jobs_lock:
+        job = shutdown_jobs.get(job_id)
+        if not job:
+            return jsonify({"error": f"Shutdown job {job_id} not found"}), 404
+        job = dict(job, devices=dict(job["devices"]))
+
+    return jsonify(dict(shutdown_job_summary(job), devices=job["devices"])), 200
+
+
 @app.route('/shutdown_status', methods=['GET'])
 def shutdown_status():
     """
     Route to check the current status of an emergency shutdown.
-    Returns detailed information about the shutdown status for frontend polling.
+    Progress is the share of controllers that acknowledged the latest shutdown job,
+    or of the job given with ?job_id=.
     """
-    # Calculate simulated progress if shutdown is active
-    progress = None
-    if emergency_status["shutdown_active"]:
-        # If shutdown was recently initiated, calculate a progress value
-        if emergency_status["shutdown_timestamp"]:
-            try:
-                # Parse the timestamp to calculate elapsed time
-                shutdown_time = datetime.fromisoformat(emergency_status["shutdown_timestamp"].replace('Z', '+00:00'))
-                current_time = datetime.now(shutdown_time.tzinfo)
-                
-                # Simulate progress over 5 seconds
-                elapsed_seconds = (current_time - shutdown_time).total_seconds()
-                if elapsed_seconds < 5:
-                    progress = min(int(elapsed_seconds * 20), 99)  # 20% per second, max 99%
-                else:
-                    progress = 100  # Complete after 5 seconds
-            except:
-                # Default progress if timestamp parsing fails
-                progress = 100
+    with emergency_lock:
+        status = dict(emergency_status)
+
+    job_id = request.args.get("job_id") or status["shutdown_job_id"]
+
+    with shutdown_jobs_lock:
+        job = shutdown_jobs.get(job_id)
+        summary = shutdown_job_summary(job) if job else None
+
+    if request.args.get("job_id") and not summary:
+        return jsonify({"error": f"Shutdown job {job_id} not found"}), 404
+
+    progress = summary["progress"] if status["shutdown_active"] and summary else None
     
     return jsonify({
-        "success": emergency_status["shutdown_active"],
-        "status": "active" if emergency_status["shutdown_active"] else "inactive",
-        "timestamp": emergency_status["shutdown_timestamp"],
-        "initiated_by": emergency_status["shutdown_by"],
+        "success": status["shutdown_active"],
+        "status": "active" if status["shutdown_active"] else "inactive",
+        "timestamp": status["shutdown_timestamp"],
+        "initiated_by": status["shutdown_by"],
         "progress": progress,
-        "message": "Emergency shutdown active - all systems disabled" if emergency_status["shutdown_active"] 
+        "job": summary,
+        "message": "Emergency shutdown active - all systems disabled" if status["shutdown_active"] 
                 else "Normal operation - no emergency shutdown in effect"
     }), 200
 
+def check_device_invariants(device_id):
+    """
+    Problems with one device's state, [] when consistent: the manual masks must match the
+    per-appliance manual dicts, and manually controlled appliances must be in their manual
+    state. Takes the device's lock, so it only sees states between whole updates.
+    """
+    problems = []
+    with device_locks[device_id]:
+        device = device_data[device_id]
+        manual_mask = manual_on_mask = 0
+        for appliance, bit in APPLIANCE_BITS.items():
+            if device["manual_control"][appliance]:
+                manual_mask |= bit
+                if device["manual_states"][appliance] == "ON":
+                    manual_on_mask |= bit
+                if not emergency_status["shutdown_active"] and device["device_states"][appliance] != device["manual_states"][appliance]:
+                    problems.append(f"{device_id} {appliance} is {device['device_states'][appliance]} under manual {device['manual_states'][appliance]}")
+        if manual_mask != device["manual_mask"]:
+            problems.append(f"{device_id} manual_mask {device['manual_mask']:06b} != {manual_mask:06b}")
+        if manual_on_mask != device["manual_on_mask"]:
+            problems.append(f"{device_id} manual_on_mask {device['manual_on_mask']:06b} != {manual_on_mask:06b}")
+    return problems
+
+
+def stress_test(seconds=5.0, controllers=3, readers=4):
+    """
+    Hammer /control_devices and /get_simulated_data from threads and check the device
+    state stays consistent: invariants hold throughout, no reading is lost or duplicated,
+    and every appliance ends in the state of the last command sent for it. Each
+    controller thread owns a disjoint set of appliances, so "last" is well defined.
+    Returns the list of problems found.
+    """
+    global READING_INTERVAL
+    READING_INTERVAL = 0  # Every read advances the simulation
+    owned = [APPLIANCES[n::controllers] for n in range(controllers)]
+    deadline = time.monotonic() + seconds
+    last_commands = {}  # (device_ID, appliance) -> action of the last command applied
+    sequences = []
+    problems = []
+    counts = {"commands": 0, "readings": 0, "checks": 0}
+    counts_lock = threading.Lock()
+    start_sequence = {device_id: device_data[device_id]["sequence"] for device_id in device_data}
+
+    def control(appliances):
+        client = app.test_client()
+        rng = random.Random()
+        sent = 0
+        while time.monotonic() < deadline:
+            commands = [
+                {"device_ID": rng.choice(list(device_data)), "device_name": rng.choice(appliances),
+                 "control_action": rng.choice(("ON", "OFF", "AUTO"))}
+                for _ in range(rng.randint(1, 4))
+            ]
+            response = client.post("/control_devices", json={"commands": commands})
+            if response.status_code != 200 or response.get_json()["failed"]:
+                problems.append(f"/control_devices failed: {response.get_json()}")
+                return
+            for command in commands:  # Coalescing applies the last command per appliance
+                last_commands[(command["device_ID"], command["device_name"])] = command["control_action"]
+            sent += len(commands)
+        with counts_lock:
+            counts["commands"] += sent
+
+    def read():
+        client = app.test_client()
+        seen = []
+        while time.monotonic() < deadline:
+            reading = client.get("/get_simulated_data").get_json()
+            seen.append((reading["device_ID"], reading["sequence"]))
+        with counts_lock:
+            sequences.extend(seen)
+            counts["readings"] += len(seen)
+
+    def check():
+        checks = 0
+        while time.monotonic() < deadline:
+            for device_id in device_data:
+                problems.extend(check_device_invariants(device_id))
+            checks += 1
+        counts["checks"] = checks
+
+    threads = [threading.Thread(target=control, args=(appliances,)) for appliances in owned]
+    threads += [threading.Thread(target=read) for _ in range(readers)]
+    threads.append(threading.Thread(target=check))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Every read advanced its device once: sequences are unique and none went missing
+    if len(set(sequences)) != len(sequences):
+        problems.append(f"{len(sequences) - len(set(sequences))} readings share a sequence number")
+    for device_id in device_data:
+        advanced = device_data[device_id]["sequence"] - start_sequence[device_id]
+        read_count = sum(1 for reading_device, _ in sequences if reading_device == device_id)
+        if advanced != read_count:
+            problems.append(f"{device_id} advanced {advanced} times for {read_count} readings")
+
+    # The last command for each appliance is the one in effect
+    for (device_id, appliance), action in last_commands.items():
+        device = device_data[device_id]
+        manual = action != "AUTO"
+        if device["manual_control"][appliance] != manual or (manual and device["manual_states"][appliance] != action):
+            problems.append(f"{device_id} {appliance} lost its last command {action}")
+    for device_id in device_data:
+        problems.extend(check_device_invariants(device_id))
+
+    print(f"{counts['commands']} commands, {counts['readings']} readings and {counts['checks']} "
+          f"invariant sweeps from {len(threads)} threads in {seconds:.0f} s")
+    return problems
+
+
 if __name__ == '__main__':
+    # python micro_control/app.py --stress runs the concurrency check instead of the server
+    if "--stress" in sys.argv:
+        found = stress_test()
+        for problem in found[:20]:
+            print(f"❌ {problem}")
+        print("✅ Device state stayed consistent" if not found else f"❌ {len(found)} problems")
+        sys.exit(1 if found else 0)
     app.run(port=5002, debug=True)
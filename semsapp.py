@@ -4,14 +4,21 @@ from flask_login import LoginManager, login_user, login_required, logout_user, c
 import time
 import random
 import mimetypes
-from main import create_app, socketio, db  # Ensure db is imported
+from main import create_app, socketio, db, journal, ingest_workers, password_hasher  # Ensure db is imported
 from secretconfig import SECRET_KEY
 from main.models import User
-import requests  # For forwarding registration data
-from werkzeug.security import generate_password_hash
+from main.user_cache import load_cached_user
+from main.passwords import PasswordPoolBusy
+from main.socket_auth import socket_identities, socket_identity, issue_socket_token, verify_socket_token
+from main.sockets import user_room, device_rooms, latest_aggregated_data, initial_dashboard_state
+from main.wire import ENCODINGS
+from main.reading_stream import start_reading_stream
 
 app = create_app()
 app.config['SECRET_KEY'] = SECRET_KEY
+ingest_workers.start()  # No-op unless SEMS_INGEST_WORKERS is set; forks, so it goes first
+start_reading_stream(app)  # No-op unless SEMS_STREAM_DEVICE_IDS is set
+journal.start_loader()  # No-op unless SEMS_JOURNAL_DIR is set
 
 mimetypes.add_type('text/css', '.css')
 mimetypes.add_type('text/javascript', '.js')
@@ -26,7 +33,7 @@ login_manager.login_view = 'login'
 
 @login_manager.user_loader
 def load_user(user_id):
-    return db.session.get(User, int(user_id))
+    return load_cached_user(user_id)
 
 
 # ///////////////////////////////////////////// Authentication Routes //////////////////////////////////////////////////
@@ -45,7 +52,12 @@ def login():
 
         user = User.query.filter_by(username=username).first()
 
-        if user and user.check_password(password):
+        try:
+            valid = user is not None and password_hasher.verify(user.password, password)
+        except PasswordPoolBusy:
+            return "Too many sign-ins right now, please try again shortly", 503, {"Retry-After": "5"}
+
+        if valid:
             login_user(user)
             session['device_id'] = user.device_id  # Store device ID in session
             session['user_id'] = user.id  # Store user ID in session
@@ -68,8 +80,8 @@ def register():
         return jsonify({"error": "Missing required fields"}), 400
 
     try:
-        # Hash the password before saving
-        hashed_password = generate_password_hash(password)
+        # Hash the password before saving, in the password pool
+        hashed_password = password_hasher.hash(password)
 
         # Create new user instance
         new_user = User(device_id=device_id, email=email, username=username, password=hashed_password)
@@ -80,6 +92,9 @@ def register():
 
         return redirect(url_for('login'))  # Redirect to login page after successful registration
 
+    except PasswordPoolBusy:
+        return jsonify({"error": "Too many registrations right now, please try again shortly"}), 503, {"Retry-After": "5"}
+
     except Exception as e:
         db.session.rollback()  # Rollback if there’s an error
         print("Database error:", str(e))
@@ -105,37 +120,73 @@ def logout():
 @app.route('/home')
 @login_required
 def home():
-    return render_template('semsindex.html', user=current_user, mimetype='text/javascript')
+    # Tabs only drive ingest themselves when the device isn't read from the simulator stream
+    poll_ingest = current_user.device_id not in app.config['STREAM_DEVICE_IDS']
+    return render_template(
+        'semsindex.html',
+        user=current_user,
+        poll_ingest=poll_ingest,
+        socket_token=issue_socket_token(current_user),
+        initial_state=initial_dashboard_state(current_user.device_id),  # First paint without a fetch
+        mimetype='text/javascript'
+    )
+
+
+@app.route('/socket_token')
+@login_required
+def socket_token():
+    # Fresh token for a dashboard whose socket reconnects after the first one expired
+    return jsonify({"token": issue_socket_token(current_user)})
 
 
 # ///////////////////////////////////////////// WebSocket Handling //////////////////////////////////////////////////
 
 @socketio.on('connect')
-def handle_connect():
-    if not current_user.is_authenticated:
-        disconnect()
-        return
-    
-    user_room = f"user_{current_user.id}"
-    join_room(user_room)  # Add user to their room
-    print(f"✅ {current_user.username} joined room: {user_room}")
+def handle_connect(auth=None):
+    # Identify the socket from its signed token (io({auth: {token}})) - no session or DB lookup
+    identity = verify_socket_token((auth or {}).get('token'))
+    if identity is None:
+        return False  # Rejects the connection; the client fetches a new token and retries
+    socket_identities[request.sid] = identity
+
+    # Wire encoding is negotiated once, from the handshake query (io({query: {encoding: 'packed'}}))
+    encoding = request.args.get('encoding', 'json')
+    if encoding not in ENCODINGS:
+        encoding = 'json'
 
-    emit('server_response', {'data': f'Welcome {current_user.username}, connected to server'}, room=user_room)
+    room = user_room(identity['user_id'])
+    join_room(room)  # Add user to their room
+    join_room(device_rooms(identity['device_id'])[encoding])  # Readings, logs and aggregates of their device
+    print(f"✅ {identity['username']} joined room: {room}")
+
+    # Aggregates are only sent when the ranking changes, so hand the current one to new clients
+    aggregated = latest_aggregated_data(identity['device_id'])
+    if aggregated:
+        emit('aggregated_consumption_update', aggregated)
+
+    emit('server_response', {'data': f"Welcome {identity['username']}, connected to server"}, room=room)
+
+
+@socketio.on('disconnect')
+def handle_disconnect():
+    socket_identities.pop(request.sid, None)
 
 
 @socketio.on('client_message')
 def handle_client_message(message):
-    device_id = session.get('device_id')
-    if not current_user.is_authenticated:
+    identity = socket_identity()
+    if identity is None:
         disconnect()
         return
-    print(f'{current_user.username} sent: {message["data"]}')
-    emit('server_response', {'data': f"{current_user.username} {device_id}sent: {message['data']} at {time.strftime('%H:%M:%S')}"})
+    print(f"{identity['username']} sent: {message['data']}")
+    emit('server_response', {'data': f"{identity['username']} {identity['device_id']}sent: {message['data']} at {time.strftime('%H:%M:%S')}"})
 
 
 @socketio.on('request_data')
-@login_required  # Ensures only logged-in users get updates
 def handle_data_request():
+    if socket_identity() is None:  # Only authenticated sockets get updates
+        disconnect()
+        return
     new_data = {
         'timestamp': time.strftime('%H:%M:%S'),
         'value': random.randint(1, 100),
@@ -145,4 +196,5 @@ def handle_data_request():
 
 
 if __name__ == '__main__':
+    password_hasher.start()  # Fork the hashing processes before the server starts threads
     socketio.run(app, debug=True, port=8500)
@@ -0,0 +1,213 @@
+"""
+ASGI entry point with async versions of the controller proxy endpoints.
+
+    uvicorn semsasgi:app --port 8500
+
+The device control (single and batch) and emergency shutdown endpoints are served here on an
+event loop with one pooled httpx.AsyncClient, so slow controllers no longer hold a worker
+each. Every other request (pages, ingest, the Socket.IO polling transport) is handed to the
+Flask app unchanged. Socket.IO websockets need the eventlet server (semsapp.py) - run it
+next to this one and route /socket.io/ to it at the load balancer.
+
+Background work started here (shutdown progress tracking, the RoomEmitter's flush loop)
+runs in threads: Socket.IO is set to async_mode='threading', because under uvicorn no
+eventlet hub would ever schedule greenthreads. Dashboard clients are connected to the
+eventlet server, so emits from this process only reach them through
+SEMS_SOCKETIO_MESSAGE_QUEUE, which must be set for both servers.
+
+Requires httpx and asgiref.
+"""
+import asyncio
+import json
+import os
+
+os.environ.setdefault('SEMS_SOCKETIO_ASYNC_MODE', 'threading')  # Before semsapp builds the app
+
+import httpx
+from asgiref.wsgi import WsgiToAsgi
+from flask import session
+
+from semsapp import app as flask_app
+from main import socketio
+from main.sockets import (
+    SIMULATOR_API_URL,
+    track_shutdown_job,
+    validate_control_request,
+    prepare_batch_control_request,
+    validate_shutdown_request,
+    shutdown_acknowledgement,
+    map_shutdown_status,
+)
+
+# Outbound pool shared by all requests; sized for many simultaneous control commands
+SIMULATOR_LIMITS = httpx.Limits(max_connections=200, max_keepalive_connections=50)
+SIMULATOR_TIMEOUT = httpx.Timeout(10.0)
+
+wsgi_app = WsgiToAsgi(flask_app)
+simulator_client = None
+
+if not flask_app.config['SOCKETIO_MESSAGE_QUEUE']:
+    print("⚠️ SEMS_SOCKETIO_MESSAGE_QUEUE is not set: shutdown progress and dashboard updates "
+          "from the ASGI process will not reach any client")
+
+
+async def send_json(send, payload, status=200):
+    body = json.dumps(payload).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def read_json(receive):
+    """Read the request body and parse it as JSON, None when empty or invalid."""
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+    try:
+        return json.loads(body) if body else None
+    except ValueError:
+        return None
+
+
+def session_value(scope, key):
+    """Read a value from the caller's Flask session (blocking, run in a thread)."""
+    cookie = dict(scope["headers"]).get(b"cookie", b"").decode("latin-1")
+    with flask_app.test_request_context(scope["path"], headers={"Cookie": cookie}):
+        return session.get(key)
+
+
+async def proxy_device_control(scope, receive, send):
+    """Async version of main.sockets.proxy_device_control."""
+    data = await read_json(receive)
+    if not data:
+        return await send_json(send, {"error": "No data provided"}, 400)
+
+    # Get device_ID from session if not provided
+    if "device_ID" not in data:
+        device_id = await asyncio.to_thread(session_value, scope, "device_id")
+        if device_id:
+            data["device_ID"] = device_id
+
+    error = validate_control_request(data)
+    if error:
+        return await send_json(send, *error)
+
+    try:
+        response = await simulator_client.post(f"{SIMULATOR_API_URL}/control_device", json=data)
+        return await send_json(send, response.json(), response.status_code)
+    except httpx.HTTPError as e:
+        return await send_json(send, {"error": f"Failed to connect to simulator API: {str(e)}"}, 500)
+    except Exception as e:
+        return await send_json(send, {"error": f"An error occurred: {str(e)}"}, 500)
+
+
+async def proxy_batch_device_control(scope, receive, send):
+    """Async version of main.sockets.proxy_batch_device_control."""
+    data = await read_json(receive)
+    if not data:
+        return await send_json(send, {"error": "No data provided"}, 400)
+
+    device_id = await asyncio.to_thread(session_value, scope, "device_id")
+    error = prepare_batch_control_request(data, device_id)
+    if error:
+        return await send_json(send, *error)
+
+    try:
+        response = await simulator_client.post(f"{SIMULATOR_API_URL}/control_devices", json=data)
+        return await send_json(send, response.json(), response.status_code)
+    except httpx.HTTPError as e:
+        return await send_json(send, {"error": f"Failed to connect to simulator API: {str(e)}"}, 500)
+    except Exception as e:
+        return await send_json(send, {"error": f"An error occurred: {str(e)}"}, 500)
+
+
+async def emergency_shutdown(scope, receive, send):
+    """Async version of main.sockets.emergency_shutdown."""
+    data = await read_json(receive)
+    if not data:
+        return await send_json(send, {"error": "No data provided"}, 400)
+
+    error = validate_shutdown_request(data)
+    if error:
+        return await send_json(send, *error)
+
+    try:
+        response = await simulator_client.post(f"{SIMULATOR_API_URL}/emergency_shutdown", json=data)
+        if response.status_code == 200:
+            # Progress is pushed to the user's rooms by the same tracker the Flask endpoint uses
+            job_id = response.json().get("job_id")
+            if job_id:
+                user_id = await asyncio.to_thread(session_value, scope, "user_id")
+                socketio.start_background_task(track_shutdown_job, job_id, user_id)
+            return await send_json(send, shutdown_acknowledgement(job_id), 200)
+        return await send_json(send, response.json(), response.status_code)
+    except httpx.HTTPError as e:
+        return await send_json(send, {
+            "status": "error",
+            "message": f"Failed to connect to control system: {str(e)}"
+        }, 500)
+    except Exception as e:
+        return await send_json(send, {"status": "error", "message": f"An error occurred: {str(e)}"}, 500)
+
+
+async def check_shutdown_status(scope, receive, send):
+    """Async version of main.sockets.check_shutdown_status."""
+    try:
+        response = await simulator_client.get(f"{SIMULATOR_API_URL}/shutdown_status")
+        if response.status_code == 200:
+            return await send_json(send, map_shutdown_status(response.json()), 200)
+        return await send_json(send, response.json(), response.status_code)
+    except httpx.HTTPError as e:
+        return await send_json(send, {
+            "status": "failed",
+            "message": f"Failed to connect to control system: {str(e)}"
+        }, 500)
+    except Exception as e:
+        return await send_json(send, {"status": "failed", "message": f"An error occurred: {str(e)}"}, 500)
+
+
+# (method, path) -> handler; paths match the blueprint routes under /sems_in
+ASYNC_ROUTES = {
+    ("POST", "/sems_in/proxy_device_control"): proxy_device_control,
+    ("POST", "/sems_in/proxy_device_control/batch"): proxy_batch_device_control,
+    ("POST", "/sems_in/api/emergency-shutdown"): emergency_shutdown,
+    ("GET", "/sems_in/api/emergency-shutdown/status"): check_shutdown_status,
+}
+
+
+async def lifespan(receive, send):
+    global simulator_client
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            simulator_client = httpx.AsyncClient(limits=SIMULATOR_LIMITS, timeout=SIMULATOR_TIMEOUT)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await simulator_client.aclose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+
+    if scope["type"] == "http":
+        handler = ASYNC_ROUTES.get((scope["method"], scope["path"]))
+        if handler:
+            return await handler(scope, receive, send)
+        return await wsgi_app(scope, receive, send)
+
+    # Websockets are not served here, Socket.IO clients fall back to long-polling
+    if scope["type"] == "websocket":
+        await send({"type": "websocket.close"})
@@ -0,0 +1,18 @@
+import pytest
+from flask import Flask
+
+from main import db
+
+
+@pytest.fixture
+def logs_app(tmp_path):
+    """Bare app with only the logs bind, in a temporary SQLite file."""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_BINDS'] = {'logs': f"sqlite:///{tmp_path / 'logs.db'}"}
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['EVENT_RETENTION_DAYS'] = 90
+    db.init_app(app)
+    with app.app_context():
+        db.create_all(bind='logs')
+        yield app
+        db.session.remove()
@@ -0,0 +1,80 @@
+import random
+
+from main.anomaly import AnomalyDetector, _simulate
+
+T0 = 1_700_000_000
+
+
+def replay(detector, device, ticks, rng, fail_at=None, failure=None, interval=3):
+    """Feed `ticks` simulator steps of one device; returns the alert kinds per tick."""
+    raised = []
+    for tick in range(ticks):
+        _simulate(device, rng)
+        solar = device["solar"]
+        if fail_at is not None and tick >= fail_at:
+            if failure == 'solar_drop':
+                solar = max(10, solar * 0.2)
+            else:
+                device["battery"] = max(10, device["battery"] - rng.randint(10, 20))
+        load_kw = rng.choice((0.0, 0.015, 0.04))
+        for alert in detector.update("dev", device["battery"], solar, load_kw, now=T0 + tick * interval):
+            raised.append((tick, alert["kind"]))
+    return raised
+
+
+def test_healthy_devices_raise_nothing():
+    rng = random.Random(1)
+    for _ in range(100):
+        detector = AnomalyDetector()
+        device = {"solar": rng.randint(10, 1000), "battery": rng.randint(10, 1000), "direction": 0}
+        assert replay(detector, device, 300, rng) == []
+
+
+def test_panel_failure_is_detected():
+    rng = random.Random(2)
+    for _ in range(20):
+        detector = AnomalyDetector()
+        device = {"solar": rng.randint(300, 1000), "battery": rng.randint(10, 1000), "direction": 0}
+        raised = replay(detector, device, 250, rng, fail_at=200, failure='solar_drop')
+        assert raised and all(tick >= 200 and kind == 'solar_drop' for tick, kind in raised)
+
+
+def test_battery_failure_is_detected():
+    rng = random.Random(3)
+    for _ in range(20):
+        detector = AnomalyDetector()
+        solar = rng.randint(600, 1000)
+        device = {"solar": solar, "battery": solar - rng.randint(0, 100), "direction": 0}
+        raised = replay(detector, device, 250, rng, fail_at=200, failure='battery_drain')
+        assert raised and all(tick >= 200 and kind == 'battery_drain' for tick, kind in raised)
+
+
+def test_readings_close_together_are_not_drain():
+    detector = AnomalyDetector()
+    battery = 900
+    for n in range(60):
+        detector.update("dev", battery, 500, now=T0 + n * 3)
+        battery -= n % 2
+    # An ordinary 3-unit step 50 ms after the last reading, then the next regular one
+    assert detector.update("dev", battery - 3, 500, now=T0 + 59 * 3 + 0.05) == []
+    assert detector.update("dev", battery - 4, 500, now=T0 + 60 * 3) == []
+
+
+def test_alerts_go_to_listeners_once_per_cooldown():
+    detector = AnomalyDetector(cooldown=300)
+    received = []
+    detector.on_alert(lambda device_id, alert: received.append((device_id, alert["kind"])))
+    for n in range(40):
+        detector.update("dev", 500, 800 + (n % 3), now=T0 + n * 3)
+
+    detector.update("dev", 500, 100, now=T0 + 40 * 3)
+    detector.update("dev", 500, 100, now=T0 + 41 * 3)
+    assert received == [("dev", "solar_drop")]
+    assert detector.stats["suppressed"] == 1
+
+
+def test_disabled_detector_keeps_no_state():
+    detector = AnomalyDetector()
+    detector.enabled = False
+    assert detector.update("dev", 500, 100) == []
+    assert detector.slots == {}
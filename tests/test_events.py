@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+
+from main import events
+from main.events import LOG_ENTRIES, appliance_usage, on_time, prune_events, recent_logs, record_state_changes
+
+START = (datetime.utcnow() - timedelta(days=1)).replace(second=0, microsecond=0)  # Inside the retention
+
+
+def at(minutes):
+    return START + timedelta(minutes=minutes)
+
+
+def stamp(minutes):
+    return at(minutes).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def test_recent_logs_group_changes_per_reading(logs_app):
+    record_state_changes("78u001y", [("tv", "ON"), ("bed_light", "OFF")], at(0))
+    record_state_changes("78u001y", [("tv", "OFF")], at(5))
+    record_state_changes("78u001x", [("tv", "ON")], at(6))
+
+    assert recent_logs("78u001y") == [
+        {"timestamp": stamp(5), "changes": "tv turned OFF"},
+        {"timestamp": stamp(0), "changes": "tv turned ON\nbed_light turned OFF"},
+    ]
+
+
+def test_recent_logs_are_limited(logs_app):
+    for minute in range(LOG_ENTRIES + 5):
+        record_state_changes("78u001y", [("tv", "ON" if minute % 2 else "OFF")], at(minute))
+
+    logs = recent_logs("78u001y")
+    assert len(logs) == LOG_ENTRIES
+    assert logs[0]["timestamp"] == stamp(LOG_ENTRIES + 4)
+
+
+def test_unknown_appliances_and_states_are_ignored(logs_app):
+    assert record_state_changes("78u001y", [("fridge", "ON"), ("tv", "STANDBY")], at(0)) == 0
+    assert recent_logs("78u001y") == []
+
+
+def test_on_time_within_window(logs_app):
+    record_state_changes("78u001y", [("tv", "ON")], at(10))
+    record_state_changes("78u001y", [("tv", "OFF")], at(40))
+    record_state_changes("78u001y", [("tv", "ON")], at(50))
+
+    seconds = on_time("78u001y", at(0), at(60))
+    assert seconds["tv"] == 40 * 60  # 10-40, then 50 to the end of the window
+    assert seconds["kitchen_light"] == 0
+
+
+def test_on_time_counts_state_before_window(logs_app):
+    record_state_changes("78u001y", [("kitchen_light", "ON")], at(-30))
+    record_state_changes("78u001y", [("kitchen_light", "OFF")], at(15))
+
+    assert on_time("78u001y", at(0), at(60))["kitchen_light"] == 15 * 60
+
+
+def test_appliance_usage(logs_app):
+    record_state_changes("78u001y", [("tv", "ON")], at(0))
+    record_state_changes("78u001y", [("tv", "OFF")], at(20))
+
+    usage = appliance_usage("78u001y", at(0), at(60))
+    assert usage["tv"] == {"toggles": 2, "on_seconds": 20 * 60}
+    assert usage["sound_system"] == {"toggles": 0, "on_seconds": 0}
+
+
+def test_prune_deletes_only_old_events(logs_app, monkeypatch):
+    monkeypatch.setitem(events.last_pruned, "78u001y", float('inf'))  # No automatic pruning while inserting
+    now = datetime.utcnow()
+    record_state_changes("78u001y", [("tv", "ON")], now - timedelta(days=100))
+    record_state_changes("78u001y", [("tv", "OFF")], now - timedelta(days=1))
+
+    assert prune_events(days=90) == 1
+    assert prune_events(days=0) == 0
+    assert [log["changes"] for log in recent_logs("78u001y")] == ["tv turned OFF"]
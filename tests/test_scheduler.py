@@ -0,0 +1,73 @@
+import math
+import random
+from array import array
+
+import pytest
+
+from main import scheduler
+from main.scheduler import SolarScheduler
+
+RATINGS = {"sound_system": 0.015, "tv": 0.04}
+
+
+def profiles(count, slots=70, seed=1):
+    rng = random.Random(seed)
+    result = []
+    for _ in range(count):
+        shift = rng.randint(-8, 8)
+        result.append(array('d', (
+            10 + 990 * math.exp(-((slot + 1 - 35 - shift) / 12) ** 2) + rng.uniform(-20, 20)
+            for slot in range(slots)
+        )))
+    return result
+
+
+def test_numpy_and_python_agree(monkeypatch):
+    numpy = pytest.importorskip("numpy")
+    solar = SolarScheduler(power_ratings=RATINGS)
+    batch = profiles(300)
+
+    monkeypatch.setattr(scheduler, 'np', numpy)
+    vectorized = solar.compute(batch)
+    monkeypatch.setattr(scheduler, 'np', None)
+    assert solar.compute(batch) == vectorized
+
+
+def test_windows_cover_the_sunniest_counters():
+    solar = SolarScheduler(power_ratings=RATINGS, slots=10, durations={"tv": 3})
+    profile = array('d', [0, 0, 0, 0, 5, 9, 9, 1, 0, 0])
+    assert solar.compute([profile]) == [{"tv": [[5, 7]]}]
+
+
+def test_windows_wrap_past_the_last_counter():
+    solar = SolarScheduler(power_ratings=RATINGS, slots=10, durations={"tv": 3})
+    profile = array('d', [9, 1, 0, 0, 0, 0, 0, 0, 0, 9])
+    assert solar.compute([profile]) == [{"tv": [[10, 2]]}]
+
+
+def test_schedules_wait_for_a_complete_profile():
+    solar = SolarScheduler(power_ratings=RATINGS, slots=4, durations={"tv": 2}, interval=float('inf'))
+    pushed = []
+    solar.on_schedule(pushed.append)
+    for counter, output in ((1, 100), (2, 900), (3, 800)):
+        solar.observe("dev", counter, output)
+    assert solar.run_pass() == {}
+
+    solar.observe("dev", 4, 50)
+    assert solar.run_pass() == {"dev": {"tv": [[2, 3]]}}
+    assert pushed == [{"dev": {"tv": [[2, 3]]}}]
+    assert solar.run_pass() == {}  # Nothing new since the last pass
+
+
+def test_failed_push_is_retried():
+    solar = SolarScheduler(power_ratings=RATINGS, slots=2, durations={"tv": 1}, interval=float('inf'))
+
+    @solar.on_schedule
+    def push(schedules):
+        raise ConnectionError("controller down")
+
+    solar.observe("dev", 1, 10)
+    solar.observe("dev", 2, 20)
+    solar.run_pass()
+    assert solar.schedule_for("dev") is None
+    assert solar.stale_devices() == ["dev"]
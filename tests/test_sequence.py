@@ -0,0 +1,68 @@
+from flask import Flask
+
+from main.sequence import SequenceTracker
+
+
+def reading(sequence, boot_id="boot-1", device_id="78u001y"):
+    return {"device_ID": device_id, "boot_id": boot_id, "sequence": sequence}
+
+
+def test_accepts_new_and_skips_duplicates():
+    tracker = SequenceTracker()
+    assert tracker.accept(reading(1))
+    assert tracker.accept(reading(2))
+    assert not tracker.accept(reading(2))
+    assert not tracker.accept(reading(1))
+    assert tracker.stats == {"accepted": 2, "duplicates": 2}
+
+
+def test_devices_are_tracked_separately():
+    tracker = SequenceTracker()
+    assert tracker.accept(reading(5))
+    assert tracker.accept(reading(1, device_id="78u001x"))
+
+
+def test_reboot_starts_a_new_sequence():
+    tracker = SequenceTracker()
+    assert tracker.accept(reading(40))
+    assert tracker.accept(reading(1, boot_id="boot-2"))
+    assert not tracker.accept(reading(1, boot_id="boot-2"))
+
+
+def test_readings_without_sequence_are_accepted():
+    tracker = SequenceTracker()
+    data = {"device_ID": "78u001y"}
+    assert tracker.accept(data)
+    assert tracker.accept(data)
+
+
+def test_release_lets_the_retry_in():
+    tracker = SequenceTracker()
+    assert tracker.accept(reading(1))
+    assert tracker.accept(reading(2))
+    tracker.release(reading(2))
+    assert tracker.marks["78u001y"] == ["boot-1", 1]
+    assert tracker.accept(reading(2))
+    assert not tracker.accept(reading(2))
+
+
+def test_release_keeps_a_newer_mark():
+    tracker = SequenceTracker()
+    tracker.accept(reading(1))
+    tracker.accept(reading(2))
+    tracker.release(reading(1))
+    assert tracker.marks["78u001y"] == ["boot-1", 2]
+
+
+def test_checkpoint_survives_restart(tmp_path):
+    app = Flask(__name__)
+    app.config['SEQUENCE_CHECKPOINT_FILE'] = str(tmp_path / "marks.json")
+    tracker = SequenceTracker()
+    tracker.init_app(app)
+    tracker.accept(reading(7))
+    tracker.checkpoint()
+
+    restarted = SequenceTracker()
+    restarted.init_app(app)
+    assert not restarted.accept(reading(7))
+    assert restarted.accept(reading(8))
@@ -0,0 +1,34 @@
+import zlib
+
+from flask import Flask
+
+from main.shards import realtime_binds, shard_bind, shard_index
+
+
+def test_index_is_stable_and_in_range():
+    for count in (1, 2, 3, 8):
+        for device_id in ("78u001y", "78u001x", "65w789x", "aa00001"):
+            index = shard_index(device_id, count)
+            assert 0 <= index < count
+            assert index == zlib.crc32(device_id.encode()) % count
+
+
+def test_devices_spread_over_shards():
+    indexes = {shard_index(f"dev{n:05d}", 4) for n in range(200)}
+    assert indexes == {0, 1, 2, 3}
+
+
+def test_binds():
+    assert realtime_binds(1) == {'realtime': 'sqlite:///realtime_data.db'}
+    assert list(realtime_binds(3)) == ['realtime_0', 'realtime_1', 'realtime_2']
+
+
+def test_device_routing():
+    app = Flask(__name__)
+    app.config['REALTIME_SHARDS'] = 1
+    with app.app_context():
+        assert shard_bind("78u001y") == 'realtime'
+
+    app.config['REALTIME_SHARDS'] = 4
+    with app.app_context():
+        assert shard_bind("78u001y") == f"realtime_{shard_index('78u001y', 4)}"
@@ -0,0 +1,27 @@
+from main.sockets import DAY_CHART_POINTS, downsample
+
+
+def points(count):
+    return [
+        {"timestamp": f"t{n}", "battery_level": float(n), "solar_output": float(2 * n)}
+        for n in range(count)
+    ]
+
+
+def test_short_series_is_unchanged():
+    series = points(DAY_CHART_POINTS)
+    assert downsample(series) is series
+
+
+def test_runs_are_averaged():
+    averaged = downsample(points(10), limit=5)
+    assert len(averaged) == 5
+    assert averaged[0] == {"timestamp": "t1", "battery_level": 0.5, "solar_output": 1.0}
+    assert averaged[-1] == {"timestamp": "t9", "battery_level": 8.5, "solar_output": 17.0}
+
+
+def test_uneven_series_stays_within_limit():
+    series = points(1001)
+    averaged = downsample(series)
+    assert len(averaged) <= DAY_CHART_POINTS
+    assert averaged[-1]["timestamp"] == series[-1]["timestamp"]
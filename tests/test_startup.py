@@ -0,0 +1,34 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, multiprocessing, sys, time
+start = time.perf_counter()
+import semsapp
+imported = time.perf_counter() - start
+print(json.dumps({
+    "import": imported,
+    "children": len(multiprocessing.active_children()),
+    "modules": [name for name in ("celery",) if name in sys.modules],
+}))
+"""
+
+IMPORT_BUDGET = 5.0  # seconds; about 1 s on a developer machine
+
+
+def test_import_is_lazy(tmp_path):
+    # A fresh interpreter, run outside the tree so Flask-Session's files land in tmp_path
+    environment = dict(os.environ, SEMS_SCHEMA_AUTO_CREATE='0', PYTHONPATH=ROOT)
+    result = subprocess.run(
+        [sys.executable, '-c', PROBE], cwd=tmp_path, env=environment,
+        capture_output=True, text=True, timeout=60, check=True
+    )
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+
+    assert probe["children"] == 0, "importing the app must not fork the password pool or workers"
+    assert probe["modules"] == [], "Celery is only set up when main.celery is used"
+    assert probe["import"] < IMPORT_BUDGET
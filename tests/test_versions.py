@@ -0,0 +1,61 @@
+import pytest
+from flask import Flask
+
+from main import versions
+from main.versions import bump_version, versioned_response
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setattr(versions, 'write_versions', {})
+    app = Flask(__name__)
+    app.config['READ_ETAGS'] = True
+    return app
+
+
+def read(app, etag=None):
+    built = []
+
+    def build():
+        built.append(True)
+        return {"logs": []}, 200
+
+    headers = {'If-None-Match': etag} if etag else {}
+    with app.test_request_context(headers=headers):
+        response = app.make_response(versioned_response("78u001y", ('logs',), build))
+    return response, bool(built)
+
+
+def test_current_client_gets_304_without_building(app):
+    response, built = read(app)
+    assert response.status_code == 200 and built
+    etag = response.headers['ETag']
+    assert etag.startswith('W/')
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+
+    response, built = read(app, etag)
+    assert response.status_code == 304 and not built
+    assert response.headers['ETag'] == etag
+
+
+def test_write_changes_the_etag(app):
+    etag = read(app)[0].headers['ETag']
+    bump_version("78u001y", 'logs')
+
+    response, built = read(app, etag)
+    assert response.status_code == 200 and built
+    assert response.headers['ETag'] != etag
+
+
+def test_other_devices_writes_keep_the_etag(app):
+    etag = read(app)[0].headers['ETag']
+    bump_version("78u001x", 'logs')
+    bump_version("78u001y", 'realtime')
+    assert read(app, etag)[0].status_code == 304
+
+
+def test_disabled_etags(app):
+    app.config['READ_ETAGS'] = False
+    response, built = read(app, '*')
+    assert response.status_code == 200 and built
+    assert 'ETag' not in response.headers
@@ -0,0 +1,46 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from main.wire import SNAPSHOT_STRUCT, WIRE_APPLIANCES, pack_snapshot, unpack_snapshot
+
+
+def make_record(**overrides):
+    fields = dict(
+        timestamp=datetime(2026, 5, 1, 12, 30, 15),
+        battery_level=734,
+        solar_output=912,
+        **{f"{appliance}_state": "ON" if i % 2 else "OFF" for i, appliance in enumerate(WIRE_APPLIANCES)},
+        **{f"{appliance}_consumption": 0.25 * (i + 1) for i, appliance in enumerate(WIRE_APPLIANCES)},
+    )
+    fields.update(overrides)
+    return SimpleNamespace(**fields)
+
+
+def test_round_trip():
+    record = make_record()
+    packed = pack_snapshot(record)
+    assert len(packed) == SNAPSHOT_STRUCT.size == 38
+
+    snapshot = unpack_snapshot(packed)
+    assert snapshot["timestamp"] == "2026-05-01 12:30:15"
+    assert snapshot["battery_level"] == 734
+    assert snapshot["solar_output"] == 912
+    for i, appliance in enumerate(WIRE_APPLIANCES):
+        assert snapshot["devices"][appliance] == {
+            "state": "ON" if i % 2 else "OFF",
+            "consumption": 0.25 * (i + 1),  # Exact in float32
+        }
+
+
+def test_missing_consumption_packs_as_zero():
+    snapshot = unpack_snapshot(pack_snapshot(make_record(tv_consumption=None)))
+    assert snapshot["devices"]["tv"]["consumption"] == 0.0
+
+
+def test_unknown_version_is_rejected():
+    packed = bytearray(pack_snapshot(make_record()))
+    packed[0] = 99
+    with pytest.raises(ValueError):
+        unpack_snapshot(bytes(packed))